@@ -2,25 +2,24 @@
 import json
 import os
 import ast
-from langchain_core.tools import Tool
-from langchain_classic.agents import AgentExecutor, create_react_agent
-from langchain_core.prompts import PromptTemplate
-from langchain_google_genai import ChatGoogleGenerativeAI
-from langchain_classic.memory import ConversationBufferMemory
+import threading
+from datetime import date
 from report_config import REPORT_DEFINITIONS
-from tools.report_lookup import lookup_tally_report
 from dotenv import load_dotenv
 
 try:
-    from agents import TallyWorkerAgent, ChartAgent, SummarizerAgent, TableAgent
+    from agents import TallyWorkerAgent, ChartAgent, SummarizerAgent, TableAgent, TrendAgent, MultiCompanyAgent
 except ImportError:
-    from .agents import TallyWorkerAgent, ChartAgent, SummarizerAgent, TableAgent
+    from .agents import TallyWorkerAgent, ChartAgent, SummarizerAgent, TableAgent, TrendAgent, MultiCompanyAgent
 
 # --- INITIALIZE SUB-AGENTS ---
+# Cheap shells: each one loads its heavy dependencies on first use
 TALLY_AGENT = TallyWorkerAgent()
 CHART_AGENT = ChartAgent()
 TABLE_AGENT = TableAgent()
 SUMMARIZER_AGENT = SummarizerAgent()
+TREND_AGENT = TrendAgent(CHART_AGENT)
+MULTI_COMPANY_AGENT = MultiCompanyAgent(TALLY_AGENT, CHART_AGENT, TABLE_AGENT)
 
 # --- WRAPPER TOOLS ---
 def tool_fetch_companies(_input: str = "") -> str:
@@ -43,7 +42,7 @@ def tool_analyze_visual(input_str: str) -> str:
         report_type = payload.get("report_type")
 
         print(f"⚙️ [Visual] Fetching {report_type}...")
-        fetch_res = json.loads(TALLY_AGENT.fetch_report(company, report_type))
+        fetch_res = json.loads(TALLY_AGENT.fetch_report(company, report_type, query))
         if fetch_res.get("status") == "error": return f"Error: {fetch_res.get('error')}"
         json_path = fetch_res.get("json_file_path")
         
@@ -58,6 +57,116 @@ def tool_analyze_visual(input_str: str) -> str:
         return f"ANALYSIS:\n{final_ans}\n\n[Charts]: {', '.join(image_paths)}"
     except Exception as e: return f"Error in visual tool: {str(e)}"
 
+def tool_analyze_dashboard(input_str: str) -> str:
+    """
+    Generate a DASHBOARD of several charts in one response.
+    Input must be a JSON string:
+    {"company": "Name", "query": "User Question", "charts": [{"query": "...", "report_type": "..."}, ...], "composite": true}
+    """
+    try:
+        cleaned_input = input_str.replace("'", '"')
+        try: payload = json.loads(cleaned_input)
+        except: payload = ast.literal_eval(input_str)
+
+        company = payload.get("company")
+        query = payload.get("query") or "Dashboard"
+        charts = payload.get("charts") or []
+        if not charts: return "Error: 'charts' must list at least one chart"
+
+        # Fetch each report once, even if several charts use it; the reports are exported concurrently
+        from tools.multi_company import fetch_all
+        report_types = list(dict.fromkeys(c.get("report_type") for c in charts))
+        print(f"⚙️ [Dashboard] Fetching {', '.join(map(str, report_types))}...")
+        fetched = fetch_all(report_types, lambda report_type: TALLY_AGENT.fetch_report(company, report_type))
+        paths = {}
+        for report_type, fetch_res in fetched.items():
+            if fetch_res.get("status") == "error": return f"Error: {fetch_res.get('error')}"
+            paths[report_type] = fetch_res.get("json_file_path")
+
+        specs = [{"json_path": paths[c.get("report_type")], "query": c.get("query")} for c in charts]
+        print(f"⚙️ [Dashboard] Plotting {len(specs)} charts...")
+        dash_res = json.loads(CHART_AGENT.create_dashboard(specs, title=query, composite=payload.get("composite", True)))
+        if dash_res.get("status") == "error": return f"Error: {dash_res.get('message')}"
+        image_paths = dash_res.get("images", [])
+
+        print(f"⚙️ [Dashboard] Summarizing...")
+        # Every report on the dashboard, so the narrative can't contradict the charts it didn't see
+        final_ans = SUMMARIZER_AGENT.analyze_reports(query, paths, image_paths, dash_res.get("rationale", ""))
+
+        return f"ANALYSIS:\n{final_ans}\n\n[Charts]: {', '.join(image_paths)}"
+    except Exception as e: return f"Error in dashboard tool: {str(e)}"
+
+def tool_analyze_trend(input_str: str) -> str:
+    """
+    Trends over time from the rollup store (milliseconds; no full re-export).
+    Input must be a JSON string:
+    {"company": "Name", "query": "User Question", "metric": "sales", "grain": "month", "from": "2024-04-01", "to": "2025-03-31", "key": "optional party/item/ledger"}
+    """
+    try:
+        cleaned_input = input_str.replace("'", '"')
+        try: payload = json.loads(cleaned_input)
+        except: payload = ast.literal_eval(input_str)
+
+        company = payload.get("company")
+        query = payload.get("query") or "Trend"
+
+        # Backfill the months of the range the rollups don't cover yet (default: financial year to date)
+        today = date.today()
+        fy_start = date(today.year if today.month >= 4 else today.year - 1, 4, 1)
+        start = date.fromisoformat(payload["from"]) if payload.get("from") else fy_start
+        end = min(date.fromisoformat(payload["to"]), today) if payload.get("to") else today
+        print(f"⚙️ [Trend] Checking rollup coverage {start} to {end}...")
+        fill_res = TALLY_AGENT.backfill_rollups(company, start, end)
+        if fill_res.get("status") == "error": return f"Error: {fill_res.get('error')}"
+
+        print(f"⚙️ [Trend] Reading rollups...")
+        trend_res = json.loads(TREND_AGENT.create_trend(
+            company, payload.get("metric") or "sales", payload.get("grain") or "month",
+            start.isoformat(), end.isoformat(), payload.get("key"), query))
+        if trend_res.get("status") == "error": return f"Error: {trend_res.get('message')}"
+        image_paths = trend_res.get("images", [])
+
+        print(f"⚙️ [Trend] Summarizing...")
+        final_ans = SUMMARIZER_AGENT.analyze_visual(query, trend_res["json_file_path"], image_paths, trend_res.get("rationale", ""))
+
+        return f"ANALYSIS:\n{final_ans}\n\n[Charts]: {', '.join(image_paths)}"
+    except Exception as e: return f"Error in trend tool: {str(e)}"
+
+def tool_analyze_companies(input_str: str) -> str:
+    """
+    Same report for SEVERAL companies, compared in one chart or table.
+    Input must be a JSON string:
+    {"companies": ["A", "B"] or "all", "query": "User Question", "report_type": "Tally Report Name", "output": "table" or "chart", "group_by": "optional column"}
+    """
+    try:
+        cleaned_input = input_str.replace("'", '"')
+        try: payload = json.loads(cleaned_input)
+        except: payload = ast.literal_eval(input_str)
+
+        companies = payload.get("companies") or []
+        if companies == "all" or companies == ["all"]:
+            companies = [c["name"] for c in TALLY_AGENT.fetch_companies()]
+        elif isinstance(companies, str):
+            companies = [c.strip() for c in companies.split(",")]
+        query = payload.get("query") or "Compare companies"
+        report_type = payload.get("report_type")
+        output = (payload.get("output") or "table").lower()
+
+        print(f"⚙️ [Companies] Fetching {report_type} for {len(companies)} companies...")
+        cmp_res = json.loads(MULTI_COMPANY_AGENT.compare(companies, report_type, query, output, payload.get("group_by")))
+        failures = cmp_res.get("failures") or {}
+        failed_note = "".join(f"\n- {co}: {err}" for co, err in failures.items())
+        if failed_note: failed_note = f"\n\nNot included (failed):{failed_note}"
+        if cmp_res.get("status") == "error": return f"Error: {cmp_res.get('message')}{failed_note}"
+
+        print(f"⚙️ [Companies] Summarizing...")
+        image_paths, table_paths = cmp_res.get("images", []), cmp_res.get("tables", [])
+        final_ans = SUMMARIZER_AGENT.analyze_visual(query, cmp_res["json_file_path"], image_paths, cmp_res.get("rationale", ""))
+
+        tag = f"[Tables]: {', '.join(table_paths)}" if table_paths else f"[Charts]: {', '.join(image_paths)}"
+        return f"ANALYSIS:\n{final_ans}{failed_note}\n\n{tag}"
+    except Exception as e: return f"Error in companies tool: {str(e)}"
+
 def tool_analyze_table(input_str: str) -> str:
     """
     Generate TABLES.
@@ -72,17 +181,21 @@ def tool_analyze_table(input_str: str) -> str:
         query = payload.get("query")
         
         # Smart Lookup
+        from tools.report_lookup import lookup_tally_report
         correct_report_name = lookup_tally_report.invoke(query)
         
-        fetch_res = json.loads(TALLY_AGENT.fetch_report(company, correct_report_name))
+        fetch_res = json.loads(TALLY_AGENT.fetch_report(company, correct_report_name, query))
         json_path = fetch_res.get("json_file_path")
         
         print(f"⚙️ [Table] Generating table from {correct_report_name}...")
-        table_res = json.loads(TABLE_AGENT.create_table(json_path, query))
+        table_res = json.loads(TABLE_AGENT.create_table(json_path, query, fetch_res.get("report_name")))
         
         if table_res.get("status") == "error":
              return f"Error: {table_res.get('message')}"
              
+        table_paths = table_res.get("tables", [])
+        if table_paths:
+            return f"ANALYSIS: Table generated for {correct_report_name}.\n\n[Tables]: {', '.join(table_paths)}"
         image_paths = table_res.get("images", [])
         return f"ANALYSIS: Table generated for {correct_report_name}.\n\n[Charts]: {', '.join(image_paths)}"
     except Exception as e: return f"Error in table tool: {str(e)}"
@@ -101,55 +214,87 @@ def tool_analyze_text_only(input_str: str) -> str:
         query = payload.get("query")
         report_type = payload.get("report_type")
 
-        fetch_res = json.loads(TALLY_AGENT.fetch_report(company, report_type))
+        fetch_res = json.loads(TALLY_AGENT.fetch_report(company, report_type, query))
         if fetch_res.get("status") == "error": return f"Error: {fetch_res.get('error')}"
         
         json_path = fetch_res.get("json_file_path")
-        final_ans = SUMMARIZER_AGENT.analyze_text_only(query, json_path)
+        final_ans = SUMMARIZER_AGENT.analyze_text_only(query, json_path, fetch_res.get("report_name"))
         return f"ANSWER:\n{final_ans}"
     except Exception as e: return f"Error: {str(e)}"
 
 # --- TOOLS LIST ---
-TOOLS = [
-    Tool(
-        name="list_companies",
-        func=tool_fetch_companies,
-        description="Returns list of active companies."
-    ),
-    Tool(
-        name="analyze_visual",
-        func=tool_analyze_visual,
-        description="Generates CHARTS. Input JSON: {'company': '...', 'query': '...', 'report_type': '...'}"
-    ),
-    Tool(
-        name="analyze_table",
-        func=tool_analyze_table,
-        description="Generates TABLES. Input JSON: {'company': '...', 'query': '...'}"
-    ),
-    Tool(
-        name="analyze_text_only",
-        func=tool_analyze_text_only,
-        description="Analyzes specific text values. Input JSON: {'company': '...', 'query': '...', 'report_type': '...'}"
-    )
-]
+def build_tools():
+    """LangChain Tool wrappers (built with the executor, so langchain loads on first use)."""
+    from langchain_core.tools import Tool
+    return [
+        Tool(
+            name="list_companies",
+            func=tool_fetch_companies,
+            description="Returns list of active companies."
+        ),
+        Tool(
+            name="analyze_visual",
+            func=tool_analyze_visual,
+            description="Generates CHARTS. Input JSON: {'company': '...', 'query': '...', 'report_type': '...'}"
+        ),
+        Tool(
+            name="analyze_dashboard",
+            func=tool_analyze_dashboard,
+            description="Generates SEVERAL CHARTS at once (a dashboard). Input JSON: {'company': '...', 'query': '...', 'charts': [{'query': '...', 'report_type': '...'}], 'composite': true}"
+        ),
+        Tool(
+            name="analyze_trend",
+            func=tool_analyze_trend,
+            description="Sales / receipts / payments / cash TRENDS over time (daily or monthly) or top parties, items and ledgers, from pre-aggregated rollups. Use for 'monthly sales', 'daily cash movement', 'top customers this year'. Input JSON: {'company': '...', 'query': '...', 'metric': 'sales|receipts|payments|cash|sales_by_party|sales_by_item|receipts_by_ledger|payments_by_ledger', 'grain': 'month|day', 'from': 'YYYY-MM-DD', 'to': 'YYYY-MM-DD'}"
+        ),
+        Tool(
+            name="analyze_companies",
+            func=tool_analyze_companies,
+            description="Compares the SAME report across SEVERAL companies (consolidated / group questions) in one table or chart. Input JSON: {'companies': ['...', '...'] or 'all', 'query': '...', 'report_type': '...', 'output': 'table|chart'}"
+        ),
+        Tool(
+            name="analyze_table",
+            func=tool_analyze_table,
+            description="Generates TABLES. Input JSON: {'company': '...', 'query': '...'}"
+        ),
+        Tool(
+            name="analyze_text_only",
+            func=tool_analyze_text_only,
+            description="Analyzes specific text values. Input JSON: {'company': '...', 'query': '...', 'report_type': '...'}"
+        )
+    ]
 
 class SupervisorAgent:
     def __init__(self):
-        api_key = os.getenv("GEMINI_API_KEY")
-        
-        self.llm = ChatGoogleGenerativeAI(
-            model="gemini-2.0-flash-exp", 
-            google_api_key=api_key, 
-            temperature=0
-        )
+        self.active_company = None
+
+        # LLM, memory and executor are built on the first chat (langchain + Gemini SDK
+        # take seconds to import), so creating the agent doesn't slow worker startup
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+    @property
+    def agent_executor(self):
+        if self._executor is None:
+            with self._executor_lock:
+                if self._executor is None:
+                    self._executor = self._build_executor()
+        return self._executor
+
+    def _build_executor(self):
+        from langchain_classic.agents import AgentExecutor, create_react_agent
+        from langchain_classic.memory import ConversationBufferMemory
+        from langchain_core.prompts import PromptTemplate
+        from tools.llm_gateway import DEFAULT_MODEL, get_llm_gateway
+
+        # Shared client; concurrency limits, rate limiting and retries live in the gateway
+        self.llm = get_llm_gateway().chat_model("supervisor", model=DEFAULT_MODEL, temperature=0)
         
         self.memory = ConversationBufferMemory(
             memory_key="chat_history", 
             return_messages=True
         )
         
-        self.active_company = None
-        
         # --- FIXED PROMPT TEMPLATE ---
         # Removed {active_company} from here to avoid input errors.
         # We will inject the company name directly into {input}
@@ -167,7 +312,7 @@ Action Input: the input to the action (must be valid JSON)
 Observation: the result of the action
 ... (this Thought/Action/Action Input/Observation can repeat N times)
 Thought: I now know the final answer
-Final Answer: the final answer to the original input question. If images are returned, include them.
+Final Answer: the final answer to the original input question. If the observation has [Charts]: or [Tables]: lines, copy them unchanged.
 
 Begin!
 
@@ -184,11 +329,12 @@ Thought:{agent_scratchpad}
         
         prompt = PromptTemplate.from_template(template)
         
-        agent = create_react_agent(self.llm, TOOLS, prompt)
+        tools = build_tools()
+        agent = create_react_agent(self.llm, tools, prompt)
         
-        self.agent_executor = AgentExecutor(
+        return AgentExecutor(
             agent=agent, 
-            tools=TOOLS, 
+            tools=tools, 
             verbose=True, 
             memory=self.memory, 
             handle_parsing_errors=True
@@ -203,17 +349,25 @@ Thought:{agent_scratchpad}
         except:
             return []
 
-    def chat(self, user_input):
-        if not self.active_company:
+    def chat(self, user_input, company=None, companies=None):
+        """company / companies (multi-company mode) are per call, so concurrent API requests don't share them."""
+        companies = list(companies or [])
+        company = company or (companies[0] if companies else self.active_company)
+        if not company:
             return "Please select a company first."
         
         # --- THE FIX: Merge company into the single 'input' string ---
         # This satisfies LangChain's requirement for a single input key.
         augmented_input = (
             f"User Question: {user_input}\n"
-            f"Context: The Active Company is '{self.active_company}'. "
+            f"Context: The Active Company is '{company}'. "
             f"Always include this company name in your tool inputs."
         )
+        if len(companies) > 1:
+            augmented_input += (
+                f"\nCompanies in scope: {json.dumps(companies)}. "
+                f"For questions across these companies, call analyze_companies once with this list."
+            )
         
         try:
             # We only pass 'input', avoiding the "multiple keys" error
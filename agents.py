@@ -1,36 +1,47 @@
 # agents.py
+import contextvars
+import hashlib
 import json
 import logging
 import os
-from typing import Any, Dict, List, Optional
-import google.generativeai as genai
-from PIL import Image
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
 from dotenv import load_dotenv
-from tools.report_lookup import lookup_tally_report
 
 load_dotenv()
 
-try:
-    from tools.company_list_tool import get_company_list
-    from tools.get_report_tool import get_report
-    from tools.chart_vlm_tool import generate_vlm_charts
-    from tools.table_generator import TableGenerator
-except ImportError:
-    import sys
-    sys.path.append(os.path.dirname(os.path.abspath(__file__)))
-    from tools.company_list_tool import get_company_list
-    from tools.get_report_tool import get_report
-    from tools.chart_vlm_tool import generate_vlm_charts
-    from tools.table_generator import TableGenerator
+# Tool modules pull in pandas, PIL, pyodbc, langchain and the Gemini SDK. They are
+# imported on first use (inside the methods below), so importing this module - and
+# building the agents - is cheap and the API worker starts fast.
+_HERE = os.path.dirname(os.path.abspath(__file__))
+if _HERE not in sys.path:
+    sys.path.append(_HERE)
+
+from tools.artifact_store import get_artifact_store  # stdlib only
+
+_LAZY_LOCK = threading.Lock()
 
 logger = logging.getLogger(__name__)
 
+# Charts rendered at once by a dashboard (the sandbox pool caps real parallelism)
+DASHBOARD_MAX_WORKERS = int(os.getenv("DASHBOARD_MAX_WORKERS", "4"))
+
 class TallyWorkerAgent:
     def __init__(self, *, retry: int = 1):
         self.retry = max(1, int(retry))
 
     def fetch_companies(self) -> List[Dict[str, Any]]:
         try:
+            from tools.tally_hosts import get_host_registry
+            registry = get_host_registry()
+            if len(registry.hosts) > 1:
+                # Several Tally servers: ask each one over HTTP (ODBC only reaches one host)
+                return [{"name": n, "id": n} for n in registry.companies()]
+
+            from tools.company_list_tool import get_company_list
             names = get_company_list.invoke({})
             if isinstance(names, list):
                 return [{"name": n, "id": n} for n in names]
@@ -39,11 +50,12 @@ class TallyWorkerAgent:
             logger.error(f"Error fetching companies: {e}")
             return []
 
-    def fetch_report(self, company_name: str, report_name: str) -> str:
+    def fetch_report(self, company_name: str, report_name: str, query: Optional[str] = None) -> str:
         # 1. SMART LOOKUP: Translate user query to exact Tally Report Name
         print(f"🕵️ Looking up best report for query: '{report_name}'")
         
         try:
+            from tools.report_lookup import lookup_tally_report
             # We invoke the lookup tool to get the correct XML name (e.g., 'Stock Summary')
             best_report = lookup_tally_report.invoke(report_name)
             print(f"🎯 Target Report: '{best_report}'")
@@ -51,12 +63,30 @@ class TallyWorkerAgent:
             print(f"⚠️ Lookup failed, using original name. Error: {e}")
             best_report = report_name
         try:
-            logger.info(f"Fetching report '{report_name}' for '{company_name}'")
-            raw = get_report.invoke({"company_name": company_name, "report_name": report_name})
+            # 2. PUSHDOWN: questions about one ledger group / voucher type + period fetch only those fields
+            raw, pushdown, suffix = None, None, ""
+            if query:
+                from tools.entity_index import get_entity_index
+                from tools.tdl_requests import get_collection, plan_pushdown
+                # Ledgers / items the question names ("HDFC current account") narrow the request further
+                request = plan_pushdown(query, report_name,
+                                        resolve=lambda q: get_entity_index().mentions(company_name, q))
+                if request is not None:
+                    logger.info(f"Pushdown for '{company_name}': {request.description}")
+                    raw = get_collection(company_name, request)
+                if raw is not None:
+                    report_name, pushdown = request.report_name, request.description
+                    suffix = "_".join(["", request.signature(), request.from_date, request.to_date]).rstrip("_")
+
+            if raw is None:
+                from tools.get_report_tool import get_report
+                logger.info(f"Fetching report '{report_name}' for '{company_name}'")
+                raw = get_report.invoke({"company_name": company_name, "report_name": report_name})
             
             safe_co = "".join([c for c in company_name if c.isalnum()]).strip()
             safe_rep = "".join([c for c in report_name if c.isalnum()]).strip()
-            filename = f"data_{safe_co}_{safe_rep}.json"
+            store = get_artifact_store()
+            filename = store.path_for("data", f"data_{safe_co}_{safe_rep}{suffix}.json")
             
             data_to_save = raw
             if isinstance(raw, str):
@@ -65,25 +95,109 @@ class TallyWorkerAgent:
             
             with open(filename, "w", encoding="utf-8") as f:
                 json.dump(data_to_save, f, indent=4)
+            store.register(filename)
             
-            return json.dumps({"status": "ok", "json_file_path": filename})
+            # Fold voucher exports into the per-company rollups (trend questions read those)
+            if isinstance(data_to_save, dict):
+                try:
+                    from tools.rollup_store import get_rollup_store
+                    stats = get_rollup_store().update_from_report(company_name, data_to_save)
+                    if stats: logger.info(f"Rollups for '{company_name}': {stats}")
+                except Exception as e:
+                    logger.warning(f"Rollup update failed for '{company_name}': {e}")
+
+            return json.dumps({"status": "ok", "json_file_path": filename, "report_name": report_name,
+                               "pushdown": pushdown})
         except Exception as e:
             return json.dumps({"status": "error", "error": str(e)})
 
+    def backfill_rollups(self, company_name: str, start: date, end: date) -> Dict[str, Any]:
+        """
+        Exports the full Day Book month by month for the parts of start..end the rollups don't cover yet.
+        Today is never marked covered (vouchers are still being entered), so it is re-exported next time.
+        """
+        from tools.get_report_tool import export_report, is_report_payload
+        from tools.rollup_store import get_rollup_store
+        store = get_rollup_store()
+        last_complete = date.today() - timedelta(days=1)
+        months = store.missing(company_name, start, end)
+        for lo, hi in months:
+            logger.info(f"Rollup backfill for '{company_name}': Day Book {lo} to {hi}")
+            payload = export_report(company_name, "Day Book", lo.strftime("%Y%m%d"), hi.strftime("%Y%m%d"))
+            if not is_report_payload(payload): return {"status": "error", "error": payload}
+            store.update_from_report(company_name, json.loads(payload))
+            store.mark_covered(company_name, lo, min(hi, last_complete))
+        return {"status": "ok", "exports": len(months)}
+
 class ChartAgent:
     """
     Wrapper for the FinancialPlotter class. 
     """
     def __init__(self):
-        self.plotter = generate_vlm_charts()
+        self._plotter = None
+
+    @property
+    def plotter(self):
+        # Built on first use (PIL + the Gemini client); dashboards call this from several threads
+        if self._plotter is None:
+            with _LAZY_LOCK:
+                if self._plotter is None:
+                    from tools.chart_vlm_tool import generate_vlm_charts
+                    self._plotter = generate_vlm_charts()
+        return self._plotter
 
     # --- CRITICAL FIX: Added 'query' parameter here ---
-    def create_charts(self, json_path, query="Analyze data"):
+    def create_charts(self, json_path, query="Analyze data", batchable=False):
         """
         Calls the VLM/LLM Plotter to generate a chart image.
         """
         # Passes both arguments to the plotter
-        return self.plotter.generate_chart(json_path, query)
+        return self.plotter.generate_chart(json_path, query, batchable=batchable)
+
+    def create_dashboard(self, specs: List[Dict[str, str]], title: str = "Dashboard", composite: bool = True) -> str:
+        """
+        Renders several charts at once. specs: [{"json_path": ..., "query": ...}, ...]
+        Each chart's code runs in its own sandbox worker, so the charts render in parallel
+        across CPU cores. Returns one composite image, or the individual images.
+        """
+        if not specs:
+            return json.dumps({"status": "error", "message": "No chart specs given"})
+
+        batchable = len(specs) > 1  # concurrent code requests may share one LLM call
+
+        def render(spec):
+            try: return json.loads(self.create_charts(spec["json_path"], spec.get("query") or "Analyze data", batchable))
+            except Exception as e: return {"status": "error", "message": str(e)}
+
+        # Each task gets a copy of this request's context (chart format etc.)
+        workers = min(len(specs), DASHBOARD_MAX_WORKERS)
+        with ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(contextvars.copy_context().run, render, spec) for spec in specs]
+            results = [f.result() for f in futures]
+
+        charts, images = [], []
+        for spec, res in zip(specs, results):
+            chart_images = res.get("images", []) if res.get("status") == "success" else []
+            images.extend(chart_images)
+            charts.append({"query": spec.get("query"), "status": res.get("status", "error"),
+                           "images": chart_images, "message": res.get("message")})
+
+        if not images:
+            return json.dumps({"status": "error", "message": "No chart could be generated", "charts": charts})
+
+        images = list(dict.fromkeys(images))  # two specs can resolve to the same content-addressed chart
+        if composite and len(images) > 1:
+            combined = self.plotter.create_dashboard(images, title)
+            if not combined.startswith("Error"):
+                images = [combined]
+
+        failed = sum(1 for c in charts if c["status"] != "success")
+        return json.dumps({
+            "status": "success",
+            "images": images,
+            "charts": charts,
+            "rationale": f"Dashboard with {len(charts) - failed} of {len(charts)} charts."
+        })
 
 
 class TableAgent:
@@ -91,16 +205,158 @@ class TableAgent:
     Wrapper for the TableGenerator class.
     """
     def __init__(self):
-        self.generator = TableGenerator()
+        self._generator = None
+
+    @property
+    def generator(self):
+        # Built on first use (pandas)
+        if self._generator is None:
+            with _LAZY_LOCK:
+                if self._generator is None:
+                    from tools.table_generator import TableGenerator
+                    self._generator = TableGenerator()
+        return self._generator
 
-    def create_table(self, json_path, query="Show table"):
+    def create_table(self, json_path, query="Show table", report_name=None):
         """
-        Calls the Table Generator to create an image.
+        Calls the Table Generator (report_name selects its dedicated parser, if any).
         """
-        return self.generator.generate_table(json_path, query)
+        return self.generator.generate_table(json_path, query, report_name=report_name)
     
 
 
+class TrendAgent:
+    """
+    Trend charts from the rollup store (no Tally export, no re-aggregation).
+    metric: 'sales', 'receipts', 'payments', 'cash' (receipts - payments) as a series over time,
+    or 'sales_by_party', 'sales_by_item', 'receipts_by_ledger', 'payments_by_ledger' as a top-N breakdown.
+    """
+    SERIES = {"sales": "sales_party", "receipts": "receipts", "payments": "payments"}
+    BREAKDOWNS = {"sales_by_party": "sales_party", "sales_by_item": "sales_item",
+                  "receipts_by_ledger": "receipts", "payments_by_ledger": "payments"}
+
+    def __init__(self, chart_agent: Optional[ChartAgent] = None):
+        # Shares the chart agent's plotter (and its LLM client) when given one
+        self.chart_agent = chart_agent or ChartAgent()
+
+    def create_trend(self, company: str, metric: str = "sales", grain: str = "month", start: Optional[str] = None,
+                     end: Optional[str] = None, key: Optional[str] = None, query: str = "Trend") -> str:
+        from tools.rollup_store import get_rollup_store
+        store = get_rollup_store()
+        try:
+            if metric in self.BREAKDOWNS:
+                rows = store.breakdown(company, self.BREAKDOWNS[metric], grain, start, end)
+                table = [{"Particulars": k, "Amount": amount, "Count": count} for k, amount, count in rows]
+                chart = {k: amount for k, amount, _ in rows}
+                draw = self.chart_agent.plotter.create_bar_chart
+            elif metric == "cash":
+                flows: Dict[str, float] = {}
+                for period, amount, _ in store.series(company, "receipts", grain, start, end, key):
+                    flows[period] = flows.get(period, 0.0) + amount
+                for period, amount, _ in store.series(company, "payments", grain, start, end, key):
+                    flows[period] = flows.get(period, 0.0) - amount
+                table = [{"Period": _period_date(p), "Net Cash": round(v, 2)} for p, v in sorted(flows.items())]
+                chart = {row["Period"]: row["Net Cash"] for row in table}
+                draw = self.chart_agent.plotter.create_line_chart
+            elif metric in self.SERIES:
+                rows = store.series(company, self.SERIES[metric], grain, start, end, key)
+                table = [{"Period": _period_date(p), "Amount": amount, "Count": count} for p, amount, count in rows]
+                chart = {row["Period"]: row["Amount"] for row in table}
+                draw = self.chart_agent.plotter.create_line_chart
+            else:
+                return json.dumps({"status": "error", "message": f"Unknown trend metric '{metric}'"})
+        except ValueError as e:
+            return json.dumps({"status": "error", "message": str(e)})
+
+        if not table:
+            return json.dumps({"status": "error", "message": "No rollup data for this range. Fetch the Day Book first."})
+
+        safe_co = "".join([c for c in company if c.isalnum()]).strip()
+        store = get_artifact_store()
+        filename = store.path_for("data", f"data_{safe_co}_trend_{metric}_{grain}.json")
+        with open(filename, "w", encoding="utf-8") as f:
+            json.dump({"TREND": table}, f, indent=4)
+        store.register(filename)
+
+        image = draw(chart, query)
+        images = [] if image.startswith("Error") else [image]
+        return json.dumps({
+            "status": "success",
+            "images": images,
+            "json_file_path": filename,
+            "rationale": f"{metric} by {grain} from the rollup store ({len(table)} rows)."
+        })
+
+
+class MultiCompanyAgent:
+    """
+    Same report for several companies: concurrent fetch, one aligned comparison
+    frame, one chart (totals per company) or one table (a column per company).
+    """
+    def __init__(self, tally_agent: Optional[TallyWorkerAgent] = None, chart_agent: Optional[ChartAgent] = None,
+                 table_agent: Optional["TableAgent"] = None):
+        self.tally_agent = tally_agent or TallyWorkerAgent()
+        self.chart_agent = chart_agent or ChartAgent()
+        self.table_agent = table_agent or TableAgent()
+
+    def compare(self, companies: List[str], report_type: str, query: str = "Compare companies",
+                output: str = "table", group_by: Optional[str] = None) -> str:
+        from tools.multi_company import comparison_frame, company_totals, fetch_all
+
+        companies = list(dict.fromkeys(c for c in companies if c))
+        if not companies:
+            return json.dumps({"status": "error", "message": "No companies given"})
+
+        results = fetch_all(companies, lambda company: self.tally_agent.fetch_report(company, report_type))
+        frame, meta = comparison_frame(results, group_by=group_by)
+        failures = meta["failures"]
+        if frame.empty:
+            return json.dumps({"status": "error", "message": "No company could be compared", "failures": failures})
+
+        # Content-addressed: concurrent /compare requests never overwrite each other's data
+        payload = json.dumps({"COMPARISON": frame.to_dict(orient="records"), "FAILURES": failures}, indent=4)
+        digest = hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+        safe_rep = "".join([c for c in report_type if c.isalnum()]).strip()
+        store = get_artifact_store()
+        filename = store.path_for("data", f"data_compare_{safe_rep}_{digest}.json")
+        tmp_name = f"{filename}.{threading.get_ident()}.tmp"
+        with open(tmp_name, "w", encoding="utf-8") as f:
+            f.write(payload)
+        os.replace(tmp_name, filename)
+        store.register(filename)
+
+        images, tables = [], []
+        if output == "chart":
+            # Several companies: one bar each; a single company left: its largest rows
+            totals = company_totals(frame, meta)
+            if len(totals) < 2:
+                totals = dict(zip(frame[meta["label"]].astype(str), frame["Total"].astype(float)))
+            image = self.chart_agent.plotter.create_bar_chart(totals, query)
+            if not image.startswith("Error"): images.append(image)
+        else:
+            types = {meta["label"]: "string", **{col: "number" for col in frame.columns if col != meta["label"]}}
+            table_res = json.loads(self.table_agent.generator.generate_table_from_frame(
+                frame, query, types=types, extra={"failures": failures}))
+            if table_res.get("status") == "error":
+                return json.dumps({"status": "error", "message": table_res.get("message"), "failures": failures})
+            images, tables = table_res.get("images", []), table_res.get("tables", [])
+
+        compared = len(meta["companies"])
+        return json.dumps({
+            "status": "success",
+            "images": images,
+            "tables": tables,
+            "json_file_path": filename,
+            "failures": failures,
+            "rationale": f"{meta['amount']} by {meta['label']} for {compared} of {len(companies)} companies ({report_type})."
+        })
+
+
+def _period_date(period: str) -> str:
+    """'2024-04' (month rollup) -> '2024-04-01', so it plots as a date."""
+    return f"{period}-01" if len(period) == 7 else period
+
+
 class SummarizerAgent:
     def __init__(self):
         # Read from ENV
@@ -109,36 +365,95 @@ class SummarizerAgent:
     def analyze_visual(self, query: str, json_file_path: str, image_paths: List[str], rationale: str) -> str:
         return self._run_gemini(query, json_file_path, image_paths, rationale)
 
-    def analyze_text_only(self, query: str, json_file_path: str) -> str:
+    def analyze_reports(self, query: str, reports: Dict[str, str], image_paths: List[str], rationale: str) -> str:
+        """Like analyze_visual, over several reports ({report name: json path}); each gets its own digest."""
+        digests = {name: self._data_digest(path) for name, path in reports.items()}
+        data_text = "\n\n".join(f"[{name}]\n{text}" for name, (text, _) in digests.items())
+        structured = bool(digests) and all(ok for _, ok in digests.values())
+        return self._run_gemini(query, None, image_paths, rationale, data_text=data_text, structured=structured)
+
+    def analyze_text_only(self, query: str, json_file_path: str, report_name: Optional[str] = None) -> str:
+        # Totals, counts, top-N and lookups are computed locally; the LLM only phrases them
+        computed = self._compute_answer(query, json_file_path, report_name)
+        if computed is not None:
+            return self._phrase_answer(query, computed)
         return self._run_gemini(query, json_file_path, [], "No charts needed.")
 
-    def _run_gemini(self, query, json_path, image_paths, rationale):
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        genai.configure(api_key=api_key)
-        model = genai.GenerativeModel(self.model_name)
+    def _compute_answer(self, query: str, json_path: str, report_name: Optional[str]) -> Optional[Dict[str, Any]]:
+        if not json_path or not os.path.exists(json_path):
+            return None
+        try:
+            from tools.query_planner import compute_answer
+            with open(json_path, 'r', encoding="utf-8") as f:
+                result = compute_answer(query, json.load(f), report_name)
+        except Exception as e:
+            logger.warning(f"Query planner failed for {json_path}, using the LLM: {e}")
+            return None
+        if result is not None:
+            logger.info(f"Answered with a computed plan: {result['plan']}")
+        return result
+
+    def _phrase_answer(self, query: str, computed: Dict[str, Any]) -> str:
+        from tools.llm_gateway import get_llm_gateway
+
+        prompt = [
+            f"User Query: {query}",
+            f"Computed Result: {computed['facts']}",
+            "INSTRUCTIONS:",
+            "1. Answer the query in one to three sentences using ONLY the Computed Result.",
+            "2. The numbers are exact; copy them as given and do not recalculate, round or add to them.",
+            "3. If no rows matched, say so and mention the period the report covers."
+        ]
+        try:
+            return get_llm_gateway().generate("answer_phrasing", prompt, model=self.model_name).text
+        except Exception as e:
+            logger.warning(f"Phrasing failed, returning the computed result: {e}")
+            return computed["facts"]
+
+    def _data_digest(self, json_path: str) -> Tuple[str, bool]:
+        """(prompt text, whether it is the whole-report digest). Falls back to the truncated raw JSON."""
+        if not os.path.exists(json_path):
+            return "", False
+        with open(json_path, 'r', encoding="utf-8") as f:
+            data_text = f.read()
+        try:
+            from tools.report_digest import build_digest_text
+            return build_digest_text(json.loads(data_text)), True
+        except Exception as e:
+            logger.warning(f"Digest failed for {json_path}, sending raw data: {e}")
+            return f"Raw Data (truncated): {data_text[:5000]}", False
+
+    def _run_gemini(self, query, json_path, image_paths, rationale, data_text: Optional[str] = None,
+                    structured: bool = False):
+        from tools.image_prep import IMAGE_PREPARER
+        from tools.llm_gateway import get_llm_gateway
 
-        data_text = ""
-        if os.path.exists(json_path):
-            with open(json_path, 'r') as f:
-                data_text = f.read()
+        if data_text is None: data_text, structured = self._data_digest(json_path)
 
         images = []
+        skipped = 0
         for path in image_paths:
-            if os.path.exists(path):
-                images.append(Image.open(path))
+            # Table images only repeat the data when the full digest went in; a truncated raw dump doesn't
+            if not IMAGE_PREPARER.should_send(path, has_structured_data=structured):
+                skipped += 1
+                continue
+            prepared = IMAGE_PREPARER.prepare(path)
+            if prepared: images.append(prepared)
+        if skipped:
+            rationale = f"{rationale} ({skipped} table image(s) not attached; their rows are in the Data.)"
 
         prompt = [
             f"User Query: {query}",
             f"Context: {rationale}",
-            f"Raw Data: {data_text[:5000]}",
+            f"Data: {data_text}",
             "INSTRUCTIONS:",
-            "1. Answer the query precisely based on the Raw Data.",
+            "1. Answer the query precisely based on the Data. Totals in the digest cover every row; use them instead of adding up samples.",
             "2. If charts (images) are provided, reference them explicitly.",
             "3. If NO charts are provided, simply state the facts/values requested."
         ]
         
         try:
-            response = model.generate_content(prompt + images)
+            response = get_llm_gateway().generate("summarizer", prompt + images, model=self.model_name)
             return response.text
         except Exception as e:
             return f"Analysis failed: {e}"
\ No newline at end of file
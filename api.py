@@ -1,13 +1,25 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query, Request, Response
+from fastapi.responses import FileResponse
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from typing import List, Optional
+from typing import Any, Dict, List, Optional
+import json
 import os
 import re
 
 # Import your existing Agent logic
-from SupervisorAgent import SupervisorAgent
+from SupervisorAgent import SupervisorAgent, tool_analyze_companies
+from tools.artifact_store import get_artifact_store
+from tools.chart_sandbox import CHART_SANDBOX_ENABLED, get_chart_sandbox
+from tools.entity_index import KINDS, get_entity_index
+from tools.image_variants import THUMBNAIL_WIDTH, ImageNotFound, etag_matches, get_image_variants
+from tools.llm_gateway import get_llm_gateway
+from tools.prefetch import BUSY_PATHS, get_prefetch_scheduler, track_request
+from tools.report_cache import get_report_cache
+from tools.request_context import request_options
+from tools.tally_hosts import get_host_registry
+from tools.table_sessions import TABLE_PAGE_SIZE, get_table_sessions, parse_filters
 
 app = FastAPI(title="Tally Smart Agent API", version="1.0")
 
@@ -26,14 +38,78 @@ HARDCODED_COMPANY = "Modi Chemplast Materials Pvt Ltd"
 class ChatRequest(BaseModel):
     query: str
     chat_history: Optional[List[str]] = []
+    chart_format: Optional[str] = "png"  # "svg" returns vector charts the frontend can render directly
+    table_format: Optional[str] = "json"  # "html" adds an HTML fragment; "png" renders an image instead
+    companies: Optional[List[str]] = None  # multi-company mode: questions may span these companies
+
+class CompareRequest(BaseModel):
+    companies: List[str]  # or ["all"] for every company open in Tally
+    report_type: str
+    query: Optional[str] = "Compare companies"
+    output: Optional[str] = "table"  # "table": a column per company; "chart": one bar per company
+    group_by: Optional[str] = None
+    chart_format: Optional[str] = "png"
+    table_format: Optional[str] = "json"
 
 class ChatResponse(BaseModel):
     response_text: str
     image_paths: List[str]
+    tables: List[Dict[str, Any]] = []  # {"title", "columns": [{"name", "type"}], "rows", "total_rows", "truncated", "session_id"[, "html"]}
     status: str
 
+def _load_tables(raw_response: str):
+    """Removes the [Tables]: tag and loads the table JSON files it lists."""
+    match = re.search(r"\[Tables\]: (.*?)(?:\n|$)", raw_response, re.IGNORECASE)
+    if not match: return raw_response, []
+
+    tables = []
+    for p in match.group(1).split(","):
+        p = p.strip().replace("\\", "/")
+        # Only files the table tool wrote
+        name = os.path.basename(p)
+        if not (get_artifact_store().contains(p) and name.startswith("table_") and name.endswith(".json")) or not os.path.isfile(p): continue
+        with open(p, "r", encoding="utf-8") as f:
+            tables.append(json.load(f))
+    return raw_response.replace(match.group(0), "").strip(), tables
+
 agent = SupervisorAgent()
 
+# --- BACKGROUND PREFETCH (PREFETCH_REPORTS) ---
+@app.middleware("http")
+async def count_user_requests(request, call_next):
+    # The prefetch scheduler backs off while these are in flight
+    if not request.url.path.startswith(BUSY_PATHS):
+        return await call_next(request)
+    with track_request():
+        return await call_next(request)
+
+@app.on_event("startup")
+def start_prefetch():
+    scheduler = get_prefetch_scheduler()
+    if scheduler.entries: scheduler.start()
+
+@app.on_event("shutdown")
+def stop_prefetch():
+    get_prefetch_scheduler().stop()
+
+# --- ARTIFACT CLEANUP (charts, tables, report data stay within ARTIFACT_MAX_BYTES / _FILES / _AGE) ---
+@app.on_event("startup")
+def start_artifact_cleanup():
+    get_artifact_store().start_cleanup()
+
+@app.on_event("shutdown")
+def stop_artifact_cleanup():
+    get_artifact_store().stop()
+
+# --- CHART SANDBOX (worker processes pre-warmed in the background, not on the first chart) ---
+@app.on_event("startup")
+def start_chart_sandbox():
+    if CHART_SANDBOX_ENABLED: get_chart_sandbox()
+
+@app.on_event("shutdown")
+def stop_chart_sandbox():
+    if CHART_SANDBOX_ENABLED: get_chart_sandbox().close()
+
 @app.get("/")
 def health_check():
     return {"status": "running", "service": "Tally Agent API", "active_company": HARDCODED_COMPANY}
@@ -43,40 +119,14 @@ def chat_endpoint(request: ChatRequest):
     try:
         print(f"📥 Received Query: {request.query}")
         
-        # 1. Set Context
-        agent.set_active_company(HARDCODED_COMPANY)
-        
-        # 2. Run Agent
-        raw_response = agent.chat(request.query)
+        # 1. Run Agent (company scope is passed per request, never stored on the shared agent)
+        with request_options(chart_format=request.chart_format, table_format=request.table_format):
+            raw_response = agent.chat(request.query, company=request.companies[0] if request.companies else HARDCODED_COMPANY,
+                                      companies=request.companies)
         print("✅ Agent finished.")
 
-        # 3. Parse Response
-        clean_text = raw_response
-        image_files = []
-        
-        # Regex to find [Charts]: path/to/image.png
-        match = re.search(r"\[Charts\]: (.*?)(?:\n|$)", raw_response, re.IGNORECASE)
-        if match:
-            path_str = match.group(1)
-            # Remove tag from text
-            clean_text = raw_response.replace(match.group(0), "").strip()
-            
-            paths = path_str.split(",")
-            for p in paths:
-                p = p.strip()
-                if p: 
-                    # --- CRITICAL FIX: FORCE FORWARD SLASHES ---
-                    # Windows paths use '\', but URLs must use '/'
-                    safe_path = p.replace("\\", "/")
-                    image_files.append(safe_path)
-        
-        print(f"📤 Sending Response: '{clean_text}' | Images={image_files}")
-
-        return {
-            "response_text": clean_text,
-            "image_paths": image_files,
-            "status": "success"
-        }
+        # 2. Parse Response
+        return _build_response(raw_response)
 
     except Exception as e:
         print(f"❌ Error: {str(e)}")
@@ -86,6 +136,129 @@ def chat_endpoint(request: ChatRequest):
             "status": "error"
         }
 
+@app.post("/compare", response_model=ChatResponse)
+def compare_endpoint(request: CompareRequest):
+    """Same report for several companies in one table/chart (no ReAct loop; failed companies are listed in the text)."""
+    try:
+        payload = {"companies": request.companies, "report_type": request.report_type, "query": request.query,
+                   "output": request.output, "group_by": request.group_by}
+        with request_options(chart_format=request.chart_format, table_format=request.table_format):
+            raw_response = tool_analyze_companies(json.dumps(payload))
+        if raw_response.startswith("Error"):
+            return {"response_text": raw_response, "image_paths": [], "status": "error"}
+        return _build_response(raw_response)
+    except Exception as e:
+        print(f"❌ Error: {str(e)}")
+        return {"response_text": f"Error processing request: {str(e)}", "image_paths": [], "status": "error"}
+
+def _build_response(raw_response: str):
+    """Splits the [Tables]: / [Charts]: tags off an agent answer."""
+    clean_text, tables = _load_tables(raw_response)
+    raw_response = clean_text
+    image_files = []
+    
+    # Regex to find [Charts]: path/to/image.png
+    match = re.search(r"\[Charts\]: (.*?)(?:\n|$)", raw_response, re.IGNORECASE)
+    if match:
+        path_str = match.group(1)
+        # Remove tag from text
+        clean_text = raw_response.replace(match.group(0), "").strip()
+        
+        paths = path_str.split(",")
+        for p in paths:
+            p = p.strip()
+            if p: 
+                # --- CRITICAL FIX: FORCE FORWARD SLASHES ---
+                # Windows paths use '\', but URLs must use '/'
+                safe_path = p.replace("\\", "/")
+                image_files.append(safe_path)
+    
+    print(f"📤 Sending Response: '{clean_text}' | Images={image_files}")
+
+    return {
+        "response_text": clean_text,
+        "image_paths": image_files,
+        "tables": tables,
+        "status": "success"
+    }
+
+# --- TABLE PAGES (server-side; never calls Tally or the LLM) ---
+@app.get("/tables/{session_id}")
+def table_page(session_id: str, page: int = 1, page_size: int = TABLE_PAGE_SIZE,
+               sort: Optional[str] = None, order: str = "asc", search: Optional[str] = None,
+               filter: List[str] = Query(default=[])):
+    """filter: repeatable 'column:op:value' (op: eq, ne, gt, gte, lt, lte, contains)."""
+    try:
+        session = get_table_sessions().get(session_id)
+    except KeyError:
+        raise HTTPException(status_code=404, detail="Table session expired or not found. Ask the question again.")
+    try:
+        return session.page(page, page_size, sort=sort, descending=order.lower() == "desc",
+                            filters=parse_filters(filter), search=search)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+@app.delete("/tables/{session_id}")
+def close_table(session_id: str):
+    return {"closed": get_table_sessions().close(session_id)}
+
+# --- TALLY HOSTS ---
+@app.get("/hosts")
+def tally_hosts(refresh: bool = False):
+    """Per-host health, load and company routing. refresh=true re-asks every host for its companies."""
+    registry = get_host_registry()
+    if refresh: registry.discover(force=True)
+    return registry.status()
+
+# --- REPORT CACHE / PREFETCH ---
+@app.get("/prefetch")
+def prefetch_status():
+    """Scheduled entries, AlterID probes and what the report cache holds."""
+    return {"scheduler": get_prefetch_scheduler().status(), "cache": get_report_cache().status()}
+
+# --- ARTIFACTS ---
+@app.get("/artifacts")
+def artifact_status():
+    """Generated files on disk against their budget."""
+    return get_artifact_store().status()
+
+# --- LLM GATEWAY ---
+@app.get("/llm/stats")
+def llm_stats():
+    """Per call site: calls, retries, errors, batched prompts, tokens and latency; plus the configured limits."""
+    return get_llm_gateway().stats()
+
+# --- ENTITY INDEX (ledger / party / stock item names) ---
+@app.get("/entities")
+def entities(company: Optional[str] = None, q: Optional[str] = None, kind: Optional[str] = None, limit: int = 10):
+    """
+    With company and q: best matching masters for a typed name (autocomplete). kind: ledger | party | item.
+    Otherwise: per-company index status (entities by kind, last sync, errors).
+    """
+    if not company or not q: return get_entity_index().status()
+    if kind and kind not in KINDS:
+        raise HTTPException(status_code=400, detail=f"Unknown kind '{kind}'. Use one of {KINDS}.")
+    return {"company": company, "query": q,
+            "results": get_entity_index().search(company, q, kinds=[kind] if kind else None, limit=max(1, min(limit, 50)))}
+
+# --- IMAGE VARIANTS (WebP / thumbnails with ETag + Cache-Control) ---
+@app.get("/images/{path:path}")
+def serve_image(path: str, request: Request, w: Optional[int] = None, thumb: bool = False, format: str = "auto"):
+    """
+    path: an image path from a response (e.g. generated_plots/charts/ab/chart_bar_....png).
+    w: target width (snapped to 320/640/1024/1600), thumb=true: 320px. format: auto | webp | original.
+    """
+    try:
+        file_path, media_type, headers = get_image_variants().select(
+            path, format, THUMBNAIL_WIDTH if thumb else w, request.headers.get("accept", ""))
+    except ImageNotFound:
+        raise HTTPException(status_code=404, detail="Image not found (it may have been cleaned up).")
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    if etag_matches(request.headers.get("if-none-match"), headers["ETag"]):
+        return Response(status_code=304, headers=headers)
+    return FileResponse(file_path, media_type=media_type, headers=headers)
+
 # --- SERVE IMAGES ---
 os.makedirs("generated_plots", exist_ok=True)
 app.mount("/generated_plots", StaticFiles(directory="generated_plots"), name="images")
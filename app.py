@@ -1,6 +1,8 @@
 import streamlit as st
 import re
 import os
+import json
+import pandas as pd
 # Import the SupervisorAgent class
 from SupervisorAgent import SupervisorAgent
 
@@ -18,6 +20,14 @@ def get_agent_instance():
 
 agent = get_agent_instance()
 
+def show_table(table):
+    """Renders a table JSON (from the table tool) as a native, sortable dataframe."""
+    df = pd.DataFrame(table.get("rows", []), columns=[c["name"] for c in table.get("columns", [])])
+    if table.get("title"): st.caption(table["title"])
+    st.dataframe(df, use_container_width=True, hide_index=True)
+    if table.get("truncated"):
+        st.caption(f"Showing {len(df)} of {table.get('total_rows')} rows.")
+
 # Session State
 if "messages" not in st.session_state: st.session_state.messages = []
 if "active_company" not in st.session_state: st.session_state.active_company = None
@@ -68,6 +78,8 @@ st.caption("Ask about Balance Sheet, P&L, Stock, or specific ledgers.")
 for msg in st.session_state.messages:
     with st.chat_message(msg["role"]):
         st.markdown(msg["content"])
+        for table in msg.get("tables", []):
+            show_table(table)
         if msg.get("images"):
             for img_path in msg["images"]:
                 if os.path.exists(img_path):
@@ -104,8 +116,22 @@ if prompt := st.chat_input("Ex: Show me a pie chart of my stock groups"):
                     if os.path.exists(p):
                         image_files.append(p)
             
+            # --- Extract Tables ---
+            tables = []
+            table_match = re.search(r"\[Tables\]: (.*?)(?:\n|$)", clean_text, re.IGNORECASE)
+            if table_match:
+                clean_text = clean_text.replace(table_match.group(0), "")
+                for p in table_match.group(1).split(","):
+                    p = p.strip()
+                    if os.path.exists(p):
+                        with open(p, "r", encoding="utf-8") as f: tables.append(json.load(f))
+
             # Display text
             st.markdown(clean_text)
+
+            # Display tables (native, searchable)
+            for table in tables:
+                show_table(table)
             
             # Display images
             for img in image_files:
@@ -115,5 +141,6 @@ if prompt := st.chat_input("Ex: Show me a pie chart of my stock groups"):
             st.session_state.messages.append({
                 "role": "assistant",
                 "content": clean_text,
-                "images": image_files
+                "images": image_files,
+                "tables": tables
             })
\ No newline at end of file
@@ -0,0 +1,111 @@
+# benchmarks/answer_checks.py
+"""
+Offline checks for the deterministic answer path.
+
+Questions are run against synthetic fixture reports (no Tally, no LLM). The
+script exits non-zero when the query planner returns a plan for a question
+it can't answer exactly (a comparison, an exclusion, a group or party name
+the report doesn't list), or stops planning one it should. It also checks
+that table JSON for ragged reports (rows missing some fields) stays valid
+JSON, with None for the missing cells.
+
+Usage:
+    python benchmarks/answer_checks.py
+    python benchmarks/answer_checks.py --rows 1000 --verbose
+"""
+import argparse
+import json
+import os
+import sys
+import xml.etree.ElementTree as ET
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from benchmarks.tally_fixtures import TallyFixtureGenerator
+from tools.get_report_tool import clean_tally_xml, decode_tally_bytes, xml_to_dict
+from tools.query_planner import QueryEngine
+from tools.table_generator import TableGenerator
+
+# (report, question, expected op or None for "must go to the LLM")
+PLANNER_CASES = (
+    ("Day Book", "how many vouchers above 10000", None),
+    ("Day Book", "total amount excluding Reliance Polymers", None),
+    ("Day Book", "total sales to Krishna & Sons", None),
+    ("Day Book", "why did sales drop in april", None),
+    ("Trial Balance", "total of sundry debtors", None),
+    ("Trial Balance", "how many ledgers have a credit balance", None),
+    ("Trial Balance", "closing balance of Sundry Debtors 16", None),
+    ("Stock Summary", "total value of items with quantity below 10", None),
+
+    ("Day Book", "total sales in April 2024", "sum"),
+    ("Day Book", "how many vouchers between 01-04-2024 and 15-04-2024", "count"),
+    ("Day Book", "top 5 parties by amount", "top"),
+    ("Day Book", "average amount by voucher type", "mean"),
+    ("Day Book", "party-wise total amount", "sum"),
+    ("Trial Balance", "closing balance of Sundry Debtors 3", "lookup"),
+    ("Trial Balance", "top 3 ledgers by debit", "top"),
+    ("Stock Summary", "closing stock value of PVC Resin 50kg 3", "lookup"),
+    ("Stock Summary", "total stock value", "sum"),
+)
+
+# Generic report whose rows don't all carry the same fields -> (report, data, expected rows)
+RAGGED_REPORT = ("Custom Ledger List",
+                 {"ENVELOPE": {"ROW": [{"NAME": "A", "AMT": "5"}, {"NAME": "B"}, {"AMT": "7"}]}},
+                 [["A", 5.0], ["B", None], [None, 7.0]])
+
+
+def load_report(fixtures, report, rows):
+    """Fixture XML -> the dict get_report returns."""
+    root = ET.fromstring(clean_tally_xml(decode_tally_bytes(fixtures.render(report, rows))))
+    data = xml_to_dict(root)
+    if "BODY" in data and "IMPORTDATA" in data["BODY"]:
+        return data["BODY"]["IMPORTDATA"]
+    return data
+
+
+def check_planner(fixtures, rows, verbose):
+    engine, frames, failures = QueryEngine(), {}, 0
+    for report, question, expected in PLANNER_CASES:
+        if report not in frames: frames[report] = engine.prepare(load_report(fixtures, report, rows), report)
+        plan = engine.plan(question, frames[report])
+        got = plan["op"] if plan else None
+        ok = got == expected
+        failures += not ok
+        if verbose or not ok:
+            print(f"{'✅' if ok else '❌'} {report} | {question!r}: {got or 'LLM'} (expected {expected or 'LLM'})")
+    return failures
+
+
+def check_tables(verbose):
+    report, data, expected = RAGGED_REPORT
+    table_gen = TableGenerator()
+    table = table_gen.to_table_json(table_gen.build_frame(data, report))
+    try:
+        json.dumps(table, allow_nan=False)  # what the API response does
+        ok = table["rows"] == expected
+    except ValueError:
+        ok = False
+    if verbose or not ok:
+        print(f"{'✅' if ok else '❌'} ragged {report!r}: {table['rows']} (expected {expected})")
+    return 0 if ok else 1
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail when the deterministic answer path answers what it shouldn't.")
+    parser.add_argument("--rows", type=int, default=300, help="Rows per fixture report")
+    parser.add_argument("--seed", type=int, default=42)
+    parser.add_argument("--verbose", action="store_true", help="List passing cases too")
+    args = parser.parse_args(argv)
+
+    fixtures = TallyFixtureGenerator(seed=args.seed)
+    failures = check_planner(fixtures, args.rows, args.verbose)
+    print(f"{'✅' if not failures else '❌'} query planner: {len(PLANNER_CASES) - failures}/{len(PLANNER_CASES)} cases")
+    table_failures = check_tables(args.verbose)
+    print(f"{'✅' if not table_failures else '❌'} table json: ragged report")
+    return 0 if not failures + table_failures else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
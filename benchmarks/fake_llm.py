@@ -0,0 +1,178 @@
+# benchmarks/fake_llm.py
+"""
+Deterministic stand-ins for Gemini, used by the load-test harness.
+
+- FakeReActChatModel replaces `ChatGoogleGenerativeAI`. It answers the
+  SupervisorAgent ReAct prompt with one tool call followed by a Final Answer,
+  and answers the chart prompt with a canned `draw()` function. Batched
+  prompts from the LLM gateway get a JSON array with one answer per task.
+- FakeGenerativeModel replaces `genai.GenerativeModel` for the summarizer.
+
+Call `install_fakes()` before the first chat. The clients are built on first
+use and look the classes up on their modules at that point, so installing the
+fakes right after importing `api` / `SupervisorAgent` works too; installing
+them before the import is still the safest order.
+"""
+import json
+import os
+import re
+import sys
+import time
+import types
+from typing import Any, List, Optional
+
+from langchain_core.language_models.chat_models import BaseChatModel
+from langchain_core.messages import AIMessage, BaseMessage
+from langchain_core.outputs import ChatGeneration, ChatResult
+
+from tools.llm_gateway import get_llm_gateway, split_batch_prompt
+
+# Canned extraction code. Handles vouchers (Day Book) and DSP* parallel lists.
+CANNED_CHART_CODE = '''```python
+def draw():
+    def first_number(node):
+        if isinstance(node, dict):
+            for x in node.values():
+                found = first_number(x)
+                if found is not None: return found
+        elif isinstance(node, str):
+            try: return abs(float(node.replace(",", "")))
+            except ValueError: return None
+        return None
+
+    chart_data = {}
+    data = raw_data if isinstance(raw_data, dict) else {}
+    msgs = data.get("REQUESTDATA", {}).get("TALLYMESSAGE", [])
+    if isinstance(msgs, dict): msgs = [msgs]
+    for m in msgs:
+        name = m.get("VOUCHER", {}).get("VOUCHERTYPENAME", "Other")
+        chart_data[name] = chart_data.get(name, 0) + 1
+    if not chart_data:
+        names = data.get("DSPACCNAME", [])
+        infos = data.get("DSPSTKINFO") or data.get("DSPACCINFO") or []
+        for n, info in zip(names[:8], infos[:8]):
+            chart_data[str(n.get("DSPDISPNAME", "?"))] = first_number(info) or 0.0
+    return plotter.create_bar_chart(chart_data, "Load Test Chart")
+```'''
+
+REPORT_KEYWORDS = [
+    ("stock", "Stock Summary"),
+    ("inventory", "Stock Summary"),
+    ("trial", "Trial Balance"),
+    ("sales", "Sales Register"),
+    ("balance sheet", "Balance Sheet"),
+    ("profit", "Profit & Loss A/c"),
+]
+
+# A tool observation, as opposed to the "Observation: the result of the action" template line
+_OBSERVATION_RE = re.compile(r"Observation: (?!the result of the action)(.*?)(?:\nThought:|\Z)", re.DOTALL)
+
+
+def _sleep_ms(env_var: str):
+    delay = float(os.getenv(env_var, "0") or 0)
+    if delay > 0:
+        time.sleep(delay / 1000.0)
+
+
+def _pick_report(question: str) -> str:
+    q = question.lower()
+    for kw, report in REPORT_KEYWORDS:
+        if kw in q: return report
+    return "Day Book"
+
+
+def _pick_tool(question: str) -> str:
+    q = question.lower()
+    if any(k in q for k in ("chart", "plot", "graph", "pie", "bar")): return "analyze_visual"
+    if "table" in q: return "analyze_table"
+    return "analyze_text_only"
+
+
+def fake_react_step(prompt: str) -> str:
+    """Returns the next ReAct step for the SupervisorAgent prompt."""
+    observations = _OBSERVATION_RE.findall(prompt)
+    if observations:
+        obs = observations[-1].strip()
+        tags = re.findall(r"\[(?:Charts|Tables)\]: .*", obs)
+        body = re.sub(r"\[(?:Charts|Tables)\]: .*", "", obs)
+        answer = " ".join(body.split())[:300]
+        for tag in tags: answer += "\n" + tag
+        return f"Thought: I now know the final answer\nFinal Answer: {answer}"
+
+    q_match = re.search(r"User Question: (.*)", prompt)
+    question = q_match.group(1).strip() if q_match else "summary"
+    c_match = re.search(r"Active Company is '(.*?)'", prompt)
+    company = c_match.group(1) if c_match else "Unknown"
+
+    payload = {"company": company, "query": question, "report_type": _pick_report(question)}
+    return (f"Thought: I should fetch the data.\n"
+            f"Action: {_pick_tool(question)}\n"
+            f"Action Input: {json.dumps(payload)}")
+
+
+class FakeReActChatModel(BaseChatModel):
+    """Drop-in for ChatGoogleGenerativeAI. Accepts (and ignores) its constructor args."""
+    model: str = "fake-gemini"
+    google_api_key: Optional[Any] = None
+    temperature: Optional[float] = 0
+
+    @property
+    def _llm_type(self) -> str:
+        return "fake-react"
+
+    def _generate(self, messages: List[BaseMessage], stop: Optional[List[str]] = None,
+                  run_manager=None, **kwargs) -> ChatResult:
+        _sleep_ms("FAKE_LLM_LATENCY_MS")
+        prompt = "\n".join(str(m.content) for m in messages)
+        tasks = split_batch_prompt(prompt)
+        if tasks:
+            text = json.dumps([self._answer(task) for task in tasks])
+        else:
+            text = self._answer(prompt)
+        return ChatResult(generations=[ChatGeneration(message=AIMessage(content=text))])
+
+    @staticmethod
+    def _answer(prompt: str) -> str:
+        if "Data Visualization Expert" in prompt:
+            return CANNED_CHART_CODE
+        return fake_react_step(prompt)
+
+
+class _FakeResponse:
+    def __init__(self, text: str):
+        self.text = text
+
+
+class FakeGenerativeModel:
+    """Drop-in for genai.GenerativeModel used by SummarizerAgent."""
+    def __init__(self, model_name: str = "fake-gemini", **kwargs):
+        self.model_name = model_name
+
+    def generate_content(self, contents, **kwargs):
+        _sleep_ms("FAKE_LLM_LATENCY_MS")
+        parts = contents if isinstance(contents, list) else [contents]
+        query = next((p for p in parts if isinstance(p, str) and p.startswith("User Query:")), "User Query: ?")
+        images = sum(1 for p in parts if not isinstance(p, str))
+        return _FakeResponse(f"Fake analysis for '{query[12:].strip()}' ({images} image(s)).")
+
+
+def _fake_vector_store():
+    """Keyword lookup instead of Chroma + sentence-transformers (no model download)."""
+    module = types.ModuleType("vector_store")
+    module.get_best_report = _pick_report
+    module.setup_vector_db = lambda: None
+    return module
+
+
+def install_fakes(fake_lookup: bool = True):
+    """Patches Gemini clients (and optionally the vector lookup) in-process."""
+    import langchain_google_genai
+    import google.generativeai as genai
+
+    langchain_google_genai.ChatGoogleGenerativeAI = FakeReActChatModel
+    genai.GenerativeModel = FakeGenerativeModel
+    genai.configure = lambda *args, **kwargs: None
+    get_llm_gateway().reset_clients()  # clients built before this point were real ones
+    if fake_lookup:
+        sys.modules["vector_store"] = _fake_vector_store()
+    os.environ.setdefault("GEMINI_API_KEY", "fake-key")
@@ -0,0 +1,110 @@
+# benchmarks/load_chat.py
+"""
+Concurrent load driver for the `/chat` endpoint.
+
+For each concurrency level, fires `--requests` POSTs with that many in flight
+and reports throughput, p50/p95/p99 latency and error rate.
+
+    python benchmarks/load_chat.py --url http://localhost:8000 --concurrency 1 4 16 --requests 50
+"""
+import argparse
+import http.client
+import json
+import os
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+DEFAULT_QUERIES = [
+    "What is the total debit for today?",
+    "Show me a bar chart of stock summary",
+    "Show the trial balance as a table",
+    "Summarize today's day book",
+    "Pie chart of sales",
+]
+
+
+def _percentile(sorted_vals, pct):
+    if not sorted_vals: return None
+    k = (len(sorted_vals) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(sorted_vals) - 1)
+    return sorted_vals[lo] + (sorted_vals[hi] - sorted_vals[lo]) * (k - lo)
+
+
+def _post_chat(url, query, timeout):
+    """Returns (latency_seconds, ok, error_message)."""
+    body = json.dumps({"query": query, "chat_history": []}).encode("utf-8")
+    req = urllib.request.Request(f"{url.rstrip('/')}/chat", data=body,
+                                 headers={"Content-Type": "application/json"})
+    t0 = time.perf_counter()
+    try:
+        with urllib.request.urlopen(req, timeout=timeout) as resp:
+            payload = json.loads(resp.read().decode("utf-8"))
+        latency = time.perf_counter() - t0
+        if payload.get("status") != "success":
+            return latency, False, payload.get("response_text", "status != success")[:200]
+        return latency, True, None
+    except (OSError, http.client.HTTPException, ValueError) as e:
+        # OSError covers URLError, timeouts and resets; HTTPException covers IncompleteRead, RemoteDisconnected
+        return time.perf_counter() - t0, False, f"{type(e).__name__}: {e}"[:200]
+
+
+def run_level(url, concurrency, total, queries, timeout):
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        futures = [pool.submit(_post_chat, url, queries[i % len(queries)], timeout) for i in range(total)]
+        results = [f.result() for f in futures]
+    wall = time.perf_counter() - started
+
+    latencies = sorted(r[0] for r in results)
+    errors = [r[2] for r in results if not r[1]]
+    return {
+        "concurrency": concurrency,
+        "requests": total,
+        "wall_seconds": wall,
+        "throughput_rps": total / wall if wall else 0.0,
+        "p50_ms": _percentile(latencies, 50) * 1000,
+        "p95_ms": _percentile(latencies, 95) * 1000,
+        "p99_ms": _percentile(latencies, 99) * 1000,
+        "error_rate": len(errors) / total if total else 0.0,
+        "sample_errors": sorted(set(errors))[:5],
+    }
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Load test the /chat endpoint.")
+    parser.add_argument("--url", default="http://localhost:8000")
+    parser.add_argument("--concurrency", nargs="+", type=int, default=[1, 4, 16])
+    parser.add_argument("--requests", type=int, default=50, help="Requests per concurrency level")
+    parser.add_argument("--timeout", type=float, default=120.0)
+    parser.add_argument("--queries-file", default=None, help="One query per line")
+    parser.add_argument("--out", default=None, help="Results file (default: bench_results/load_<timestamp>.json)")
+    args = parser.parse_args(argv)
+
+    queries = DEFAULT_QUERIES
+    if args.queries_file:
+        with open(args.queries_file, "r", encoding="utf-8") as f:
+            queries = [line.strip() for line in f if line.strip()]
+
+    levels = []
+    print(f"{'conc':>5} {'rps':>8} {'p50 ms':>10} {'p95 ms':>10} {'p99 ms':>10} {'errors':>8}")
+    for c in args.concurrency:
+        res = run_level(args.url, c, args.requests, queries, args.timeout)
+        levels.append(res)
+        print(f"{c:>5} {res['throughput_rps']:>8.2f} {res['p50_ms']:>10.0f} {res['p95_ms']:>10.0f} "
+              f"{res['p99_ms']:>10.0f} {res['error_rate']:>7.1%}")
+
+    out_path = args.out or os.path.join(ROOT, "bench_results", f"load_{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump({"meta": {"url": args.url, "timestamp": datetime.now().isoformat(timespec="seconds")},
+                   "levels": levels}, f, indent=2)
+    print(f"\n💾 Results written to {out_path}")
+    return levels
+
+
+if __name__ == "__main__":
+    main()
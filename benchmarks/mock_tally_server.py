@@ -0,0 +1,253 @@
+# benchmarks/mock_tally_server.py
+"""
+A local stand-in for the Tally Prime XML HTTP interface.
+
+Answers Export Data requests with reports from `TallyFixtureGenerator`,
+after a configurable latency, so `get_report` can be loaded without Tally.
+Inline-TDL collection requests (tools/tdl_requests) are answered too: the
+Ledger / StockItem / Voucher objects of the same fixtures, after the request's
+CHILDOF, group, name, AlterID, voucher-type, date and ledger/item filters,
+with only the FETCHed fields.
+
+    python benchmarks/mock_tally_server.py --port 9100 --rows 5000 --latency-ms 300
+    set TALLY_HTTP_HOST=http://localhost:9100
+"""
+import os
+import random
+import re
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+from benchmarks.tally_fixtures import BANKS, ITEMS, PARTIES, UNITS, TallyFixtureGenerator, _escape
+
+# Reports without a dedicated fixture are served in the closest available shape
+REPORT_SHAPES = {
+    "Day Book": "Day Book",
+    "Sales Register": "Day Book",
+    "Stock Summary": "Stock Summary",
+    "Trial Balance": "Trial Balance",
+}
+DEFAULT_SHAPE = "Trial Balance"
+DEFAULT_COMPANIES = ["Modi Chemplast Materials Pvt Ltd", "Bench Trading Co"]
+
+# $$IsSales:$VoucherTypeName etc. -> the fixture's voucher type
+VOUCHER_CLASSES = {"Sales": "Sales", "Purchase": "Purchase", "Receipt": "Receipt", "Payment": "Payment",
+                   "Journal": "Journal", "Contra": "Contra", "CreditNote": "Credit Note", "DebitNote": "Debit Note"}
+_VOUCHER_CHUNK_RE = re.compile(r"<VOUCHER .*?</VOUCHER>", re.DOTALL)
+
+
+class MockTallyConfig:
+    def __init__(self, rows=1000, latency_ms=0.0, jitter_ms=0.0, encoding="utf-16",
+                 report_rows=None, companies=None, seed=42):
+        self.rows = rows
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.encoding = encoding
+        self.report_rows = report_rows or {}
+        self.companies = companies or list(DEFAULT_COMPANIES)
+        self.generator = TallyFixtureGenerator(seed=seed)
+        self._cache = {}
+        self._lock = threading.Lock()
+        self.request_count = 0
+        self.alter_id = 1000  # bump with touch() to simulate a new voucher
+        self._masters = None
+        self.extra_masters = []  # add_master() simulates a new ledger / item
+
+    def payload_for(self, report: str) -> bytes:
+        shape = REPORT_SHAPES.get(report, DEFAULT_SHAPE)
+        rows = self.report_rows.get(report, self.rows)
+        key = (shape, rows)
+        with self._lock:
+            if key not in self._cache:
+                self._cache[key] = self.generator.render(shape, rows, self.encoding)
+            return self._cache[key]
+
+    # --- COLLECTIONS (inline TDL) ---
+    def collection(self, body: str) -> bytes:
+        definition = re.search(r"<COLLECTION [^>]*>(.*?)</COLLECTION>", body, re.DOTALL)
+        definition = definition.group(1) if definition else ""
+
+        def tag(name, text=definition):
+            m = re.search(rf"<{name}>(.*?)</{name}>", text, re.DOTALL)
+            return m.group(1).strip().replace("&amp;", "&") if m else ""
+
+        fetch = [f.strip().upper() for f in tag("FETCH").split(",") if f.strip()]
+        formulas = " ".join(re.findall(r'<SYSTEM TYPE="Formulae"[^>]*>(.*?)</SYSTEM>', body, re.DOTALL))
+        formulas = formulas.replace("&quot;", '"').replace("&amp;", "&").replace("&gt;", ">").replace("&lt;", "<")
+        object_type = tag("TYPE")
+        if object_type in ("Ledger", "StockItem"):
+            groups = ([tag("CHILDOF")] if tag("CHILDOF") else []) + re.findall(r'\$\$IsBelongsTo:"(.*?)"', formulas)
+            names = re.findall(r'\$Name = "(.*?)"', formulas)
+            after = re.search(r"\$AlterID > (\d+)", formulas)
+            objects = self._master_objects(object_type, groups, names, int(after.group(1)) if after else 0, fetch)
+        else:
+            types = {VOUCHER_CLASSES.get(c, c) for c in re.findall(r"\$\$Is(\w+):\$VoucherTypeName", formulas)}
+            dated = "##SVFromDate" in formulas
+            involving = ([f"<LEDGERNAME>{_escape(n)}</LEDGERNAME>" for n in re.findall(r'\$LedgerName = "(.*?)"', formulas)]
+                         + [f"<STOCKITEMNAME>{_escape(n)}</STOCKITEMNAME>" for n in re.findall(r'\$StockItemName = "(.*?)"', formulas)])
+            objects = self._voucher_objects(types, tag("SVFROMDATE", body) if dated else "",
+                                            tag("SVTODATE", body) if dated else "", fetch, involving)
+        xml = ("<ENVELOPE><HEADER><VERSION>1</VERSION><STATUS>1</STATUS></HEADER>"
+               f"<BODY><DESC></DESC><DATA><COLLECTION>{''.join(objects)}</COLLECTION></DATA></BODY></ENVELOPE>")
+        return (b"\xff\xfe" + xml.encode("utf-16-le")) if self.encoding == "utf-16" else xml.encode(self.encoding)
+
+    def masters(self) -> list:
+        """Ledger and stock item masters: the Trial Balance ledgers, Day Book parties/banks and fixture items."""
+        with self._lock:
+            if self._masters is None:
+                rows = self.report_rows.get("Trial Balance", self.rows)
+                masters = []
+
+                def add(object_type, name, parent, **fields):
+                    masters.append({"type": object_type, "name": name, "parent": parent, "alter_id": len(masters) + 1,
+                                    "guid": f"mock-{object_type}-{len(masters) + 1}", **fields})
+
+                for name, group, amt, is_dr in self.generator.ledger_rows(rows):
+                    add("Ledger", name, group, CLOSINGBALANCE=f"{'-' if is_dr else ''}{amt:.2f}")
+                rnd = random.Random(f"{self.generator.seed}:masters")
+                for bank in BANKS:
+                    add("Ledger", bank, "Cash-in-Hand" if bank == "Cash" else "Bank Accounts",
+                        CLOSINGBALANCE=f"-{rnd.uniform(1000, 2500000):.2f}")
+                for group in ("Sales Accounts", "Purchase Accounts", "Indirect Expenses"): add("Ledger", group, group)
+                for party in PARTIES:
+                    for i in range(min(self.report_rows.get("Day Book", self.rows), 500)):
+                        add("Ledger", f"{party} {i}", "Sundry Debtors")
+                for item in ITEMS:
+                    unit, qty, rate = rnd.choice(UNITS), rnd.randint(0, 5000), round(rnd.uniform(10, 900), 2)
+                    add("StockItem", item, "Raw Materials", BASEUNITS=unit, CLOSINGBALANCE=f"{qty} {unit}",
+                        CLOSINGRATE=f"{rate:.2f}/{unit}", CLOSINGVALUE=f"-{qty * rate:.2f}")
+                self._masters = masters
+            return self._masters + self.extra_masters
+
+    def master_alter_id(self) -> int:
+        return max((m["alter_id"] for m in self.masters()), default=0)
+
+    def add_master(self, object_type: str, name: str, parent: str, **fields):
+        """A new ledger / stock item (next master AlterID), as if just created in Tally."""
+        alter_id = self.master_alter_id() + 1
+        with self._lock:
+            self.extra_masters.append({"type": object_type, "name": name, "parent": parent, "alter_id": alter_id,
+                                       "guid": f"mock-{object_type}-{alter_id}", **fields})
+
+    def _master_objects(self, object_type, groups, names, after, fetch):
+        for m in self.masters():
+            if m["type"] != object_type or m["alter_id"] <= after: continue
+            if groups and m["parent"] not in groups: continue
+            if names and m["name"] not in names: continue
+            fields = {"PARENT": f'<PARENT TYPE="String">{m["parent"]}</PARENT>',
+                      "GUID": f'<GUID TYPE="String">{m["guid"]}</GUID>',
+                      "ALTERID": f'<ALTERID TYPE="Number"> {m["alter_id"]}</ALTERID>'}
+            fields.update({k: f"<{k}>{v}</{k}>" for k, v in m.items() if k.isupper()})
+            tag = object_type.upper()
+            yield f'<{tag} NAME="{m["name"]}" RESERVEDNAME="">' + "".join(v for k, v in fields.items() if k in fetch) + f"</{tag}>"
+
+    def _voucher_objects(self, types, from_date, to_date, fetch, involving=()):
+        top = [f for f in fetch if "." not in f]
+        subs = {}
+        for f in fetch:
+            if "." in f:
+                collection, field = f.split(".", 1)
+                subs.setdefault(f"{collection}.LIST", []).append(field)
+        rows = self.report_rows.get("Day Book", self.rows)
+        for chunk in self.generator.iter_report("Day Book", rows):
+            for voucher in _VOUCHER_CHUNK_RE.findall(chunk):
+                vtype = re.search(r"<VOUCHERTYPENAME>(.*?)</", voucher).group(1)
+                vdate = re.search(r"<DATE>(.*?)</", voucher).group(1)
+                if types and vtype not in types: continue
+                if (from_date and vdate < from_date) or (to_date and vdate > to_date): continue
+                if involving and not any(line in voucher for line in involving): continue
+                parts = [f"<{f}>{m.group(1)}</{f}>" for f in top
+                         for m in [re.search(rf"<{f}>(.*?)</{f}>", voucher, re.DOTALL)] if m]
+                for list_tag, fields in subs.items():
+                    for entry in re.findall(rf"<{re.escape(list_tag)}>(.*?)</{re.escape(list_tag)}>", voucher, re.DOTALL):
+                        kept = [f"<{f}>{m.group(1)}</{f}>" for f in fields
+                                for m in [re.search(rf"<{f}>(.*?)</{f}>", entry, re.DOTALL)] if m]
+                        parts.append(f"<{list_tag}>{''.join(kept)}</{list_tag}>")
+                yield f'<VOUCHER VCHTYPE="{vtype}">' + "".join(parts) + "</VOUCHER>"
+
+    def company_list(self) -> bytes:
+        body = "".join(f"<COMPANY NAME=\"{c}\"><NAME>{c}</NAME></COMPANY>" for c in self.companies)
+        xml = f"<ENVELOPE><BODY><DATA><COLLECTION>{body}</COLLECTION></DATA></BODY></ENVELOPE>"
+        return xml.encode("utf-8")
+
+    def touch(self):
+        with self._lock:
+            self.alter_id += 1
+
+    def alter_ids(self, company: str) -> bytes:
+        body = f"<COMPANY NAME=\"{company}\"><ALTVCHID>{self.alter_id}</ALTVCHID><ALTMSTID>{self.master_alter_id()}</ALTMSTID></COMPANY>"
+        return f"<ENVELOPE><BODY><DATA><COLLECTION>{body}</COLLECTION></DATA></BODY></ENVELOPE>".encode("utf-8")
+
+
+def _make_handler(config: MockTallyConfig):
+    class MockTallyHandler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            length = int(self.headers.get("Content-Length") or 0)
+            body = self.rfile.read(length).decode("utf-8", errors="replace")
+            with config._lock:
+                config.request_count += 1
+
+            delay = config.latency_ms + random.uniform(0, config.jitter_ms)
+            if delay > 0:
+                time.sleep(delay / 1000.0)
+
+            if "List of Companies" in body:
+                payload = config.company_list()
+            elif "Company AlterIDs" in body:
+                company = re.search(r"<SVCurrentCompany>(.*?)</SVCurrentCompany>", body, re.DOTALL)
+                payload = config.alter_ids(company.group(1).strip() if company else "")
+            elif "<TYPE>Collection</TYPE>" in body and "<TDL>" in body:
+                payload = config.collection(body)
+            else:
+                match = re.search(r"<REPORTNAME>(.*?)</REPORTNAME>", body, re.DOTALL)
+                if not match:
+                    payload = b"<RESPONSE>Unknown Request, cannot be processed</RESPONSE>"
+                else:
+                    report = match.group(1).strip().replace("&amp;", "&")
+                    payload = config.payload_for(report)
+
+            self.send_response(200)
+            self.send_header("Content-Type", "text/xml")
+            self.send_header("Content-Length", str(len(payload)))
+            self.end_headers()
+            self.wfile.write(payload)
+
+        def log_message(self, format, *args):
+            pass  # Keep load-test output readable
+
+    return MockTallyHandler
+
+
+def start_mock_tally(port: int = 9100, host: str = "127.0.0.1", **config_kwargs):
+    """Starts the mock server on a daemon thread. Returns (server, config)."""
+    config = MockTallyConfig(**config_kwargs)
+    server = ThreadingHTTPServer((host, port), _make_handler(config))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, config
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Mock Tally Prime XML server.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=9100)
+    parser.add_argument("--rows", type=int, default=1000, help="Rows per report")
+    parser.add_argument("--latency-ms", type=float, default=0.0)
+    parser.add_argument("--jitter-ms", type=float, default=0.0)
+    parser.add_argument("--encoding", default="utf-16", choices=["utf-16", "utf-8"])
+    args = parser.parse_args()
+
+    server, _ = start_mock_tally(args.port, args.host, rows=args.rows, latency_ms=args.latency_ms,
+                                 jitter_ms=args.jitter_ms, encoding=args.encoding)
+    print(f"🧪 Mock Tally listening on http://{args.host}:{args.port} (rows={args.rows}, latency={args.latency_ms}ms)")
+    try:
+        while True: time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
@@ -0,0 +1,220 @@
+# benchmarks/run_benchmarks.py
+"""
+Micro-benchmarks for the Tally fetch -> table/chart pipeline.
+
+Every stage runs on the output of the previous one, exactly as in
+`get_report` and `TableGenerator`, so timings are comparable between commits:
+
+    decode -> clean_tally_xml -> ET.fromstring -> xml_to_dict
+           -> table parsing (report_parsers registry, and the generic
+              _parse_tally_vouchers / _find_longest_list / _flatten_row fallback)
+           -> chart rendering (create_bar_chart / create_pie_chart)
+
+Usage:
+    python benchmarks/run_benchmarks.py --rows 1000 100000
+    python benchmarks/run_benchmarks.py --rows 1000 --compare bench_results/<old>.json
+"""
+import argparse
+import gc
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import time
+import tracemalloc
+import xml.etree.ElementTree as ET
+from datetime import datetime
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+# The chart tool builds its LLM client on construction; no call is ever made here.
+os.environ.setdefault("GEMINI_API_KEY", "benchmark-offline")
+
+from benchmarks.tally_fixtures import REPORTS, TallyFixtureGenerator
+from tools.get_report_tool import clean_tally_xml, decode_tally_bytes, xml_to_dict
+from tools.table_generator import TableGenerator
+from tools.report_parsers import _voucher_messages, parse_report
+from tools.voucher_batch import voucher_amounts
+from tools.chart_vlm_tool import generate_vlm_charts
+
+
+# --- STAGE HELPERS ---
+def _unwrap(data_dict):
+    """Mirrors the BODY/IMPORTDATA unwrapping at the end of get_report."""
+    if "BODY" in data_dict and "IMPORTDATA" in data_dict["BODY"]:
+        return data_dict["BODY"]["IMPORTDATA"]
+    return data_dict
+
+def _table_rows(gen, data):
+    """Same strategy chain as TableGenerator.generate_table (minus rendering)."""
+    return gen.build_rows(data)
+
+def _chart_data(rows, limit):
+    """Builds a {label: value} dict the way the LLM-written draw() code typically does."""
+    out = {}
+    for row in rows[:limit]:
+        label, value = None, None
+        for k, v in row.items():
+            if label is None and ("Name" in k or "Particulars" in k): label = str(v)
+            elif value is None and any(x in k for x in ("Amount", "Debit", "Credit")):
+                try: value = abs(float(str(v).replace(",", "")))
+                except: pass
+        if label is not None and value is not None:
+            out[label] = out.get(label, 0.0) + value
+    return out
+
+
+def _measure(fn, arg, repeat, track_memory):
+    """Returns (result, stats) for a single stage."""
+    timings = []
+    result = None
+    for _ in range(repeat):
+        gc.collect()
+        t0 = time.perf_counter()
+        result = fn(arg)
+        timings.append(time.perf_counter() - t0)
+
+    stats = {
+        "seconds_min": min(timings),
+        "seconds_median": statistics.median(timings),
+        "runs": repeat,
+    }
+    if track_memory:
+        gc.collect()
+        tracemalloc.start()
+        fn(arg)
+        stats["peak_bytes"] = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+    return result, stats
+
+
+def run_case(report, rows, encoding, args, fixtures, table_gen, plotter):
+    path = fixtures.write(report, rows, args.fixture_dir, encoding)
+    with open(path, "rb") as f:
+        content = f.read()
+
+    print(f"⏱️  {report} | rows={rows:,} | {encoding} | {len(content) / 1e6:.1f} MB")
+    stages = {}
+
+    def stage(name, fn, arg):
+        res, stats = _measure(fn, arg, args.repeat, not args.no_memory)
+        stages[name] = stats
+        mem = f" | peak {stats['peak_bytes'] / 1e6:,.1f} MB" if "peak_bytes" in stats else ""
+        print(f"   {name:<22} {stats['seconds_median'] * 1000:>10.1f} ms{mem}")
+        return res
+
+    text = stage("decode", decode_tally_bytes, content)
+    text = stage("clean_tally_xml", clean_tally_xml, text)
+    root = stage("et_fromstring", ET.fromstring, text)
+    data = stage("xml_to_dict", lambda r: _unwrap(xml_to_dict(r)), root)
+    del root
+
+    stage("report_parser", lambda d: parse_report(d, report), data)
+
+    if report == "Day Book":
+        vouchers = [m["VOUCHER"] for m in _voucher_messages(data) if isinstance(m, dict) and m.get("VOUCHER")]
+        stage("voucher_amounts", voucher_amounts, vouchers)
+        rows_out = stage("parse_tally_vouchers", table_gen._parse_tally_vouchers, data)
+    else:
+        main_list = stage("find_longest_list", table_gen._find_longest_list, data)
+        rows_out = stage("flatten_rows", lambda lst: [table_gen._flatten_row(r) for r in lst], main_list)
+    rows_out = rows_out or _table_rows(table_gen, data)
+
+    if not args.skip_charts:
+        chart_data = _chart_data(rows_out, args.max_chart_items)
+        stage("create_bar_chart", lambda d: plotter.create_bar_chart(d, f"{report} (bench)"), chart_data)
+        stage("create_pie_chart", lambda d: plotter.create_pie_chart(d, f"{report} (bench)"), chart_data)
+
+    return {
+        "report": report,
+        "rows": rows,
+        "encoding": encoding,
+        "bytes": len(content),
+        "table_rows": len(rows_out or []),
+        "stages": stages,
+    }
+
+
+def _git_commit():
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=ROOT,
+                             capture_output=True, text=True, timeout=10)
+        return out.stdout.strip() or None
+    except Exception:
+        return None
+
+
+def compare(current, baseline_path):
+    """Prints a per-stage speed ratio against an earlier results file."""
+    with open(baseline_path, "r", encoding="utf-8") as f:
+        baseline = json.load(f)
+
+    index = {(r["report"], r["rows"], r["encoding"]): r for r in baseline.get("results", [])}
+    print(f"\n📊 Compared with {baseline_path} ({baseline.get('meta', {}).get('commit')})")
+    for res in current["results"]:
+        old = index.get((res["report"], res["rows"], res["encoding"]))
+        if not old: continue
+        print(f"   {res['report']} | rows={res['rows']:,} | {res['encoding']}")
+        for name, stats in res["stages"].items():
+            old_stats = old["stages"].get(name)
+            if not old_stats: continue
+            new_t, old_t = stats["seconds_median"], old_stats["seconds_median"]
+            ratio = old_t / new_t if new_t else float("inf")
+            print(f"     {name:<22} {old_t * 1000:>10.1f} -> {new_t * 1000:>10.1f} ms  ({ratio:.2f}x)")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the Tally XML -> table/chart pipeline.")
+    parser.add_argument("--reports", nargs="+", default=list(REPORTS), choices=list(REPORTS))
+    parser.add_argument("--rows", nargs="+", type=int, default=[1000],
+                        help="Row counts per report, e.g. 1000 100000 1000000")
+    parser.add_argument("--encodings", nargs="+", default=["utf-16"], choices=["utf-16", "utf-8"])
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--no-memory", action="store_true", help="Skip the tracemalloc pass (faster on 1M rows)")
+    parser.add_argument("--skip-charts", action="store_true")
+    parser.add_argument("--max-chart-items", type=int, default=5000,
+                        help="Cap on items handed to the chart renderers")
+    parser.add_argument("--fixture-dir", default=os.path.join(ROOT, "bench_fixtures"))
+    parser.add_argument("--out", default=None, help="Results file (default: bench_results/<timestamp>.json)")
+    parser.add_argument("--compare", default=None, help="Earlier results file to compare against")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args(argv)
+
+    fixtures = TallyFixtureGenerator(seed=args.seed)
+    table_gen = TableGenerator()
+    plotter = generate_vlm_charts()
+
+    results = []
+    for report in args.reports:
+        for rows in args.rows:
+            for encoding in args.encodings:
+                results.append(run_case(report, rows, encoding, args, fixtures, table_gen, plotter))
+
+    output = {
+        "meta": {
+            "timestamp": datetime.now().isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "args": vars(args),
+        },
+        "results": results,
+    }
+
+    out_path = args.out or os.path.join(ROOT, "bench_results", f"{datetime.now():%Y%m%d_%H%M%S}.json")
+    os.makedirs(os.path.dirname(out_path) or ".", exist_ok=True)
+    with open(out_path, "w", encoding="utf-8") as f:
+        json.dump(output, f, indent=2)
+    print(f"\n💾 Results written to {out_path}")
+
+    if args.compare:
+        compare(output, args.compare)
+    return output
+
+
+if __name__ == "__main__":
+    main()
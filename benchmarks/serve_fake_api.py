@@ -0,0 +1,48 @@
+# benchmarks/serve_fake_api.py
+"""
+Runs the real `api.py` app against the mock Tally server and fake Gemini.
+
+    python benchmarks/serve_fake_api.py --port 8000 --tally-latency-ms 300 --llm-latency-ms 800
+    python benchmarks/load_chat.py --url http://localhost:8000 --concurrency 1 4 16
+"""
+import argparse
+import os
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT not in sys.path:
+    sys.path.append(ROOT)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve api.py with mock Tally + fake LLM.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8000)
+    parser.add_argument("--tally-port", type=int, default=9100)
+    parser.add_argument("--tally-rows", type=int, default=1000)
+    parser.add_argument("--tally-latency-ms", type=float, default=200.0)
+    parser.add_argument("--tally-jitter-ms", type=float, default=50.0)
+    parser.add_argument("--llm-latency-ms", type=float, default=500.0)
+    parser.add_argument("--real-lookup", action="store_true",
+                        help="Use the Chroma report lookup instead of keyword matching")
+    args = parser.parse_args()
+
+    from benchmarks.mock_tally_server import start_mock_tally
+    start_mock_tally(args.tally_port, rows=args.tally_rows,
+                     latency_ms=args.tally_latency_ms, jitter_ms=args.tally_jitter_ms)
+
+    # Must be set before the tools are imported (they read it at import time)
+    os.environ["TALLY_HTTP_HOST"] = f"http://127.0.0.1:{args.tally_port}"
+    os.environ["FAKE_LLM_LATENCY_MS"] = str(args.llm_latency_ms)
+
+    from benchmarks.fake_llm import install_fakes
+    install_fakes(fake_lookup=not args.real_lookup)
+
+    import uvicorn
+    import api
+    print(f"🧪 Fake API on http://{args.host}:{args.port} | Tally mock :{args.tally_port}")
+    uvicorn.run(api.app, host=args.host, port=args.port, log_level="warning")
+
+
+if __name__ == "__main__":
+    main()
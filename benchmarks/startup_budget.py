@@ -0,0 +1,93 @@
+# benchmarks/startup_budget.py
+"""
+Import-time profile and budget check for the service entry points.
+
+Each target is imported in a fresh interpreter with `-X importtime`. The
+script prints the wall time and the slowest imports, and exits non-zero when
+a target goes over the budget or loads a module that should only load on
+first use (pandas, matplotlib, PIL, Chroma, the Gemini SDKs, ...).
+
+Usage:
+    python benchmarks/startup_budget.py
+    python benchmarks/startup_budget.py --targets api SupervisorAgent --budget-ms 1000 --top 15
+"""
+import argparse
+import json
+import os
+import re
+import subprocess
+import sys
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "1500"))
+
+# Loaded by the first request, never by `import api`
+DEFERRED_MODULES = (
+    "pandas", "matplotlib", "PIL", "chromadb", "sentence_transformers", "pyodbc",
+    "google.generativeai", "langchain_google_genai", "langchain_classic", "langgraph",
+)
+
+_IMPORTTIME_RE = re.compile(r"import time:\s+(\d+) \|\s+(\d+) \| ( *)(\S+)")
+
+_PROBE = """
+import json, sys, time
+t0 = time.perf_counter()
+import {target}
+elapsed = (time.perf_counter() - t0) * 1000
+print(json.dumps({{"ms": elapsed, "modules": sorted(sys.modules)}}))
+"""
+
+
+def profile(target):
+    """Imports `target` in a child interpreter -> (wall ms, loaded modules, [(cumulative us, module)])."""
+    env = dict(os.environ)
+    env.setdefault("GEMINI_API_KEY", "startup-budget-offline")
+    proc = subprocess.run([sys.executable, "-X", "importtime", "-c", _PROBE.format(target=target)],
+                          cwd=ROOT, env=env, capture_output=True, text=True, timeout=300)
+    if proc.returncode != 0:
+        tail = "\n".join(l for l in proc.stderr.splitlines() if not l.startswith("import time:"))[-2000:]
+        raise RuntimeError(f"import {target} failed:\n{tail}")
+
+    result = json.loads(proc.stdout.strip().splitlines()[-1])
+    top_level = []
+    for line in proc.stderr.splitlines():
+        m = _IMPORTTIME_RE.match(line)
+        if m: top_level.append((int(m.group(2)), len(m.group(3)) // 2, m.group(4)))
+    return result["ms"], set(result["modules"]), top_level
+
+
+def check(target, budget_ms, top, deferred):
+    elapsed, modules, timings = profile(target)
+    loaded = [m for m in deferred if m in modules]
+    ok = elapsed <= budget_ms and not loaded
+
+    print(f"{'✅' if ok else '❌'} import {target}: {elapsed:,.0f} ms (budget {budget_ms:,.0f} ms)")
+    # Direct imports of the target, slowest first
+    direct = sorted((t for t in timings if t[1] == 1), reverse=True)[:top]
+    for cumulative_us, _, name in direct:
+        print(f"   {cumulative_us / 1000:>8.1f} ms  {name}")
+    if loaded:
+        print(f"   ⚠️ loaded at import time (should be lazy): {', '.join(loaded)}")
+    return {"target": target, "ms": elapsed, "budget_ms": budget_ms, "eager_modules": loaded, "ok": ok}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fail when importing the service takes longer than the budget.")
+    parser.add_argument("--targets", nargs="+", default=["api", "SupervisorAgent"],
+                        help="Modules to import (app.py needs streamlit: use 'app')")
+    parser.add_argument("--budget-ms", type=float, default=STARTUP_BUDGET_MS)
+    parser.add_argument("--top", type=int, default=10, help="Slowest direct imports to list")
+    parser.add_argument("--allow", nargs="*", default=[], help="Deferred modules a target may load anyway")
+    parser.add_argument("--json", action="store_true", help="Print the results as JSON too")
+    args = parser.parse_args(argv)
+
+    deferred = [m for m in DEFERRED_MODULES if m not in args.allow]
+    results = [check(target, args.budget_ms, args.top, deferred) for target in args.targets]
+    if args.json:
+        print(json.dumps(results, indent=2))
+    return 0 if all(r["ok"] for r in results) else 1
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,199 @@
+# benchmarks/tally_fixtures.py
+"""
+Synthetic Tally XML generator for benchmarks and load tests.
+
+Produces the same shapes Tally Prime returns over the XML interface:
+- Day Book: ENVELOPE/BODY/IMPORTDATA/REQUESTDATA/TALLYMESSAGE/VOUCHER
+- Stock Summary: parallel DSPACCNAME / DSPSTKINFO lists
+- Trial Balance: parallel DSPACCNAME / DSPACCINFO lists
+
+Names are sprinkled with the dirty content real exports contain (raw '&',
+illegal numeric entities like &#4;, raw control bytes) so `clean_tally_xml`
+has real work to do. Output is deterministic for a given seed.
+"""
+import os
+import random
+from datetime import date, timedelta
+
+REPORTS = ("Day Book", "Stock Summary", "Trial Balance")
+
+PARTIES = ["Reliance Polymers", "M&M Traders", "Shree Ganesh Agencies", "Apex Chemicals",
+           "Bharat Plastics", "Sai Enterprises", "Om Industries", "Krishna & Sons",
+           "Global Resins", "Patel Brothers"]
+ITEMS = ["PVC Resin 50kg", "HDPE Granules", "LDPE Film Grade", "Calcium Carbonate",
+         "DOP Plasticizer", "Titanium Dioxide", "Stearic Acid", "CPW 52%"]
+UNITS = ["kg", "nos", "bag", "ltr"]
+LEDGER_GROUPS = ["Capital Account", "Sundry Debtors", "Sundry Creditors", "Bank Accounts",
+                 "Cash-in-Hand", "Sales Accounts", "Purchase Accounts", "Indirect Expenses",
+                 "Duties & Taxes", "Fixed Assets"]
+BANKS = ["HDFC Current A/c", "SBI CC A/c", "Cash"]
+
+# Dirty fragments as they appear in the *serialized* XML
+DIRTY_FRAGMENTS = ["&#4;", "&#x1F;", "\x04", "\x0b", "&#13;", "&#8377;"]
+
+
+def _escape(text: str) -> str:
+    """Escapes like Tally does: '<' and '>' only. Raw '&' is left in on purpose."""
+    return text.replace("<", "&lt;").replace(">", "&gt;")
+
+
+class TallyFixtureGenerator:
+    """Streams synthetic Tally reports to disk without holding them in memory."""
+
+    def __init__(self, seed: int = 42, dirty_ratio: float = 0.05):
+        self.seed = seed
+        self.dirty_ratio = dirty_ratio
+
+    # --- HELPER: Names ---
+    def _name(self, rnd, base: str, idx: int) -> str:
+        name = f"{base} {idx}"
+        if rnd.random() < self.dirty_ratio:
+            pos = rnd.randint(0, len(name))
+            name = name[:pos] + rnd.choice(DIRTY_FRAGMENTS) + name[pos:]
+        return _escape(name)
+
+    # --- REPORT WRITERS ---
+    def _day_book(self, rnd, rows):
+        yield ("<ENVELOPE><HEADER><TALLYREQUEST>Import Data</TALLYREQUEST></HEADER>"
+               "<BODY><IMPORTDATA><REQUESTDESC><REPORTNAME>Vouchers</REPORTNAME></REQUESTDESC>"
+               "<REQUESTDATA>")
+        start = date(2024, 4, 1)
+        vch_types = ["Sales", "Sales", "Purchase", "Receipt", "Payment", "Journal"]
+        for i in range(rows):
+            vtype = rnd.choice(vch_types)
+            vdate = (start + timedelta(days=i * 365 // max(rows, 1))).strftime("%Y%m%d")
+            party = self._name(rnd, rnd.choice(PARTIES), i % 500)
+            parts = [
+                f'<TALLYMESSAGE xmlns:UDF="TallyUDF"><VOUCHER VCHTYPE="{vtype}" ACTION="Create">',
+                f"<DATE>{vdate}</DATE><GUID>bench-{self.seed}-{i}</GUID>",
+                f"<ALTERID>{i + 1}</ALTERID><MASTERID>{i + 1}</MASTERID>",
+                f"<VOUCHERTYPENAME>{vtype}</VOUCHERTYPENAME><VOUCHERNUMBER>{i + 1}</VOUCHERNUMBER>",
+                f"<PARTYLEDGERNAME>{party}</PARTYLEDGERNAME>",
+            ]
+            total = 0.0
+            if vtype in ("Sales", "Purchase"):
+                for _ in range(rnd.randint(1, 3)):
+                    qty = rnd.randint(1, 500)
+                    rate = round(rnd.uniform(10, 900), 2)
+                    amt = round(qty * rate, 2)
+                    total += amt
+                    unit = rnd.choice(UNITS)
+                    sign = "" if vtype == "Sales" else "-"
+                    parts.append(
+                        "<ALLINVENTORYENTRIES.LIST>"
+                        f"<STOCKITEMNAME>{_escape(rnd.choice(ITEMS))}</STOCKITEMNAME>"
+                        f"<RATE>{rate:.2f}/{unit}</RATE><ACTUALQTY> {qty} {unit}</ACTUALQTY>"
+                        f"<AMOUNT>{sign}{amt:.2f}</AMOUNT>"
+                        "</ALLINVENTORYENTRIES.LIST>")
+                contra = f"{vtype} Accounts"
+            else:
+                total = round(rnd.uniform(100, 250000), 2)
+                contra = rnd.choice(BANKS) if vtype != "Journal" else "Indirect Expenses"
+            # Debit is negative in Tally voucher XML
+            dr_first = vtype in ("Sales", "Payment", "Journal")
+            first, second = (party, contra) if dr_first else (contra, party)
+            parts.append(
+                "<ALLLEDGERENTRIES.LIST>"
+                f"<LEDGERNAME>{first}</LEDGERNAME><ISDEEMEDPOSITIVE>Yes</ISDEEMEDPOSITIVE>"
+                f"<AMOUNT>-{total:.2f}</AMOUNT></ALLLEDGERENTRIES.LIST>"
+                "<ALLLEDGERENTRIES.LIST>"
+                f"<LEDGERNAME>{second}</LEDGERNAME><ISDEEMEDPOSITIVE>No</ISDEEMEDPOSITIVE>"
+                f"<AMOUNT>{total:.2f}</AMOUNT></ALLLEDGERENTRIES.LIST>")
+            parts.append("</VOUCHER></TALLYMESSAGE>")
+            yield "".join(parts)
+        yield "</REQUESTDATA></IMPORTDATA></BODY></ENVELOPE>"
+
+    def _stock_summary(self, rnd, rows):
+        yield "<ENVELOPE>"
+        for i in range(rows):
+            unit = rnd.choice(UNITS)
+            qty = rnd.randint(0, 10000)
+            rate = round(rnd.uniform(5, 1500), 2)
+            name = self._name(rnd, rnd.choice(ITEMS), i)
+            yield (f"<DSPACCNAME><DSPDISPNAME>{name}</DSPDISPNAME></DSPACCNAME>"
+                   "<DSPSTKINFO><DSPSTKCL>"
+                   f"<DSPCLQTY>{qty} {unit}</DSPCLQTY>"
+                   f"<DSPCLRATE>{rate:.2f}/{unit}</DSPCLRATE>"
+                   f"<DSPCLAMTA>-{qty * rate:.2f}</DSPCLAMTA>"
+                   "</DSPSTKCL></DSPSTKINFO>")
+        yield "</ENVELOPE>"
+
+    def ledger_rows(self, rows: int):
+        """(name, group, amount, is_debit) per ledger; the same ledgers the Trial Balance fixture lists."""
+        rnd = random.Random(f"{self.seed}:Trial Balance:{rows}")
+        return list(self._ledgers(rnd, rows))
+
+    def _ledgers(self, rnd, rows):
+        for i in range(rows):
+            group = rnd.choice(LEDGER_GROUPS)
+            name = self._name(rnd, group, i)
+            amt = round(rnd.uniform(100, 5000000), 2)
+            yield name, group, amt, rnd.random() < 0.5
+
+    def _trial_balance(self, rnd, rows):
+        yield "<ENVELOPE>"
+        for name, _, amt, is_dr in self._ledgers(rnd, rows):
+            dr = f"-{amt:.2f}" if is_dr else ""
+            cr = "" if is_dr else f"{amt:.2f}"
+            yield (f"<DSPACCNAME><DSPDISPNAME>{name}</DSPDISPNAME></DSPACCNAME>"
+                   "<DSPACCINFO>"
+                   f"<DSPCLDRAMT><DSPCLDRAMTA>{dr}</DSPCLDRAMTA></DSPCLDRAMT>"
+                   f"<DSPCLCRAMT><DSPCLCRAMTA>{cr}</DSPCLCRAMTA></DSPCLCRAMT>"
+                   "</DSPACCINFO>")
+        yield "</ENVELOPE>"
+
+    def iter_report(self, report: str, rows: int):
+        """Yields the report XML in chunks."""
+        rnd = random.Random(f"{self.seed}:{report}:{rows}")
+        writers = {
+            "Day Book": self._day_book,
+            "Stock Summary": self._stock_summary,
+            "Trial Balance": self._trial_balance,
+        }
+        if report not in writers:
+            raise ValueError(f"Unknown fixture report: {report}")
+        return writers[report](rnd, rows)
+
+    def render(self, report: str, rows: int, encoding: str = "utf-16") -> bytes:
+        """Returns the full report as bytes, as Tally would send it."""
+        text = "".join(self.iter_report(report, rows))
+        return _encode(text, encoding)
+
+    def write(self, report: str, rows: int, out_dir: str = "bench_fixtures", encoding: str = "utf-16") -> str:
+        """Streams a report to disk and returns the path. Existing fixtures are reused."""
+        os.makedirs(out_dir, exist_ok=True)
+        safe_rep = "".join(c for c in report if c.isalnum())
+        path = os.path.join(out_dir, f"{safe_rep}_{rows}_{encoding.replace('-', '')}_{self.seed}.xml")
+        if os.path.exists(path):
+            return path
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "wb") as f:
+            first = True
+            for chunk in self.iter_report(report, rows):
+                f.write(_encode(chunk, encoding, bom=first))
+                first = False
+        os.replace(tmp_path, path)
+        return path
+
+
+def _encode(text: str, encoding: str, bom: bool = True) -> bytes:
+    # Tally sends UTF-16LE with a BOM; mirror that exactly
+    if encoding == "utf-16":
+        return (b"\xff\xfe" if bom else b"") + text.encode("utf-16-le")
+    return text.encode(encoding)
+
+
+if __name__ == "__main__":
+    import argparse
+    parser = argparse.ArgumentParser(description="Generate synthetic Tally XML fixtures.")
+    parser.add_argument("--reports", nargs="+", default=list(REPORTS))
+    parser.add_argument("--rows", nargs="+", type=int, default=[1000])
+    parser.add_argument("--encoding", default="utf-16", choices=["utf-16", "utf-8"])
+    parser.add_argument("--out-dir", default="bench_fixtures")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    gen = TallyFixtureGenerator(seed=args.seed)
+    for rep in args.reports:
+        for n in args.rows:
+            print(f"📝 {gen.write(rep, n, args.out_dir, args.encoding)}")
@@ -0,0 +1,242 @@
+# tools/artifact_store.py
+"""
+Size-bounded store for generated files (charts, tables, report data).
+
+Files are sharded into two-character subdirectories so no directory grows
+past a few hundred entries:
+
+    generated_plots/charts/3f/chart_bar_3f9a....png
+    generated_plots/tables/a0/table_a0c1....json
+    tally_data/5e/data_ModiChemplast_DayBook.json   (not served over HTTP)
+
+Tools ask `path_for(kind, name)` where to write, `register(path)` after
+writing and `exists(path)` before re-rendering. The store keeps an in-memory
+index (size, last use), so lookups and budget checks never list a directory.
+
+Budgets: ARTIFACT_MAX_BYTES / ARTIFACT_MAX_FILES (least recently used go
+first) and ARTIFACT_MAX_AGE (unused for that long). Files younger than
+ARTIFACT_MIN_AGE are never evicted, so an answer's charts are still there when
+the frontend loads them. A background sweep every ARTIFACT_SWEEP_INTERVAL
+seconds re-indexes the roots (picking up files written by the chart sandbox
+processes), applies the budgets and drops stale temp files.
+"""
+import hashlib
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Iterator, List, Optional, Tuple
+
+PLOTS_DIR = "generated_plots"
+ARTIFACT_DATA_DIR = os.getenv("ARTIFACT_DATA_DIR", "tally_data")
+
+ARTIFACT_MAX_BYTES = int(os.getenv("ARTIFACT_MAX_BYTES", str(512 * 1024 * 1024)))
+ARTIFACT_MAX_FILES = int(os.getenv("ARTIFACT_MAX_FILES", "5000"))
+ARTIFACT_MAX_AGE = float(os.getenv("ARTIFACT_MAX_AGE", str(7 * 24 * 3600)))
+ARTIFACT_MIN_AGE = float(os.getenv("ARTIFACT_MIN_AGE", "600"))
+ARTIFACT_SWEEP_INTERVAL = float(os.getenv("ARTIFACT_SWEEP_INTERVAL", "600"))
+TOUCH_INTERVAL = 3600  # persist last use to the file's mtime at most this often (survives restarts)
+TEMP_MAX_AGE = 3600  # leftovers of interrupted atomic writes
+
+KIND_DIRS = {
+    "charts": os.path.join(PLOTS_DIR, "charts"),
+    "tables": os.path.join(PLOTS_DIR, "tables"),
+    "variants": os.path.join(PLOTS_DIR, "variants"),  # WebP/thumbnail re-encodes (image_variants)
+    "data": ARTIFACT_DATA_DIR,
+}
+LEGACY_DATA_PREFIX = "data_"  # report JSON written to the working directory by older versions
+
+
+def _key(path: str) -> str:
+    return os.path.normpath(path).replace("\\", "/")
+
+
+def shard_of(name: str) -> str:
+    return hashlib.sha1(name.encode("utf-8")).hexdigest()[:2]
+
+
+class ArtifactStore:
+    def __init__(self, roots: Optional[List[str]] = None, max_bytes: int = ARTIFACT_MAX_BYTES,
+                 max_files: int = ARTIFACT_MAX_FILES, max_age: float = ARTIFACT_MAX_AGE,
+                 min_age: float = ARTIFACT_MIN_AGE, sweep_interval: float = ARTIFACT_SWEEP_INTERVAL):
+        # Everything under these roots counts against the budget (including image_prep's .vlm_cache)
+        self.roots = [_key(r) for r in (roots or [PLOTS_DIR, ARTIFACT_DATA_DIR])]
+        self.max_bytes = max_bytes
+        self.max_files = max(1, max_files)
+        self.max_age = max_age
+        self.min_age = min_age
+        self.sweep_interval = sweep_interval
+        self._files: "OrderedDict[str, list]" = OrderedDict()  # path -> [size, last use, created], LRU first
+        self._bytes = 0
+        self._indexed = False
+        self._dirs = set()
+        self._lock = threading.RLock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"evicted": 0, "evicted_bytes": 0, "sweeps": 0, "temp_removed": 0}
+
+    # --- PATHS ---
+    def path_for(self, kind: str, name: str) -> str:
+        """Where to write an artifact: <kind dir>/<shard>/<name>. Creates the shard directory."""
+        if kind not in KIND_DIRS:
+            raise ValueError(f"Unknown artifact kind '{kind}'. Use one of {tuple(KIND_DIRS)}.")
+        directory = _key(os.path.join(KIND_DIRS[kind], shard_of(name)))
+        if directory not in self._dirs:
+            os.makedirs(directory, exist_ok=True)
+            self._dirs.add(directory)
+        return f"{directory}/{name}"
+
+    def contains(self, path: str) -> bool:
+        """True if path lies inside one of the store's roots (use before serving a client-supplied path)."""
+        key = _key(path)
+        return not key.startswith("..") and any(key.startswith(root + "/") for root in self.roots)
+
+    # --- INDEX ---
+    def _ensure_index(self):
+        if not self._indexed: self.scan()
+
+    def _add(self, key: str, size: int, used: float, created: float):
+        old = self._files.pop(key, None)
+        if old: self._bytes -= old[0]
+        self._files[key] = [size, used, created]
+        self._bytes += size
+
+    def _drop(self, key: str):
+        old = self._files.pop(key, None)
+        if old: self._bytes -= old[0]
+
+    def register(self, path: str):
+        """Records a file that was just written, then enforces the budget."""
+        try: size = os.path.getsize(path)
+        except OSError: return
+        now = time.time()
+        with self._lock:
+            self._ensure_index()
+            self._add(_key(path), size, now, now)
+            self._enforce(now)
+
+    def exists(self, path: str) -> bool:
+        """Index lookup (falls back to the filesystem for files written by other processes); marks it used."""
+        key = _key(path)
+        now = time.time()
+        with self._lock:
+            self._ensure_index()
+            entry = self._files.get(key)
+            if entry is not None:
+                if now - entry[1] > TOUCH_INTERVAL:
+                    try: os.utime(key)
+                    except OSError: pass
+                entry[1] = now
+                self._files.move_to_end(key)
+                return True
+        if not os.path.isfile(path): return False
+        self.register(path)
+        return True
+
+    def _walk(self) -> Iterator[Tuple[str, os.stat_result]]:
+        for root in self.roots:
+            stack = [root]
+            while stack:
+                try: entries = list(os.scandir(stack.pop()))
+                except OSError: continue
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False): stack.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        try: yield entry.path, entry.stat()
+                        except OSError: continue
+        # Report data from before the data directory existed
+        try:
+            for entry in os.scandir("."):
+                if entry.is_file() and entry.name.startswith(LEGACY_DATA_PREFIX) and entry.name.endswith(".json"):
+                    yield entry.path, entry.stat()
+        except OSError:
+            pass
+
+    def scan(self):
+        """Re-indexes the roots from disk (startup and every sweep). Cost is bounded by the file budget."""
+        now = time.time()
+        found = {}
+        for path, st in self._walk():
+            if path.endswith(".tmp"):
+                if now - st.st_mtime > TEMP_MAX_AGE:
+                    try:
+                        os.remove(path)
+                        self.stats["temp_removed"] += 1
+                    except OSError: pass
+                continue
+            found[_key(path)] = (st.st_size, st.st_mtime)
+
+        with self._lock:
+            known = self._files
+            self._files, self._bytes = OrderedDict(), 0
+            # Keep in-process last-use times; files seen for the first time use their mtime
+            merged = [(key, size, max(mtime, known[key][1]) if key in known else mtime,
+                       known[key][2] if key in known else mtime) for key, (size, mtime) in found.items()]
+            for key, size, used, created in sorted(merged, key=lambda m: m[2]):
+                self._add(key, size, used, created)
+            self._indexed = True
+
+    # --- EVICTION ---
+    def _evict(self, key: str):
+        size = self._files[key][0]
+        try: os.remove(key)
+        except FileNotFoundError: pass
+        except OSError: return False  # in use (Windows) or read-only: keep it indexed
+        self._drop(key)
+        self.stats["evicted"] += 1
+        self.stats["evicted_bytes"] += size
+        return True
+
+    def _enforce(self, now: float):
+        """Drops least recently used files until within budget; never touches files younger than min_age."""
+        for key in list(self._files):
+            size, used, created = self._files[key]
+            over = self._bytes > self.max_bytes or len(self._files) > self.max_files
+            expired = now - used > self.max_age
+            if not over and not expired: break  # LRU order: everything after was used more recently
+            if now - created < self.min_age: continue
+            self._evict(key)
+
+    def sweep(self):
+        self.scan()
+        with self._lock:
+            self._enforce(time.time())
+            self.stats["sweeps"] += 1
+
+    def _loop(self):
+        while not self._stop.wait(self.sweep_interval):
+            try: self.sweep()
+            except Exception as e: print(f"⚠️ Artifact sweep failed: {e}")
+
+    def start_cleanup(self):
+        """Indexes the roots and starts the background sweep (the API calls this on startup)."""
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._loop, name="artifact-sweep", daemon=True)
+            self._thread.start()
+            threading.Thread(target=self.sweep, name="artifact-index", daemon=True).start()
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> Dict:
+        with self._lock:
+            return {
+                "files": len(self._files), "bytes": self._bytes,
+                "max_files": self.max_files, "max_bytes": self.max_bytes,
+                "max_age_seconds": self.max_age, "indexed": self._indexed,
+                **self.stats,
+            }
+
+
+_STORE: Optional[ArtifactStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_artifact_store() -> ArtifactStore:
+    """Process-wide store shared by the chart, table and report tools."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = ArtifactStore()
+        return _STORE
@@ -0,0 +1,97 @@
+# tools/chart_aggregation.py
+"""
+Keeps chart inputs small enough to draw, whatever the report size.
+
+Bar and pie charts show the top N items by magnitude and roll the rest into
+an "Others" bucket. Line charts are reduced to a fixed number of points with
+Largest-Triangle-Three-Buckets (LTTB), which keeps peaks and dips visible.
+"""
+import os
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from tools.tally_values import parse_tally_date
+except ImportError:
+    from tally_values import parse_tally_date
+
+CHART_TOP_N = int(os.getenv("CHART_TOP_N", "8"))
+LINE_MAX_POINTS = int(os.getenv("LINE_MAX_POINTS", "400"))
+OTHERS_LABEL = "Others"
+
+
+def top_n(data: Dict[str, float], n: int = CHART_TOP_N, positive_only: bool = False,
+          others_label: str = OTHERS_LABEL) -> Dict[str, float]:
+    """
+    {label: value} -> the n-1 largest items by |value| plus an 'Others' item
+    holding the sum of the rest. Returns the items unchanged if there are n or fewer.
+    """
+    items = [(str(k), float(v)) for k, v in data.items()
+             if isinstance(v, (int, float)) and not isinstance(v, bool) and (v > 0 or not positive_only)]
+    if len(items) <= n:
+        return dict(items)
+
+    items.sort(key=lambda kv: abs(kv[1]), reverse=True)
+    head, tail = items[:max(1, n - 1)], items[max(1, n - 1):]
+    out = dict(head)
+    out[others_label] = out.get(others_label, 0.0) + sum(v for _, v in tail)
+    return out
+
+
+def to_series(data: Dict) -> Tuple[List[float], List[float], Optional[List[str]]]:
+    """
+    {x: y} -> (xs, ys, labels). Date keys in any Tally format are parsed, summed per
+    day and sorted (xs are date ordinals, labels is None); other keys keep their
+    order, are plotted at 0..n-1 and labels holds their names.
+    """
+    numeric = [(k, float(v)) for k, v in data.items()
+               if isinstance(v, (int, float)) and not isinstance(v, bool)]
+    if not numeric: return [], [], None
+
+    dates = [parse_tally_date(k) for k, _ in numeric]
+    if all(d is not None for d in dates):
+        per_day: Dict[int, float] = {}
+        for d, (_, v) in zip(dates, numeric):
+            per_day[d.toordinal()] = per_day.get(d.toordinal(), 0.0) + v
+        xs = sorted(per_day)
+        return [float(x) for x in xs], [per_day[x] for x in xs], None
+
+    return [float(i) for i in range(len(numeric))], [v for _, v in numeric], [str(k) for k, _ in numeric]
+
+
+def lttb(xs: List[float], ys: List[float], threshold: int = LINE_MAX_POINTS) -> List[int]:
+    """
+    Largest-Triangle-Three-Buckets downsampling. Returns the indices of the points
+    to keep (always including the first and last), at most `threshold` of them.
+    """
+    n = len(xs)
+    if threshold >= n or threshold < 3:
+        return list(range(n))
+
+    keep = [0]
+    bucket = (n - 2) / (threshold - 2)
+    a = 0
+    for i in range(threshold - 2):
+        # Average of the next bucket is the third triangle vertex
+        nxt_start = min(int((i + 1) * bucket) + 1, n - 1)
+        nxt_end = max(min(int((i + 2) * bucket) + 1, n), nxt_start + 1)
+        span = nxt_end - nxt_start
+        avg_x = sum(xs[nxt_start:nxt_end]) / span
+        avg_y = sum(ys[nxt_start:nxt_end]) / span
+
+        start, end = int(i * bucket) + 1, int((i + 1) * bucket) + 1
+        ax, ay = xs[a], ys[a]
+        best, best_area = start, -1.0
+        for j in range(start, end):
+            area = abs((ax - avg_x) * (ys[j] - ay) - (ax - xs[j]) * (avg_y - ay))
+            if area > best_area:
+                best, best_area = j, area
+        keep.append(best)
+        a = best
+
+    keep.append(n - 1)
+    return keep
+
+
+def downsample(xs: List[float], ys: List[float], threshold: Optional[int] = None) -> Tuple[List[float], List[float]]:
+    idx = lttb(xs, ys, threshold or LINE_MAX_POINTS)
+    return [xs[i] for i in idx], [ys[i] for i in idx]
@@ -0,0 +1,110 @@
+# tools/chart_code_cache.py
+"""
+Disk cache for LLM-written chart extraction code.
+
+Exports of the same report always have the same structure, so the `draw()`
+code Gemini writes for "pie chart of stock groups" on one Stock Summary works
+on the next one too. Entries are keyed by a fingerprint of the report
+structure (key paths + list shapes, no values) and a normalized chart intent.
+"""
+import hashlib
+import json
+import os
+import re
+import threading
+import time
+from typing import Optional
+
+CHART_CODE_CACHE_DIR = os.getenv("CHART_CODE_CACHE_DIR", ".chart_code_cache")
+
+# Structure walk limits: deep enough to see voucher/DSP* shapes, cheap on 1M-row reports
+FINGERPRINT_MAX_DEPTH = 5
+FINGERPRINT_LIST_SAMPLE = 10
+
+CHART_KINDS = {
+    "pie": ("pie", "share", "split", "breakup", "breakdown", "proportion", "distribution"),
+    "line": ("line", "trend", "over time", "monthly", "daily", "timeline"),
+    "bar": ("bar", "column", "compare", "comparison", "top"),
+}
+# Only the chart-type nouns leave the content: numbers, grain (monthly/daily) and ranking words (top)
+# change what draw() computes, so "top 5" and "top 10" must not share code
+CHART_NOUNS = {"pie", "line", "bar", "column", "donut", "doughnut"}
+STOPWORDS = {
+    "a", "an", "the", "of", "for", "in", "on", "my", "me", "show", "give", "display", "draw", "make",
+    "create", "generate", "please", "chart", "graph", "plot", "visual", "visualize", "with", "and",
+    "to", "by", "all", "our", "this", "that", "what", "is", "are", "can", "you", "i", "want", "see",
+    "wise", "as", "from", "it", "its", "report", "data",
+}
+
+
+def schema_fingerprint(data) -> str:
+    """Hash of the report's key paths and list shapes (values are ignored)."""
+    paths = set()
+
+    def walk(node, path, depth):
+        if depth > FINGERPRINT_MAX_DEPTH: return
+        if isinstance(node, dict):
+            paths.add(f"{path}{{}}")
+            for k, v in node.items():
+                walk(v, f"{path}/{k}", depth + 1)
+        elif isinstance(node, list):
+            paths.add(f"{path}[]")
+            for item in node[:FINGERPRINT_LIST_SAMPLE]:
+                walk(item, f"{path}[]", depth + 1)
+        else:
+            paths.add(f"{path}:{'n' if isinstance(node, (int, float)) else 's'}")
+
+    walk(data, "", 0)
+    return hashlib.sha256("\n".join(sorted(paths)).encode("utf-8")).hexdigest()
+
+
+def normalize_intent(query: str) -> str:
+    """'Show me a Pie chart of my stock groups!' -> 'pie:groups stock'; 'top 5 parties' -> 'bar:5 parties top'."""
+    q = (query or "").lower()
+    kind = "auto"
+    for name, words in CHART_KINDS.items():
+        if any(w in q for w in words):
+            kind = name
+            break
+
+    words = re.findall(r"[a-z]+|\d+", q)
+    content = sorted({w for w in words if w not in STOPWORDS and w not in CHART_NOUNS and (len(w) > 1 or w.isdigit())})
+    return f"{kind}:{' '.join(content)}"
+
+
+class ChartCodeCache:
+    def __init__(self, cache_dir: str = CHART_CODE_CACHE_DIR):
+        self.cache_dir = cache_dir
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def key_for(self, data, query: str) -> str:
+        raw = f"{schema_fingerprint(data)}|{normalize_intent(query)}"
+        return hashlib.sha256(raw.encode("utf-8")).hexdigest()[:32]
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, f"{key}.json")
+
+    def get(self, key: str) -> Optional[str]:
+        path = self._path(key)
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                return json.load(f).get("code")
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key: str, code: str, query: str = ""):
+        entry = {"code": code, "intent": normalize_intent(query), "query": query, "created": time.time()}
+        path = self._path(key)
+        tmp_path = f"{path}.{threading.get_ident()}.tmp"
+        with self._lock:
+            with open(tmp_path, "w", encoding="utf-8") as f:
+                json.dump(entry, f, indent=2)
+            os.replace(tmp_path, path)
+
+    def invalidate(self, key: str):
+        try: os.remove(self._path(key))
+        except OSError: pass
+
+
+CHART_CODE_CACHE = ChartCodeCache()
@@ -0,0 +1,297 @@
+# tools/chart_sandbox.py
+"""
+Runs LLM-written chart code in a pool of pre-warmed worker processes.
+
+Each job gets a wall-clock timeout and a memory cap (POSIX RLIMIT_AS). The
+code sees only raw_data, a `plotter` that exposes the three chart calls, and
+copies of a few stdlib modules without their submodules. It is rejected
+before exec if it touches underscore attributes (__globals__, __class__,
+__subclasses__, ...) or frame/generator internals, which would lead back to
+the worker's own modules. The small builtins set only keeps the code's
+options narrow; it is not what isolates it. A worker that hangs, crashes or
+blows its memory cap is killed and replaced in the background; other
+requests keep using the remaining workers. A job that finds no free worker within
+CHART_SANDBOX_QUEUE_TIMEOUT seconds fails with SandboxError instead of waiting
+forever.
+
+The API starts the pool on startup (start() spawns the workers in parallel,
+in the background), so the first chart doesn't pay for the imports.
+
+NOTE: workers are started with the 'spawn' method, so the main module
+(e.g. api.py) must be safe to import (no server start outside __main__).
+"""
+import ast
+import builtins
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from types import ModuleType, SimpleNamespace
+from typing import Optional
+
+CHART_SANDBOX_ENABLED = os.getenv("CHART_SANDBOX", "1") != "0"
+CHART_SANDBOX_WORKERS = int(os.getenv("CHART_SANDBOX_WORKERS", str(min(4, os.cpu_count() or 1))))
+CHART_SANDBOX_TIMEOUT = float(os.getenv("CHART_SANDBOX_TIMEOUT", "20"))
+CHART_SANDBOX_MEMORY_MB = int(os.getenv("CHART_SANDBOX_MEMORY_MB", "1024"))
+CHART_SANDBOX_MAX_JOBS = int(os.getenv("CHART_SANDBOX_MAX_JOBS", "200"))  # recycle workers periodically
+CHART_SANDBOX_QUEUE_TIMEOUT = float(os.getenv("CHART_SANDBOX_QUEUE_TIMEOUT", "90"))  # wait for a free worker
+WORKER_START_TIMEOUT = 60
+
+ALLOWED_BUILTINS = (
+    "abs", "all", "any", "bool", "dict", "enumerate", "filter", "float", "format", "int", "isinstance",
+    "len", "list", "map", "max", "min", "next", "print", "range", "reversed", "round", "set", "slice",
+    "sorted", "str", "sum", "tuple", "zip", "iter", "divmod", "pow", "hash",
+    "Exception", "ValueError", "TypeError", "KeyError", "IndexError", "AttributeError",
+    "ZeroDivisionError", "StopIteration",
+)
+ALLOWED_MODULES = ("math", "json", "re", "datetime", "collections", "statistics", "itertools", "functools", "decimal")
+# Attributes that reach frames (and through them, module globals) without an underscore
+BLOCKED_ATTRIBUTES = frozenset((
+    "gi_frame", "gi_code", "cr_frame", "cr_code", "ag_frame", "ag_code", "tb_frame", "tb_next",
+    "f_globals", "f_locals", "f_builtins", "f_back", "f_code", "mro",
+))
+
+
+class SandboxError(Exception):
+    """The chart code raised, or the worker died."""
+
+
+class SandboxTimeout(SandboxError):
+    """The chart code ran past its wall-clock budget."""
+
+
+# --- WORKER SIDE ---
+_PLOTTER = None  # the worker's chart tool; chart code only reaches it through _ChartCalls
+_MODULE_VIEWS = {}
+
+
+class _ChartCalls:
+    """What chart code gets as `plotter`: the chart calls, not the tool (no client, no file helpers)."""
+    __slots__ = ()
+
+    def create_bar_chart(self, data, title="Bar Chart"): return _PLOTTER.create_bar_chart(data, title)
+    def create_pie_chart(self, data, title="Pie Chart"): return _PLOTTER.create_pie_chart(data, title)
+    def create_line_chart(self, data, title="Line Chart"): return _PLOTTER.create_line_chart(data, title)
+
+
+def _module_view(name: str) -> SimpleNamespace:
+    """Public names of an allowed module, minus submodules ("json.codecs" would hand out codecs.open)."""
+    if name not in _MODULE_VIEWS:
+        module = __import__(name)
+        _MODULE_VIEWS[name] = SimpleNamespace(**{k: v for k, v in vars(module).items()
+                                                 if not k.startswith("_") and not isinstance(v, ModuleType)})
+    return _MODULE_VIEWS[name]
+
+
+def _safe_import(name, globals=None, locals=None, fromlist=(), level=0):
+    if level or name not in ALLOWED_MODULES:
+        raise ImportError(f"Import of '{name}' is not allowed in chart code")
+    return _module_view(name)
+
+
+def _safe_builtins():
+    safe = {name: getattr(builtins, name) for name in ALLOWED_BUILTINS}
+    safe["__import__"] = _safe_import
+    return safe
+
+
+def check_code(code: str):
+    """Parses chart code and rejects attribute paths out of the sandbox. Raises SandboxError."""
+    try:
+        tree = ast.parse(code, "<chart_code>")
+    except SyntaxError as e:
+        raise SandboxError(f"SyntaxError: {e}") from None
+    for node in ast.walk(tree):
+        if isinstance(node, ast.Attribute) and (node.attr.startswith("_") or node.attr in BLOCKED_ATTRIBUTES):
+            raise SandboxError(f"Chart code may not use the attribute '{node.attr}'")
+        if isinstance(node, ast.Name) and node.id.startswith("__"):
+            raise SandboxError(f"Chart code may not use the name '{node.id}'")
+    return tree
+
+
+def _apply_memory_limit(memory_mb: int):
+    """Caps the worker's address space at (what the imports already use) + memory_mb."""
+    try:
+        import resource
+    except ImportError:
+        return  # Windows: no RLIMIT_AS; timeout + recycling still apply
+    baseline = 0
+    try:
+        with open("/proc/self/statm") as f:
+            baseline = int(f.read().split()[0]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        pass
+    limit = baseline + memory_mb * 1024 * 1024
+    try:
+        resource.setrlimit(resource.RLIMIT_AS, (limit, limit))
+    except (ValueError, OSError):
+        pass
+
+
+def _worker_main(conn, memory_mb: int):
+    # Pre-warm: import PIL + the plotter once, before taking jobs
+    try:
+        from tools.chart_vlm_tool import generate_vlm_charts
+        from tools.request_context import request_options
+    except ImportError:
+        from chart_vlm_tool import generate_vlm_charts
+        from request_context import request_options
+
+    global _PLOTTER
+    _PLOTTER = generate_vlm_charts()
+    safe_builtins = _safe_builtins()
+    modules = {name: _module_view(name) for name in ("json", "math")}
+    _apply_memory_limit(memory_mb)
+    conn.send(("ready", os.getpid()))
+
+    while True:
+        try:
+            job = conn.recv()
+        except (EOFError, OSError):
+            break
+        if job is None: break
+
+        code, raw_data, fmt = job
+        try:
+            tree = check_code(code)
+            scope = {"__builtins__": safe_builtins, "plotter": _ChartCalls(), "raw_data": raw_data, **modules}
+            exec(compile(tree, "<chart_code>", "exec"), scope)
+            if "draw" not in scope:
+                raise ValueError("No draw() function found")
+            with request_options(chart_format=fmt):
+                result = scope["draw"]()
+            conn.send(("ok", result))
+        except MemoryError:
+            conn.send(("error", f"Chart code exceeded the {memory_mb} MB memory cap"))
+        except SandboxError as e:
+            conn.send(("error", str(e)))
+        except BaseException as e:
+            conn.send(("error", f"{type(e).__name__}: {e}"))
+
+
+# --- POOL SIDE ---
+class _Worker:
+    def __init__(self, ctx, memory_mb: int):
+        self.conn, child_conn = ctx.Pipe()
+        self.proc = ctx.Process(target=_worker_main, args=(child_conn, memory_mb), daemon=True)
+        self.proc.start()
+        child_conn.close()
+        self.jobs = 0
+
+    def wait_ready(self, timeout: float) -> bool:
+        if not self.conn.poll(timeout): return False
+        try: return self.conn.recv()[0] == "ready"
+        except (EOFError, OSError): return False
+
+    def kill(self):
+        try: self.conn.close()
+        except OSError: pass
+        if self.proc.is_alive():
+            self.proc.terminate()
+            self.proc.join(2)
+            if self.proc.is_alive(): self.proc.kill()
+
+
+class ChartSandbox:
+    def __init__(self, workers: int = CHART_SANDBOX_WORKERS, timeout: float = CHART_SANDBOX_TIMEOUT,
+                 memory_mb: int = CHART_SANDBOX_MEMORY_MB, max_jobs: int = CHART_SANDBOX_MAX_JOBS,
+                 queue_timeout: float = CHART_SANDBOX_QUEUE_TIMEOUT):
+        self.size = max(1, workers)
+        self.timeout = timeout
+        self.memory_mb = memory_mb
+        self.max_jobs = max_jobs
+        self.queue_timeout = queue_timeout
+        self._ctx = mp.get_context("spawn")
+        self._idle: "queue.Queue[_Worker]" = queue.Queue()
+        self._closed = False
+        self._slots = 0  # workers alive or starting
+        self._lock = threading.Lock()
+
+    def start(self):
+        """Spawns the missing workers in parallel, in the background (returns at once)."""
+        with self._lock:
+            missing = self.size - self._slots
+            self._slots += max(0, missing)
+        for _ in range(missing): self._start_worker()
+
+    def _spawn(self) -> _Worker:
+        worker = _Worker(self._ctx, self.memory_mb)
+        if not worker.wait_ready(WORKER_START_TIMEOUT):
+            worker.kill()
+            raise SandboxError("Chart worker failed to start")
+        return worker
+
+    def _start_worker(self):
+        """Fills one slot off the request path (3 attempts); the slot is given up if all fail."""
+        def respawn():
+            for attempt in range(3):
+                if self._closed: break
+                try:
+                    self._idle.put(self._spawn())
+                    return
+                except SandboxError:
+                    time.sleep(1 + attempt)
+            with self._lock: self._slots -= 1
+            print("❌ Chart sandbox could not start a worker; pool is running smaller.")
+        threading.Thread(target=respawn, name="chart-sandbox-spawn", daemon=True).start()
+
+    def _replace(self, worker: _Worker):
+        """Kills a bad worker and starts a fresh one in its slot."""
+        worker.kill()
+        if self._closed:
+            with self._lock: self._slots -= 1
+            return
+        self._start_worker()
+
+    def run(self, code: str, raw_data, fmt: Optional[str] = None, timeout: Optional[float] = None):
+        """Executes draw() in a worker. Returns its result (an image path) or raises SandboxError."""
+        timeout = timeout or self.timeout
+        try:
+            worker = self._idle.get(timeout=self.queue_timeout)
+        except queue.Empty:
+            self.start()  # slots given up after failed respawns get another chance
+            raise SandboxError(f"No chart worker became free within {self.queue_timeout:.0f}s")
+        reusable = False
+        try:
+            worker.conn.send((code, raw_data, fmt))
+            if not worker.conn.poll(timeout):
+                raise SandboxTimeout(f"Chart code timed out after {timeout:.0f}s")
+            status, payload = worker.conn.recv()
+            reusable = True
+        except (EOFError, BrokenPipeError, ConnectionResetError, OSError) as e:
+            raise SandboxError(f"Chart worker crashed: {e}")
+        finally:
+            worker.jobs += 1
+            if reusable and worker.jobs < self.max_jobs and worker.proc.is_alive():
+                self._idle.put(worker)
+            else:
+                self._replace(worker)
+
+        if status != "ok":
+            raise SandboxError(payload)
+        return payload
+
+    def close(self):
+        self._closed = True
+        while True:
+            try: worker = self._idle.get_nowait()
+            except queue.Empty: break
+            try: worker.conn.send(None)
+            except OSError: pass
+            worker.kill()
+            with self._lock: self._slots -= 1
+
+
+_SANDBOX: Optional[ChartSandbox] = None
+_SANDBOX_LOCK = threading.Lock()
+
+
+def get_chart_sandbox() -> ChartSandbox:
+    """Process-wide pool; its workers start in the background (the API starts it on startup)."""
+    global _SANDBOX
+    with _SANDBOX_LOCK:
+        if _SANDBOX is None:
+            _SANDBOX = ChartSandbox()
+            _SANDBOX.start()
+        return _SANDBOX
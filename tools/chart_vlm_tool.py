@@ -3,16 +3,41 @@ import os
 import json
 import re
 import math
-from langchain_google_genai import ChatGoogleGenerativeAI
+import hashlib
+import uuid
+from datetime import date
+from functools import lru_cache
+from xml.sax.saxutils import escape as xml_escape
 from dotenv import load_dotenv
 from PIL import Image, ImageDraw, ImageFont
 
+try:
+    from tools.chart_code_cache import CHART_CODE_CACHE
+    from tools.request_context import CHART_FORMAT
+    from tools.chart_sandbox import CHART_SANDBOX_ENABLED, get_chart_sandbox
+    from tools.chart_aggregation import CHART_TOP_N, LINE_MAX_POINTS, top_n, to_series, downsample
+    from tools.artifact_store import get_artifact_store
+    from tools.llm_gateway import DEFAULT_MODEL, get_llm_gateway
+except ImportError:
+    from chart_code_cache import CHART_CODE_CACHE
+    from request_context import CHART_FORMAT
+    from chart_sandbox import CHART_SANDBOX_ENABLED, get_chart_sandbox
+    from chart_aggregation import CHART_TOP_N, LINE_MAX_POINTS, top_n, to_series, downsample
+    from artifact_store import get_artifact_store
+    from llm_gateway import DEFAULT_MODEL, get_llm_gateway
+
 load_dotenv()
 
 # --- CONFIGURATION ---
 PLOTS_DIR = "generated_plots"
 os.makedirs(PLOTS_DIR, exist_ok=True)
 
+@lru_cache(maxsize=32)
+def _load_font(size):
+    """Loads each font size once per process; PIL keeps the glyph cache on the font object."""
+    try: return ImageFont.truetype("arial.ttf", size)
+    except: return ImageFont.load_default()
+
 class generate_vlm_charts:
     """
     A robust plotting engine that draws professional charts using PIL.
@@ -27,36 +52,58 @@ class generate_vlm_charts:
         self.bg_color = 'white'
         self.text_color = '#333333'
         
-        # 2. AI Settings (Restored this part)
-        api_key = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-        model_name = os.getenv("GEMINI_MODEL") or "models/gemini-2.0-flash-exp"
-        self.llm = ChatGoogleGenerativeAI(model=model_name, google_api_key=api_key)
+        # 2. AI Settings (the shared gateway builds the client on first use; sandbox workers only draw)
+        self.model_name = DEFAULT_MODEL
 
     # --- HELPER: Fonts ---
     def _get_font(self, size):
-        try: return ImageFont.truetype("arial.ttf", size)
-        except: return ImageFont.load_default()
+        return _load_font(size)
 
     def _draw_text_centered(self, draw, x, y, text, size, color='black', anchor="mm"):
         font = self._get_font(size)
         draw.text((x, y), str(text), fill=color, font=font, anchor=anchor)
 
+    # --- HELPER: Content-Addressed Output ---
+    def _chart_path(self, kind: str, data: dict, title: str, ext: str = "png") -> str:
+        """Same chart type + data + title + style -> same file name, in the artifact store's chart shards."""
+        payload = json.dumps({
+            "kind": kind,
+            "title": str(title),
+            "data": [[str(k), v] for k, v in data.items()],
+            "style": [self.width, self.height, self.padding, self.colors, self.bg_color],
+        }, default=str)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+        return get_artifact_store().path_for("charts", f"chart_{kind}_{digest}.{ext}")
+
+    def _save_image(self, img, filename: str):
+        # Write to a temp file first so a concurrent request never reads a half-written PNG
+        tmp_name = f"{filename}.{uuid.uuid4().hex[:8]}.tmp"
+        img.save(tmp_name, format="PNG")
+        os.replace(tmp_name, filename)
+        get_artifact_store().register(filename)
+
     # --- HELPER: Bar Chart Logic ---
-    def create_bar_chart(self, data: dict, title: str) -> str:
-        """Draws a professional bar chart."""
+    def create_bar_chart(self, data: dict, title: str, fmt: str = None) -> str:
+        """Draws a professional bar chart. fmt: 'png' or 'svg' (default: the request's chart format)."""
+        fmt = fmt or CHART_FORMAT.get()
+        # Largest items by magnitude; the rest become one "Others" bar
+        valid_items = top_n(data, CHART_TOP_N)
+        if not valid_items: return "Error: No numeric data"
+        
+        keys = list(valid_items.keys())
+        values = list(valid_items.values())
+
+        # Identical request -> existing image, no redraw
+        filename = self._chart_path("bar", dict(zip(keys, values)), title, ext=fmt)
+        if get_artifact_store().exists(filename): return filename
+        if fmt == "svg": return self._save_svg(self._bar_svg(keys, values, title), filename)
+
         img = Image.new('RGB', (self.width, self.height), self.bg_color)
         draw = ImageDraw.Draw(img)
         
         # Title
         self._draw_text_centered(draw, self.width/2, 40, title, 24, anchor="mt")
         
-        # Filter Data
-        valid_items = {k: v for k, v in data.items() if isinstance(v, (int, float))}
-        if not valid_items: return "Error: No numeric data"
-        
-        keys = list(valid_items.keys())[:8] 
-        values = list(valid_items.values())[:8]
-        
         max_val = max(max(values), 0)
         min_val = min(min(values), 0)
         y_range = max_val - min_val if max_val != min_val else 1.0
@@ -100,21 +147,25 @@ class generate_vlm_charts:
         # Zero Line
         draw.line([(left, zero_y), (right, zero_y)], fill='black', width=2)
         
-        filename = f"{PLOTS_DIR}/chart_bar_{len(os.listdir(PLOTS_DIR))}.png"
-        img.save(filename)
+        self._save_image(img, filename)
         return filename
 
     # --- HELPER: Pie Chart Logic ---
-    def create_pie_chart(self, data: dict, title: str) -> str:
-        """Draws a professional pie chart."""
+    def create_pie_chart(self, data: dict, title: str, fmt: str = None) -> str:
+        """Draws a professional pie chart. fmt: 'png' or 'svg' (default: the request's chart format)."""
+        fmt = fmt or CHART_FORMAT.get()
+        valid_items = top_n(data, CHART_TOP_N, positive_only=True)
+        total = sum(valid_items.values())
+        if total == 0: return self.create_bar_chart(data, title, fmt)
+
+        filename = self._chart_path("pie", valid_items, title, ext=fmt)
+        if get_artifact_store().exists(filename): return filename
+        if fmt == "svg": return self._save_svg(self._pie_svg(valid_items, total, title), filename)
+
         img = Image.new('RGB', (self.width, self.height), self.bg_color)
         draw = ImageDraw.Draw(img)
         
         self._draw_text_centered(draw, self.width/2, 40, title, 24, anchor="mt")
-        
-        valid_items = {k: v for k, v in data.items() if isinstance(v, (int, float)) and v > 0}
-        total = sum(valid_items.values())
-        if total == 0: return self.create_bar_chart(data, title)
 
         cx, cy = self.width // 2 - 150, self.height // 2
         radius = 220
@@ -137,40 +188,223 @@ class generate_vlm_charts:
             self._draw_text_centered(draw, lx + 30, ly+10, f"{k} ({v/total:.1%})", 14, anchor="lm")
             start_angle = end_angle
 
-        filename = f"{PLOTS_DIR}/chart_pie_{len(os.listdir(PLOTS_DIR))}.png"
-        img.save(filename)
+        self._save_image(img, filename)
         return filename
 
-    # --- MAIN ORCHESTRATOR (Fixes the Agent Error) ---
-    def generate_chart(self, json_path: str, query: str = "Analyze data") -> str:
+    # --- HELPER: Line Chart Logic ---
+    def create_line_chart(self, data: dict, title: str, fmt: str = None, max_points: int = LINE_MAX_POINTS) -> str:
         """
-        1. Reads JSON.
-        2. Asks LLM how to plot it.
-        3. Executes the plotting code using 'self' as the plotter.
+        Draws a trend line. data: {date_or_label: value}; Tally date keys are parsed,
+        summed per day and sorted. Long series are downsampled (LTTB) to max_points.
         """
-        try:
-            if not os.path.exists(json_path):
-                return json.dumps({"status": "error", "message": "File not found"})
+        fmt = fmt or CHART_FORMAT.get()
+        xs, ys, labels = to_series(data)
+        if not xs: return "Error: No numeric data"
+        xs, ys = downsample(xs, ys, max_points)
 
-            with open(json_path, 'r', encoding="utf-8") as f:
-                raw_data = json.load(f)
+        filename = self._chart_path("line", dict(zip(xs, ys)), title, ext=fmt)
+        if get_artifact_store().exists(filename): return filename
+
+        def tick_label(x):
+            if labels is None: return date.fromordinal(int(x)).strftime("%d-%b-%y")
+            label = labels[int(x)]
+            return label[:10] + "..." if len(label) > 10 else label
+
+        top, bottom = self.padding + 50, self.height - self.padding
+        left, right = self.padding + 20, self.width - self.padding
+        min_x, max_x = xs[0], xs[-1]
+        x_range = (max_x - min_x) or 1.0
+        min_val, max_val = min(min(ys), 0), max(max(ys), 0)
+        y_range = (max_val - min_val) or 1.0
+
+        def px(x): return left + (x - min_x) / x_range * (right - left)
+        def py(y): return bottom - (y - min_val) / y_range * (bottom - top)
+
+        points = [(px(x), py(y)) for x, y in zip(xs, ys)]
+        y_ticks = [min_val + y_range * i / 5 for i in range(6)]
+        x_ticks = [xs[round(i * (len(xs) - 1) / 5)] for i in range(6)] if len(xs) > 1 else xs
+        color = self.colors[0]
+
+        if fmt == "svg":
+            body = []
+            for val in y_ticks:
+                body.append(f'<line x1="{left}" y1="{py(val):.1f}" x2="{right}" y2="{py(val):.1f}" stroke="#e0e0e0"/>')
+                body.append(self._svg_text(left - 10, py(val), f"{val:,.0f}", 12, anchor="end"))
+            for x in dict.fromkeys(x_ticks):
+                body.append(self._svg_text(px(x), bottom + 20, tick_label(x), 12, baseline="hanging"))
+            body.append(f'<line x1="{left}" y1="{py(0):.1f}" x2="{right}" y2="{py(0):.1f}" stroke="black" stroke-width="2"/>')
+            path = " ".join(f"{x:.1f},{y:.1f}" for x, y in points)
+            body.append(f'<polyline points="{path}" fill="none" stroke="{color}" stroke-width="2"/>')
+            return self._save_svg(self._svg_document(title, body), filename)
+
+        img = Image.new('RGB', (self.width, self.height), self.bg_color)
+        draw = ImageDraw.Draw(img)
+        self._draw_text_centered(draw, self.width/2, 40, title, 24, anchor="mt")
+        for val in y_ticks:
+            draw.line([(left, py(val)), (right, py(val))], fill='#e0e0e0', width=1)
+            self._draw_text_centered(draw, left - 10, py(val), f"{val:,.0f}", 12, anchor="rm")
+        for x in dict.fromkeys(x_ticks):
+            self._draw_text_centered(draw, px(x), bottom + 20, tick_label(x), 12, anchor="mt")
+        draw.line([(left, py(0)), (right, py(0))], fill='black', width=2)
+        if len(points) > 1: draw.line(points, fill=color, width=3)
+        else: draw.ellipse([points[0][0] - 4, points[0][1] - 4, points[0][0] + 4, points[0][1] + 4], fill=color)
+
+        self._save_image(img, filename)
+        return filename
+
+    # --- HELPER: Dashboard Composite ---
+    def create_dashboard(self, image_paths: list, title: str = "Dashboard", columns: int = 2) -> str:
+        """Tiles already-rendered charts into one image (PNG grid, or nested SVG when all inputs are SVG)."""
+        paths = [p for p in image_paths if self._is_image(p)]
+        if not paths: return "Error: No charts to combine"
+        if len(paths) == 1: return paths[0]
+
+        columns = max(1, min(columns, len(paths)))
+        rows = math.ceil(len(paths) / columns)
+        cell_w, cell_h = self.width // columns, self.height // columns
+        header = 60
+        all_svg = all(p.endswith(".svg") for p in paths)
+        if not all_svg and any(p.endswith(".svg") for p in paths):
+            return "Error: Can't combine PNG and SVG charts into one image"
+
+        # Content-addressed: the inputs are content-addressed already, so their names identify them
+        key = {os.path.basename(p): os.path.getsize(p) for p in paths}
+        filename = self._chart_path("dashboard", key, title, ext="svg" if all_svg else "png")
+        if get_artifact_store().exists(filename): return filename
+
+        total_w, total_h = cell_w * columns, cell_h * rows + header
+        if all_svg:
+            body = []
+            for i, p in enumerate(paths):
+                with open(p, "r", encoding="utf-8") as f: inner = f.read()
+                x, y = (i % columns) * cell_w, header + (i // columns) * cell_h
+                # Nested <svg> scales each chart into its cell via its own viewBox
+                body.append(inner.replace("<svg ", f'<svg x="{x}" y="{y}" ', 1)
+                                 .replace(f'width="{self.width}" height="{self.height}"', f'width="{cell_w}" height="{cell_h}"', 1))
+            svg = (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {total_w} {total_h}" '
+                   f'width="{total_w}" height="{total_h}" font-family="Arial, sans-serif">'
+                   f'<rect width="100%" height="100%" fill="{self.bg_color}"/>'
+                   + self._svg_text(total_w / 2, 20, title, 24, baseline="hanging", color="black")
+                   + "".join(body) + "</svg>")
+            return self._save_svg(svg, filename)
+
+        canvas = Image.new('RGB', (total_w, total_h), self.bg_color)
+        draw = ImageDraw.Draw(canvas)
+        self._draw_text_centered(draw, total_w / 2, 20, title, 24, anchor="mt")
+        for i, p in enumerate(paths):
+            with Image.open(p) as tile:
+                tile = tile.convert("RGB")
+                tile.thumbnail((cell_w, cell_h), Image.LANCZOS)
+                x = (i % columns) * cell_w + (cell_w - tile.width) // 2
+                y = header + (i // columns) * cell_h + (cell_h - tile.height) // 2
+                canvas.paste(tile, (x, y))
+        self._save_image(canvas, filename)
+        return filename
+
+    # --- SVG BACKEND (vector output the frontend renders directly) ---
+    def _svg_text(self, x, y, text, size, anchor="middle", baseline="middle", color=None):
+        return (f'<text x="{x:.1f}" y="{y:.1f}" font-size="{size}" text-anchor="{anchor}" '
+                f'dominant-baseline="{baseline}" fill="{color or self.text_color}">{xml_escape(str(text))}</text>')
+
+    def _svg_document(self, title, body):
+        return (f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {self.width} {self.height}" '
+                f'width="{self.width}" height="{self.height}" font-family="Arial, sans-serif">'
+                f'<rect width="100%" height="100%" fill="{self.bg_color}"/>'
+                + self._svg_text(self.width / 2, 40, title, 24, baseline="hanging", color="black")
+                + "".join(body) + "</svg>")
+
+    def _save_svg(self, svg: str, filename: str) -> str:
+        tmp_name = f"{filename}.{uuid.uuid4().hex[:8]}.tmp"
+        with open(tmp_name, "w", encoding="utf-8") as f: f.write(svg)
+        os.replace(tmp_name, filename)
+        get_artifact_store().register(filename)
+        return filename
+
+    def _bar_svg(self, keys, values, title) -> str:
+        """Same layout as the PIL bar chart."""
+        max_val = max(max(values), 0)
+        min_val = min(min(values), 0)
+        y_range = max_val - min_val if max_val != min_val else 1.0
+
+        top, bottom = self.padding + 50, self.height - self.padding
+        left, right = self.padding, self.width - self.padding
+        scale = (bottom - top) / y_range
+        zero_y = bottom - ((0 - min_val) * scale)
+
+        body = []
+        for i in range(6):
+            val = min_val + (y_range * i / 5)
+            y = bottom - ((val - min_val) * scale)
+            body.append(f'<line x1="{left}" y1="{y:.1f}" x2="{right}" y2="{y:.1f}" stroke="#e0e0e0"/>')
+            body.append(self._svg_text(left - 10, y, f"{val:,.0f}", 12, anchor="end"))
+
+        spacing = (right - left) / len(keys)
+        bar_width = spacing * 0.6
+        for i, (k, v) in enumerate(zip(keys, values)):
+            center_x = left + (i * spacing) + (spacing / 2)
+            bar_h = abs(v) * scale
+            rect_top = zero_y - bar_h if v >= 0 else zero_y
+            color = self.colors[i % len(self.colors)]
+            body.append(f'<rect x="{center_x - bar_width / 2:.1f}" y="{rect_top:.1f}" width="{bar_width:.1f}" '
+                        f'height="{bar_h:.1f}" fill="{color}"><title>{xml_escape(str(k))}: {v:,.2f}</title></rect>')
+            label_y = rect_top - 15 if v >= 0 else rect_top + bar_h + 15
+            body.append(self._svg_text(center_x, label_y, f"{v:,.0f}", 12))
+            label = k[:12] + "..." if len(k) > 12 else k
+            body.append(self._svg_text(center_x, bottom + 20, label, 12, baseline="hanging"))
+
+        body.append(f'<line x1="{left}" y1="{zero_y:.1f}" x2="{right}" y2="{zero_y:.1f}" stroke="black" stroke-width="2"/>')
+        return self._svg_document(title, body)
+
+    def _pie_svg(self, valid_items, total, title) -> str:
+        """Same layout as the PIL pie chart (angles clockwise from 3 o'clock)."""
+        cx, cy = self.width // 2 - 150, self.height // 2
+        radius = 220
+        body = []
+        start_angle = 0.0
+        for i, (k, v) in enumerate(valid_items.items()):
+            extent = (v / total) * 360
+            end_angle = start_angle + extent
+            color = self.colors[i % len(self.colors)]
+            tooltip = f"<title>{xml_escape(str(k))}: {v:,.2f}</title>"
+            if extent >= 359.999:
+                body.append(f'<circle cx="{cx}" cy="{cy}" r="{radius}" fill="{color}" stroke="white">{tooltip}</circle>')
+            else:
+                x1 = cx + radius * math.cos(math.radians(start_angle))
+                y1 = cy + radius * math.sin(math.radians(start_angle))
+                x2 = cx + radius * math.cos(math.radians(end_angle))
+                y2 = cy + radius * math.sin(math.radians(end_angle))
+                large = 1 if extent > 180 else 0
+                body.append(f'<path d="M{cx},{cy} L{x1:.2f},{y1:.2f} A{radius},{radius} 0 {large} 1 {x2:.2f},{y2:.2f} Z" '
+                            f'fill="{color}" stroke="white">{tooltip}</path>')
 
-            # 1. Prompt the LLM
-            prompt = f"""
+            lx, ly = self.width - 250, 150 + (i * 40)
+            body.append(f'<rect x="{lx}" y="{ly}" width="20" height="20" fill="{color}"/>')
+            body.append(self._svg_text(lx + 30, ly + 10, f"{k} ({v/total:.1%})", 14, anchor="start"))
+            start_angle = end_angle
+        return self._svg_document(title, body)
+
+    # --- AI: Code Generation ---
+    def _request_code(self, raw_data, query: str, batchable: bool = False):
+        """Asks the LLM for a draw() function. Returns the code or None. batchable: the caller is fanning out."""
+        prompt = f"""
             You are a Data Visualization Expert.
             
             USER QUERY: "{query}"
             DATA SAMPLE: {json.dumps(raw_data, indent=2)[:1500]}...
 
             TASK:
-            1. Analyze the data and choose the best chart (Bar or Pie).
+            1. Analyze the data and choose the best chart (Bar, Pie, or Line for trends over dates).
             2. Write Python code to extract data from `raw_data` variable.
-            3. Call `generate_vlm_charts.create_bar_chart(data_dict, title)` or `generate_vlm_charts.create_pie_chart(data_dict, title)`.
+            3. Call `plotter.create_bar_chart(data_dict, title)`, `plotter.create_pie_chart(data_dict, title)`
+               or `plotter.create_line_chart(data_dict, title)`.
             
             RULES:
             - `plotter` is already defined (it is 'self').
             - `raw_data` is already defined (injected globally).
             - Create a dictionary `chart_data` with clean numeric values.
+            - Pass ALL items: the plotter keeps the largest ones and groups the rest as "Others".
+            - For a line chart, key `chart_data` by the Tally date string (e.g. "20240401"); the plotter
+              sums values per day, sorts by date and downsamples long series.
             - Return ONLY the function definition `draw()`.
 
             EXAMPLE OUTPUT:
@@ -182,39 +416,90 @@ class generate_vlm_charts:
                 return plotter.create_bar_chart(chart_data, "Stock Summary")
             ```
             """
-            
-            response = self.llm.invoke(prompt)
-            code_match = re.search(r"```python\n(.*?)```", response.content, re.DOTALL)
-            
-            if not code_match:
+        
+        # Dashboard charts request code concurrently; the gateway may answer several in one call.
+        # A single chart never waits for a batch window.
+        response = get_llm_gateway().complete("chart_code", prompt, model=self.model_name, batchable=batchable)
+        code_match = re.search(r"```python\n(.*?)```", response, re.DOTALL)
+        return code_match.group(1) if code_match else None
+
+    def _run_code(self, code: str, raw_data):
+        """Executes draw() code against raw_data. Returns draw()'s result."""
+        # Isolated worker process: timeout, memory cap, chart calls only (see chart_sandbox)
+        if CHART_SANDBOX_ENABLED:
+            result = get_chart_sandbox().run(code, raw_data, fmt=CHART_FORMAT.get())
+            # The worker wrote the file; index it in this process's artifact store too
+            if isinstance(result, str) and get_artifact_store().contains(result): get_artifact_store().exists(result)
+            return result
+
+        # In-process fallback (CHART_SANDBOX=0), e.g. for debugging
+        # Define a restricted scope
+        safe_scope = {
+            "plotter": self,
+            "raw_data": raw_data,
+            "json": json,
+            "math": math,
+            "print": print # Allowed for debugging
+        }
+        exec(code, safe_scope)
+        if 'draw' not in safe_scope:
+            raise ValueError("No draw() function found")
+        return safe_scope['draw']()
+
+    @staticmethod
+    def _is_image(result) -> bool:
+        return isinstance(result, str) and os.path.isfile(result)
+
+    # --- MAIN ORCHESTRATOR (Fixes the Agent Error) ---
+    def generate_chart(self, json_path: str, query: str = "Analyze data", batchable: bool = False) -> str:
+        """
+        1. Reads JSON.
+        2. Reuses cached draw() code for this report shape + intent, if it still works.
+        3. Otherwise asks the LLM how to plot it and executes the code using 'self' as the plotter.
+        batchable: set by callers rendering several charts at once (dashboards), so their code
+        requests may share one LLM call.
+        """
+        try:
+            if not os.path.exists(json_path):
+                return json.dumps({"status": "error", "message": "File not found"})
+
+            with open(json_path, 'r', encoding="utf-8") as f:
+                raw_data = json.load(f)
+
+            # 1. Cached code for the same report structure + chart intent
+            cache_key = CHART_CODE_CACHE.key_for(raw_data, query)
+            cached_code = CHART_CODE_CACHE.get(cache_key)
+            if cached_code:
+                try:
+                    image_path = self._run_code(cached_code, raw_data)
+                    if self._is_image(image_path):
+                        return json.dumps({
+                            "status": "success",
+                            "images": [image_path],
+                            "rationale": "Chart generated (cached extraction code)."
+                        })
+                except Exception as cache_err:
+                    print(f"⚠️ Cached chart code failed, regenerating: {cache_err}")
+                CHART_CODE_CACHE.invalidate(cache_key)
+
+            # 2. Prompt the LLM
+            code = self._request_code(raw_data, query, batchable)
+            if not code:
                 return json.dumps({"status": "error", "message": "No code generated"})
 
-            code = code_match.group(1)
-            
-           # 2. Execute Code
-            # Define a restricted scope
-            safe_scope = {
-                "plotter": self,
-                "raw_data": raw_data,
-                "json": json,
-                "math": math,
-                "print": print # Allowed for debugging
-            }
-            
-            # Execute
+            # 3. Execute Code
             try:
-                exec(code, safe_scope)
-                if 'draw' in safe_scope:
-                    image_path = safe_scope['draw']()
-                    return json.dumps({
-                        "status": "success", 
-                        "images": [image_path],
-                        "rationale": "Chart generated."
-                    })
-                else:
-                    return json.dumps({"status": "error", "message": "No draw() function found"})
+                image_path = self._run_code(code, raw_data)
             except Exception as exec_err:
-                 return json.dumps({"status": "error", "message": f"Code execution failed: {exec_err}"})
+                return json.dumps({"status": "error", "message": f"Code execution failed: {exec_err}"})
+
+            if self._is_image(image_path):
+                CHART_CODE_CACHE.put(cache_key, code, query)
+            return json.dumps({
+                "status": "success", 
+                "images": [image_path],
+                "rationale": "Chart generated."
+            })
 
         except Exception as e:
             return json.dumps({"status": "error", "message": str(e)})
@@ -1,6 +1,6 @@
 # tools/tally_company_tool.py
 import pyodbc
-from langchain.tools import tool
+from langchain_core.tools import tool
 from dotenv import load_dotenv
 import os
 
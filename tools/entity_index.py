@@ -0,0 +1,379 @@
+# tools/entity_index.py
+"""
+In-memory index of each company's ledger, party and stock item names.
+
+Questions name masters loosely ("HDFC current account", "pvc resin 50 kg").
+The index resolves those phrases to the exact master names, so tdl_requests
+can ask Tally for just that ledger's vouchers or that item's movement.
+
+- NameIndex: fuzzy search over a list of names. Scores combine character
+  trigrams (typos, "a/c" vs "account") with token prefixes ("hdfc cur" while
+  typing). find_mentions() picks the names a free-text question refers to.
+  The query planner uses it for report row labels too.
+- EntityIndex: one NameIndex of masters per company. It is built from a
+  Ledger and a StockItem collection export (Name, Parent, GUID, AlterID). It
+  is checked at most every ENTITY_INDEX_CHECK_INTERVAL seconds against the
+  company's master AlterID (shared with the prefetch probe). When that moves,
+  only masters with a higher AlterID are fetched and applied as deltas (new
+  names added, renamed ones retired). A full re-fetch every
+  ENTITY_INDEX_FULL_REFRESH seconds also retires deleted masters.
+"""
+import bisect
+import json
+import os
+import re
+import threading
+import time
+from collections import Counter
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+try:
+    from tools.report_cache import get_report_cache
+except ImportError:
+    from report_cache import get_report_cache
+
+ENTITY_INDEX_CHECK_INTERVAL = float(os.getenv("ENTITY_INDEX_CHECK_INTERVAL", "60"))
+ENTITY_INDEX_FULL_REFRESH = float(os.getenv("ENTITY_INDEX_FULL_REFRESH", str(6 * 3600)))
+MENTION_MIN_SCORE = 0.8
+MENTION_MAX_WORDS = 6
+MAX_CANDIDATES = 200  # names scored per search (most shared trigrams first)
+NUMBER_MISMATCH_CAP = 0.75  # below MENTION_MIN_SCORE: still suggested, never taken as a mention
+
+KINDS = ("ledger", "party", "item")
+PARTY_GROUPS = ("Sundry Debtors", "Sundry Creditors")
+
+# Words that never start a mention ("total", "balance", "april" ...); names may end in one ("... A/c")
+STOPWORDS = frozenset("""
+a an and the of for in on at to from by with is are was were what whats how much many show list give get tell me
+my our all each every per this that these those last next previous current today yesterday month year week day
+total sum amount value balance balances closing opening count number top bottom average highest lowest
+debit credit dr cr between vs versus as so far till until since during
+jan feb mar apr may jun jul aug sep sept oct nov dec january february march april june july august september
+october november december fy financial
+sales sale purchase purchases receipt receipts payment payments journal contra voucher vouchers transactions
+entries ledger ledgers account accounts ac party parties item items stock movement report group
+""".split())
+
+_SYNONYMS = ((r"\ba\s*/\s*c\b|\bacct\b|\baccount\b", "ac"), (r"&", " and "), (r"\bpvt\b\.?", "private"),
+             (r"\bltd\b\.?", "limited"), (r"\bco\b\.?", "company"))
+
+
+def normalize_name(text: str) -> str:
+    """'HDFC Current A/c' -> 'hdfc current ac'; '50kg' -> '50 kg'."""
+    text = str(text).lower()
+    for pattern, repl in _SYNONYMS: text = re.sub(pattern, repl, text)
+    text = re.sub(r"(\d)([a-z])", r"\1 \2", text)
+    text = re.sub(r"([a-z])(\d)", r"\1 \2", text)
+    return " ".join(re.sub(r"[^a-z0-9]+", " ", text).split())
+
+
+def _trigrams(norm: str) -> List[str]:
+    padded = f" {norm} "
+    return [padded[i:i + 3] for i in range(len(padded) - 2)]
+
+
+class NameIndex:
+    """Fuzzy lookup over names: trigram postings plus a sorted token list for prefix search."""
+
+    def __init__(self, names: Iterable[str] = ()):
+        self.names: List[str] = []
+        self._norms: List[str] = []
+        self._grams: List[Counter] = []
+        self._postings: Dict[str, List[int]] = {}
+        self._tokens: List[Tuple[str, int]] = []  # (token, id), sorted on first prefix search
+        self._sorted = True
+        self._exact: Dict[str, List[int]] = {}
+        self.removed = set()  # ids of renamed / deleted names; skipped by search
+        self._lock = threading.Lock()  # add/remove vs the lazy token sort
+        for name in names: self.add(name)
+
+    def __len__(self):
+        return len(self.names) - len(self.removed)
+
+    def add(self, name: str) -> int:
+        norm = normalize_name(name)
+        grams = Counter(_trigrams(norm))
+        with self._lock:
+            idx = len(self.names)
+            self.names.append(name)
+            self._norms.append(norm)
+            self._grams.append(grams)
+            for gram in grams: self._postings.setdefault(gram, []).append(idx)
+            self._tokens.extend((token, idx) for token in set(norm.split()))
+            self._sorted = False
+            self._exact.setdefault(norm, []).append(idx)
+        return idx
+
+    def remove(self, idx: int):
+        """Marks a name as gone; its postings stay until the owner rebuilds (see CompanyEntities.sync)."""
+        with self._lock: self.removed.add(idx)
+
+    # --- SCORING ---
+    def _prefix_ids(self, token: str, cap: int = MAX_CANDIDATES) -> List[int]:
+        with self._lock:
+            if not self._sorted:
+                self._tokens.sort()
+                self._sorted = True
+        start = bisect.bisect_left(self._tokens, (token, -1))
+        ids = []
+        for t, idx in self._tokens[start:start + cap]:
+            if not t.startswith(token): break
+            ids.append(idx)
+        return ids
+
+    def _score(self, norm: str, grams: Counter, idx: int) -> float:
+        if norm == self._norms[idx]: return 1.0
+        other = self._grams[idx]
+        common = sum((grams & other).values())
+        dice = 2 * common / (sum(grams.values()) + sum(other.values()))
+
+        # Every query token is the start of a different name token: "hdfc cur" -> "hdfc current ac"
+        name_tokens = self._norms[idx].split()
+        query_tokens = norm.split()
+        used, matched = set(), 0
+        for q in query_tokens:
+            hit = next((i for i, t in enumerate(name_tokens) if i not in used and t.startswith(q)), None)
+            if hit is not None:
+                used.add(hit)
+                matched += 1
+        prefix = 0.0
+        if matched == len(query_tokens):
+            typed = sum(len(q) for q in query_tokens) / max(1, sum(len(name_tokens[i]) for i in used))
+            prefix = 0.55 + 0.35 * (matched / len(name_tokens)) * typed + 0.05 * (matched == len(name_tokens))
+        score = max(dice, prefix)
+
+        # Numbers identify: "sundry debtors 16" is not "Sundry Debtors 3", and "sundry debtors" names neither
+        query_numbers = [t for t in query_tokens if t.isdigit()]
+        name_numbers = [t for t in name_tokens if t.isdigit()]
+        if any(not any(n.startswith(q) for n in name_numbers) for q in query_numbers): return score * 0.5
+        if set(name_numbers) - set(query_numbers): return min(score, NUMBER_MISMATCH_CAP)
+        return score
+
+    def search(self, text: str, limit: int = 5, min_score: float = 0.0) -> List[Tuple[float, int]]:
+        """[(score 0..1, id)] best first."""
+        norm = normalize_name(text)
+        if not norm or not self.names: return []
+        exact = [i for i in self._exact.get(norm, ()) if i not in self.removed]
+        if exact: return [(1.0, i) for i in exact[:limit]]
+
+        grams = Counter(_trigrams(norm))
+        shared = Counter()
+        for gram in grams:
+            posting = self._postings.get(gram)
+            if posting and len(posting) <= max(MAX_CANDIDATES * 20, len(self.names) // 4):  # skip near-universal grams
+                shared.update(posting)
+        candidates = {idx for idx, _ in shared.most_common(MAX_CANDIDATES)}
+        last = norm.split()[-1]
+        if len(last) >= 2: candidates.update(self._prefix_ids(last))
+        candidates -= self.removed
+
+        scored = sorted(((self._score(norm, grams, idx), idx) for idx in candidates), key=lambda s: (-s[0], s[1]))
+        return [(round(score, 3), idx) for score, idx in scored[:limit] if score >= min_score]
+
+    def find_mentions(self, text: str, min_score: float = MENTION_MIN_SCORE, max_words: int = MENTION_MAX_WORDS,
+                      stopwords: Iterable[str] = ()) -> List[Tuple[float, int, str]]:
+        """Names a question refers to: [(score, id, matched phrase)], non-overlapping, best first."""
+        words = normalize_name(text).split()
+        stop = STOPWORDS | {normalize_name(w) for w in stopwords}
+        found = []
+        for i in range(len(words)):
+            if words[i] in stop: continue
+            for j in range(i + 1, min(len(words), i + max_words) + 1):
+                phrase = " ".join(words[i:j])
+                if j - i == 1 and (len(phrase) < 4 or phrase.isdigit()): continue  # too ambiguous alone
+                hits = self.search(phrase, limit=1, min_score=min_score)
+                if hits: found.append((hits[0][0], j - i, i, j, hits[0][1], phrase))
+
+        # Best (then longest) spans first; drop spans overlapping a better one
+        taken, mentions = set(), []
+        for score, _, i, j, idx, phrase in sorted(found, key=lambda f: (-f[0], -f[1], f[2])):
+            if taken & set(range(i, j)) or any(m[1] == idx for m in mentions): continue
+            taken.update(range(i, j))
+            mentions.append((score, idx, phrase))
+        return mentions
+
+
+# --- COMPANY MASTERS ---
+def _master_requests(after_alter_id: int):
+    try: from tools.tdl_requests import CollectionRequest
+    except ImportError: from tdl_requests import CollectionRequest
+    filters = (f"$AlterID > {int(after_alter_id)}",) if after_alter_id else ()
+    return [CollectionRequest("Ledger", ("Name", "Parent", "GUID", "AlterID"), "Ledger Masters",
+                              filters=filters, description="Ledger masters"),
+            CollectionRequest("StockItem", ("Name", "Parent", "BaseUnits", "GUID", "AlterID"), "Stock Item Masters",
+                              filters=filters, description="Stock item masters")]
+
+
+def _text(node) -> str:
+    if isinstance(node, dict): node = node.get("_value", "")
+    return str(node).strip() if node is not None else ""
+
+
+class CompanyEntities:
+    """One company's masters: {guid: entity} plus the NameIndex over their names."""
+
+    def __init__(self, company: str):
+        self.company = company
+        self.entities: Dict[str, Dict] = {}
+        self.index = NameIndex()
+        self._ids: List[str] = []  # NameIndex id -> guid
+        self._id_of: Dict[str, int] = {}  # guid -> its live NameIndex id
+        self.max_alter_id = 0
+        self.master_alter_id: Optional[str] = None  # company's AltMstID when last synced
+        self.built_at = 0.0
+        self.checked_at = float("-inf")
+        self.lock = threading.Lock()
+        self.stats = {"full_builds": 0, "incremental": 0, "fetched": 0, "errors": 0}
+
+    def _fetch(self, after_alter_id: int) -> List[Dict]:
+        try: from tools.tdl_requests import export_collection
+        except ImportError: from tdl_requests import export_collection
+        rows = []
+        for request in _master_requests(after_alter_id):
+            payload = export_collection(self.company, request)
+            if payload.startswith(("Error", "Unknown")): raise RuntimeError(payload)
+            for obj in json.loads(payload).get(request.object_type.upper(), []):
+                name = _text(obj.get("NAME")) or _text((obj.get("LANGUAGENAME.LIST") or {}).get("NAME.LIST", {}).get("NAME"))
+                if not name: continue
+                parent = _text(obj.get("PARENT"))
+                kind = "item" if request.object_type == "StockItem" else "party" if parent in PARTY_GROUPS else "ledger"
+                try: alter_id = int(_text(obj.get("ALTERID")) or 0)
+                except ValueError: alter_id = 0
+                rows.append({"name": name, "kind": kind, "parent": parent, "guid": _text(obj.get("GUID")) or f"{kind}:{name}",
+                             "alter_id": alter_id, "unit": _text(obj.get("BASEUNITS")) or None})
+        return rows
+
+    # --- INDEX DELTAS ---
+    def _index(self, guid: str, entity: Dict):
+        """New master: add its name. Renamed: retire the old id, add the new name. Otherwise nothing."""
+        old = self._id_of.get(guid)
+        if old is not None:
+            if self.index.names[old] == entity["name"]: return
+            self.index.remove(old)
+        self._ids.append(guid)  # before add(): a concurrent search may see the new id at once
+        self._id_of[guid] = self.index.add(entity["name"])
+
+    def _drop(self, guid: str):
+        """Master deleted in Tally."""
+        self.entities.pop(guid, None)
+        old = self._id_of.pop(guid, None)
+        if old is not None: self.index.remove(old)
+
+    def _compact(self):
+        """Rebuilds the NameIndex once retired ids outnumber live ones (then swaps it in whole)."""
+        index, ids = NameIndex(), []
+        for guid, entity in self.entities.items():
+            ids.append(guid)
+            index.add(entity["name"])
+        self._id_of = {guid: i for i, guid in enumerate(ids)}
+        self.index, self._ids = index, ids
+
+    def sync(self, master_alter_id: Optional[str], full: bool):
+        """
+        Applies what changed since the last sync: masters with a higher AlterID (new or altered; renames keep
+        their GUID). A full sync re-fetches every master and also retires the ones deleted in Tally.
+        """
+        rows = self._fetch(0 if full else self.max_alter_id)
+        if full:
+            seen = {row["guid"] for row in rows}
+            for guid in [g for g in self.entities if g not in seen]: self._drop(guid)
+        for row in rows:
+            self.entities[row["guid"]] = row
+            self._index(row["guid"], row)
+        if len(self.index.removed) > max(len(self.entities), 1000): self._compact()
+        self.max_alter_id = max([self.max_alter_id] + [r["alter_id"] for r in rows])
+        self.master_alter_id = master_alter_id
+        self.stats["full_builds" if full else "incremental"] += 1
+        self.stats["fetched"] += len(rows)
+        if full: self.built_at = time.monotonic()
+
+    def entity(self, idx: int) -> Optional[Dict]:
+        """The master behind a NameIndex id (None if it was deleted since the search)."""
+        return self.entities.get(self._ids[idx])
+
+
+class EntityIndex:
+    def __init__(self, check_interval: float = ENTITY_INDEX_CHECK_INTERVAL,
+                 full_refresh: float = ENTITY_INDEX_FULL_REFRESH):
+        self.check_interval = check_interval
+        self.full_refresh = full_refresh
+        self._companies: Dict[str, CompanyEntities] = {}
+        self._lock = threading.Lock()
+
+    def _master_alter_id(self, company: str) -> Optional[str]:
+        """Company's AltMstID (from a recent prefetch probe when there is one), or None if Tally didn't say."""
+        ids = get_report_cache().last_probe(company)
+        if ids is None:
+            try: from tools.prefetch import probe_alter_ids
+            except ImportError: from prefetch import probe_alter_ids
+            ids = probe_alter_ids(company)
+            if ids is not None: get_report_cache().record_probe(company, ids)
+        return ids.split("/", 1)[1] if ids and "/" in ids else None
+
+    def company(self, company: str) -> CompanyEntities:
+        """The company's masters, built on first use and kept in step with Tally (see module docstring)."""
+        with self._lock:
+            entry = self._companies.setdefault(company, CompanyEntities(company))
+        with entry.lock:
+            now = time.monotonic()
+            if now - entry.checked_at < self.check_interval: return entry
+            entry.checked_at = now
+            try:
+                full = not entry.built_at or now - entry.built_at > self.full_refresh
+                master_alter_id = self._master_alter_id(company)
+                if full or master_alter_id is None or master_alter_id != entry.master_alter_id:
+                    entry.sync(master_alter_id, full)
+            except Exception as e:
+                entry.stats["errors"] += 1
+                print(f"⚠️ Entity index refresh failed for '{company}': {e}")
+        return entry
+
+    # --- LOOKUPS ---
+    def search(self, company: str, text: str, kinds: Optional[Sequence[str]] = None,
+               limit: int = 10) -> List[Dict]:
+        """Best matching masters for a typed name (autocomplete / disambiguation)."""
+        entry = self.company(company)
+        results = []
+        for score, idx in entry.index.search(text, limit=limit * 3 if kinds else limit):
+            entity = entry.entity(idx)
+            if entity is None or (kinds and entity["kind"] not in kinds): continue
+            results.append({**entity, "score": score})
+        return results[:limit]
+
+    def mentions(self, company: str, text: str, kinds: Optional[Sequence[str]] = None,
+                 min_score: float = MENTION_MIN_SCORE) -> List[Dict]:
+        """Masters the question names, e.g. 'HDFC current account receipts' -> [HDFC Current A/c]."""
+        try:
+            entry = self.company(company)
+        except Exception as e:
+            print(f"⚠️ Entity lookup failed for '{company}': {e}")
+            return []
+        found = []
+        for score, idx, phrase in entry.index.find_mentions(text, min_score=min_score):
+            entity = entry.entity(idx)
+            if entity is None or (kinds and entity["kind"] not in kinds): continue
+            found.append({**entity, "score": score, "phrase": phrase})
+        return found
+
+    def status(self) -> Dict:
+        with self._lock:
+            entries = list(self._companies.values())
+        now = time.monotonic()
+        return {e.company: {"entities": len(e.entities),
+                            "by_kind": dict(Counter(x["kind"] for x in e.entities.values())),
+                            "max_alter_id": e.max_alter_id, "master_alter_id": e.master_alter_id,
+                            "built_seconds_ago": round(now - e.built_at, 1) if e.built_at else None, **e.stats}
+                for e in entries}
+
+
+_INDEX: Optional[EntityIndex] = None
+_INDEX_LOCK = threading.Lock()
+
+
+def get_entity_index() -> EntityIndex:
+    """Process-wide index shared by the agents and the API."""
+    global _INDEX
+    with _INDEX_LOCK:
+        if _INDEX is None:
+            _INDEX = EntityIndex()
+        return _INDEX
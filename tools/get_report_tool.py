@@ -1,14 +1,19 @@
 # tools/get_report_tool.py
-import requests
 import xml.etree.ElementTree as ET
-from langchain.tools import tool
+from langchain_core.tools import tool
 from dotenv import load_dotenv
 import os
 import json
 import re
 
+try:
+    from tools.report_cache import cache_key, get_report_cache
+    from tools.tally_hosts import TALLY_URL, get_host_registry
+except ImportError:
+    from report_cache import cache_key, get_report_cache
+    from tally_hosts import TALLY_URL, get_host_registry
+
 load_dotenv()
-TALLY_URL = os.getenv("TALLY_HTTP_HOST", "http://localhost:9000")
 
 def escape_xml(value: str) -> str:
     """Escapes special characters for XML requests."""
@@ -56,12 +61,85 @@ def clean_tally_xml(xml_string: str) -> str:
 
     return xml_string.strip()
 
+def decode_tally_bytes(content: bytes) -> str:
+    """Decodes a raw Tally response (UTF-16 / UTF-8 with or without BOM)."""
+    try:
+        if content.startswith(b'\xff\xfe'): return content.decode('utf-16')
+        elif content.startswith(b'\xef\xbb\xbf'): return content.decode('utf-8-sig')
+        else: return content.decode('utf-8')
+    except:
+        return content.decode('latin-1')
+
+def xml_to_dict(elem):
+    """Converts an ElementTree node to a dict. Repeated child tags become lists."""
+    d = {}
+    d.update(elem.attrib)
+    children = list(elem)
+    if children:
+        child_counts = {}
+        for child in children:
+            child_counts[child.tag] = child_counts.get(child.tag, 0) + 1
+        for child in children:
+            child_dict = xml_to_dict(child)
+            if child_counts[child.tag] > 1:
+                if child.tag not in d: d[child.tag] = []
+                d[child.tag].append(child_dict)
+            else:
+                d[child.tag] = child_dict
+    text = elem.text.strip() if elem.text else ""
+    if text:
+        if children or d: d["_value"] = text
+        else: return text
+    return d
+
 @tool("get_report")
-def get_report(company_name: str, report_name: str) -> str:
-    """Fetch data from Tally via XML over HTTP."""
+def get_report(company_name: str, report_name: str, from_date: str = "", to_date: str = "") -> str:
+    """Fetch data from Tally via XML over HTTP. Optional from_date/to_date are YYYYMMDD."""
+    # Recent exports (and ones the prefetch scheduler keeps warm) are served from memory
+    key = cache_key(company_name, report_name, from_date, to_date)
+    return get_report_cache().get_or_fetch(
+        key, lambda: export_report(company_name, report_name, from_date, to_date), is_report_payload)
+
+def is_report_payload(payload: str) -> bool:
+    """True for a parsed report; False for the error strings export_report returns."""
+    return not payload.startswith(("Error", "Unknown"))
+
+def post_xml(company_name: str, xml_req: str, what: str):
+    """Sends one request to the company's Tally host. Returns the reply as a dict, or an error string."""
+    # Routed to the company's Tally host (its own pool, concurrency cap and health status)
+    response = get_host_registry().post(company_name, xml_req, timeout=45)
+
+    # Decoding
+    decoded_xml = decode_tally_bytes(response.content)
+
+    # --- RUN THE NUCLEAR CLEANER ---
+    decoded_xml = clean_tally_xml(decoded_xml)
+
+    if "Unknown Request" in decoded_xml or "LINEERROR" in decoded_xml:
+         return f"Error: Tally refused the request for {what}."
+
+    # Parse XML
+    try:
+        root = ET.fromstring(decoded_xml)
+    except ET.ParseError as e:
+        # If it fails, let's wrap it in ROOT just in case
+        try:
+            decoded_xml = f"<ROOT>{decoded_xml}</ROOT>"
+            root = ET.fromstring(decoded_xml)
+        except:
+            # Debugging: Return the specific error location
+            return f"Error parsing Tally XML: {str(e)}"
+
+    return xml_to_dict(root)
+
+def export_report(company_name: str, report_name: str, from_date: str = "", to_date: str = "") -> str:
+    """One uncached export: the report as JSON text, or an error string."""
     try:
         safe_report = escape_xml(report_name)
         safe_company = escape_xml(company_name)
+        period = ""
+        if from_date: period += f"\n                            <SVFROMDATE>{escape_xml(from_date)}</SVFROMDATE>"
+        if to_date: period += f"\n                            <SVTODATE>{escape_xml(to_date)}</SVTODATE>"
 
         xml_req = f"""<ENVELOPE>
             <HEADER>
@@ -73,66 +151,15 @@ def get_report(company_name: str, report_name: str) -> str:
                         <REPORTNAME>{safe_report}</REPORTNAME>
                         <STATICVARIABLES>
                             <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
-                            <SVCurrentCompany>{safe_company}</SVCurrentCompany>
+                            <SVCurrentCompany>{safe_company}</SVCurrentCompany>{period}
                         </STATICVARIABLES>
                     </REQUESTDESC>
                 </EXPORTDATA>
             </BODY>
         </ENVELOPE>"""
 
-        response = requests.post(TALLY_URL, data=xml_req, timeout=45)
-
-        # Decoding
-        content = response.content
-        decoded_xml = ""
-        try:
-            if content.startswith(b'\xff\xfe'): decoded_xml = content.decode('utf-16')
-            elif content.startswith(b'\xef\xbb\xbf'): decoded_xml = content.decode('utf-8-sig')
-            else: decoded_xml = content.decode('utf-8')
-        except:
-            decoded_xml = content.decode('latin-1')
-
-        # --- RUN THE NUCLEAR CLEANER ---
-        decoded_xml = clean_tally_xml(decoded_xml)
-
-        if "Unknown Request" in decoded_xml or "LINEERROR" in decoded_xml:
-             return f"Error: Tally refused the request for '{report_name}'."
-
-        # Parse XML
-        try:
-            root = ET.fromstring(decoded_xml)
-        except ET.ParseError as e:
-            # If it fails, let's wrap it in ROOT just in case
-            try:
-                decoded_xml = f"<ROOT>{decoded_xml}</ROOT>"
-                root = ET.fromstring(decoded_xml)
-            except:
-                # Debugging: Return the specific error location
-                return f"Error parsing Tally XML: {str(e)}"
-
-        # Convert to Dict
-        def xml_to_dict(elem):
-            d = {}
-            d.update(elem.attrib)
-            children = list(elem)
-            if children:
-                child_counts = {}
-                for child in children:
-                    child_counts[child.tag] = child_counts.get(child.tag, 0) + 1
-                for child in children:
-                    child_dict = xml_to_dict(child)
-                    if child_counts[child.tag] > 1:
-                        if child.tag not in d: d[child.tag] = []
-                        d[child.tag].append(child_dict)
-                    else:
-                        d[child.tag] = child_dict
-            text = elem.text.strip() if elem.text else ""
-            if text:
-                if children or d: d["_value"] = text
-                else: return text
-            return d
-
-        data_dict = xml_to_dict(root)
+        data_dict = post_xml(company_name, xml_req, f"'{report_name}'")
+        if isinstance(data_dict, str): return data_dict
         
         if "BODY" in data_dict and "IMPORTDATA" in data_dict["BODY"]:
             clean_data = data_dict["BODY"]["IMPORTDATA"]
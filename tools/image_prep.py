@@ -0,0 +1,106 @@
+# tools/image_prep.py
+"""
+Prepares chart/table images before they are sent to the VLM.
+
+Images are downscaled to a pixel budget that matches what Gemini actually
+looks at, re-encoded as WebP and cached by the SHA-256 of the source file,
+so the same chart is never re-encoded twice.
+"""
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+from typing import Dict, Optional
+
+from PIL import Image
+
+PLOTS_DIR = "generated_plots"
+
+# Gemini tiles images at 768x768; anything larger only adds upload time.
+VLM_MAX_PIXELS = int(os.getenv("VLM_MAX_PIXELS", str(768 * 768)))
+VLM_IMAGE_QUALITY = int(os.getenv("VLM_IMAGE_QUALITY", "80"))
+
+# Images that are pure renders of report rows (the digest already carries them)
+STRUCTURED_IMAGE_PREFIXES = ("table_",)
+
+
+class ImagePreparer:
+    def __init__(self, max_pixels: int = VLM_MAX_PIXELS, quality: int = VLM_IMAGE_QUALITY,
+                 cache_dir: str = os.path.join(PLOTS_DIR, ".vlm_cache"), memory_items: int = 64):
+        self.max_pixels = max_pixels
+        self.quality = quality
+        self.cache_dir = cache_dir
+        self.memory_items = memory_items
+        self._memory: "OrderedDict[str, bytes]" = OrderedDict()
+        self._hashes: Dict[tuple, str] = {}
+        self._lock = threading.Lock()
+        os.makedirs(cache_dir, exist_ok=True)
+
+    # --- HELPER: Hashing ---
+    def _file_hash(self, path: str) -> str:
+        st = os.stat(path)
+        stamp = (os.path.abspath(path), st.st_size, st.st_mtime_ns)
+        with self._lock:
+            if stamp in self._hashes: return self._hashes[stamp]
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""):
+                h.update(chunk)
+        digest = h.hexdigest()
+        with self._lock:
+            self._hashes[stamp] = digest
+        return digest
+
+    # --- HELPER: Encoding ---
+    def _encode(self, path: str) -> bytes:
+        with Image.open(path) as img:
+            img = img.convert("RGB")
+            w, h = img.size
+            if w * h > self.max_pixels:
+                scale = (self.max_pixels / float(w * h)) ** 0.5
+                img = img.resize((max(1, int(w * scale)), max(1, int(h * scale))), Image.LANCZOS)
+            buf = io.BytesIO()
+            img.save(buf, format="WEBP", quality=self.quality, method=4)
+            return buf.getvalue()
+
+    def _remember(self, key: str, data: bytes):
+        with self._lock:
+            self._memory[key] = data
+            self._memory.move_to_end(key)
+            while len(self._memory) > self.memory_items:
+                self._memory.popitem(last=False)
+
+    # --- PUBLIC ---
+    def should_send(self, path: str, has_structured_data: bool) -> bool:
+        """Table images add nothing the model can't read from the data digest."""
+        name = os.path.basename(path)
+        return not (has_structured_data and name.startswith(STRUCTURED_IMAGE_PREFIXES))
+
+    def prepare(self, path: str) -> Optional[dict]:
+        """Returns a Gemini inline image part ({"mime_type", "data"}) or None if unreadable."""
+        if not os.path.exists(path): return None
+        try:
+            key = f"{self._file_hash(path)}_{self.max_pixels}_{self.quality}"
+            with self._lock:
+                data = self._memory.get(key)
+                if data is not None: self._memory.move_to_end(key)
+
+            if data is None:
+                cache_path = os.path.join(self.cache_dir, f"{key}.webp")
+                if os.path.exists(cache_path):
+                    with open(cache_path, "rb") as f: data = f.read()
+                else:
+                    data = self._encode(path)
+                    tmp_path = f"{cache_path}.{threading.get_ident()}.tmp"
+                    with open(tmp_path, "wb") as f: f.write(data)
+                    os.replace(tmp_path, cache_path)
+                self._remember(key, data)
+
+            return {"mime_type": "image/webp", "data": data}
+        except Exception:
+            return None
+
+
+IMAGE_PREPARER = ImagePreparer()
@@ -0,0 +1,173 @@
+# tools/image_variants.py
+"""
+Browser-facing image variants and cache validators for generated charts/tables.
+
+GET /images/{path} serves a generated image as:
+- the original file (format=original, or SVG, which is already small), or
+- a WebP re-encode, optionally downscaled to a width bucket (w=320 thumbnails,
+  640, 1024, ...). Requested widths are snapped up to the next bucket, so
+  there are at most a handful of variants per image.
+
+Variants are encoded once and kept in the artifact store (they count against
+its budget and are evicted like any other artifact). Every response carries a
+strong ETag (hash of the bytes served). Content-addressed names
+(chart_<kind>_<hash>, table_<hash>) never change, so they also get
+`Cache-Control: immutable`. Everything else must be revalidated, and a
+matching If-None-Match gets a 304.
+"""
+import hashlib
+import os
+import re
+import threading
+import uuid
+from typing import Dict, Optional, Tuple
+
+try:
+    from tools.artifact_store import PLOTS_DIR, get_artifact_store
+except ImportError:
+    from artifact_store import PLOTS_DIR, get_artifact_store
+
+IMAGE_WIDTHS = (320, 640, 1024, 1600)
+THUMBNAIL_WIDTH = IMAGE_WIDTHS[0]
+WEBP_QUALITY = int(os.getenv("WEBP_QUALITY", "82"))
+
+IMMUTABLE_CACHE = "public, max-age=31536000, immutable"
+REVALIDATE_CACHE = "public, no-cache"
+
+MEDIA_TYPES = {".png": "image/png", ".jpg": "image/jpeg", ".jpeg": "image/jpeg",
+               ".webp": "image/webp", ".svg": "image/svg+xml"}
+RASTER_EXTS = (".png", ".jpg", ".jpeg", ".webp")
+FORMATS = ("auto", "webp", "original")
+
+# Names derived from a hash of their content (see chart_vlm_tool._chart_path, TableGenerator._save_table)
+_CONTENT_ADDRESSED_RE = re.compile(r"^(?:chart_[a-z]+|table)_[0-9a-f]{24}\.[a-z]+$")
+
+
+class ImageNotFound(Exception):
+    """Unknown path, not an image, or outside generated_plots."""
+
+
+def is_content_addressed(path: str) -> bool:
+    return bool(_CONTENT_ADDRESSED_RE.match(os.path.basename(path)))
+
+
+def snap_width(width: Optional[int]) -> Optional[int]:
+    """Requested width -> the smallest bucket that is at least as wide (None: full size)."""
+    if not width or width <= 0: return None
+    return next((w for w in IMAGE_WIDTHS if w >= width), IMAGE_WIDTHS[-1])
+
+
+class ImageVariants:
+    def __init__(self, quality: int = WEBP_QUALITY):
+        self.quality = quality
+        self._etags: Dict[tuple, str] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    # --- VALIDATORS ---
+    def etag(self, path: str) -> str:
+        """Strong ETag: SHA-256 of the file, cached by (path, size, mtime)."""
+        st = os.stat(path)
+        stamp = (path, st.st_size, st.st_mtime_ns)
+        with self._lock:
+            tag = self._etags.get(stamp)
+        if tag: return tag
+
+        h = hashlib.sha256()
+        with open(path, "rb") as f:
+            for chunk in iter(lambda: f.read(1 << 20), b""): h.update(chunk)
+        tag = f'"{h.hexdigest()[:32]}"'
+        with self._lock:
+            if len(self._etags) > 4096: self._etags.clear()
+            self._etags[stamp] = tag
+        return tag
+
+    # --- SOURCE ---
+    def resolve(self, path: str) -> str:
+        """Client path -> a generated image on disk, or ImageNotFound."""
+        key = os.path.normpath(path.lstrip("/")).replace("\\", "/")
+        if key.startswith("..") or not key.startswith(PLOTS_DIR + "/"):
+            raise ImageNotFound(path)
+        if os.path.splitext(key)[1].lower() not in MEDIA_TYPES or not get_artifact_store().exists(key):
+            raise ImageNotFound(path)
+        return key
+
+    # --- VARIANTS ---
+    def _variant_path(self, source: str, width: Optional[int]) -> str:
+        st = os.stat(source)
+        stem = os.path.splitext(os.path.basename(source))[0]
+        # The source's size/mtime are part of the name, so a rewritten source never serves a stale variant
+        stamp = hashlib.sha1(f"{source}|{st.st_size}|{st.st_mtime_ns}".encode("utf-8")).hexdigest()[:8]
+        return get_artifact_store().path_for("variants", f"{stem}_{stamp}_w{width or 'full'}.webp")
+
+    def _encode(self, source: str, target: str, width: Optional[int]):
+        from PIL import Image  # only needed when a variant is first requested
+
+        with Image.open(source) as img:
+            img = img.convert("RGBA" if img.mode in ("RGBA", "LA", "P") else "RGB")
+            if width and img.width > width:
+                img = img.resize((width, max(1, round(img.height * width / img.width))), Image.LANCZOS)
+            tmp_name = f"{target}.{uuid.uuid4().hex[:8]}.tmp"
+            img.save(tmp_name, format="WEBP", quality=self.quality, method=4)
+        os.replace(tmp_name, target)
+        get_artifact_store().register(target)
+
+    def variant(self, source: str, width: Optional[int] = None) -> str:
+        """WebP of the source at the width bucket; encoded on first request (once, even under concurrency)."""
+        target = self._variant_path(source, width)
+        store = get_artifact_store()
+        if store.exists(target): return target
+        with self._lock:
+            lock = self._locks.setdefault(target, threading.Lock())
+        with lock:
+            if not store.exists(target): self._encode(source, target, width)
+        with self._lock:
+            self._locks.pop(target, None)
+        return target
+
+    # --- ENTRY POINT ---
+    def select(self, path: str, fmt: str = "auto", width: Optional[int] = None,
+               accept: str = "") -> Tuple[str, str, Dict[str, str]]:
+        """
+        Picks the file to send -> (file path, media type, headers with ETag/Cache-Control[/Vary]).
+        fmt: 'auto' (WebP if the client accepts it), 'webp' or 'original'. width: thumbnail/resize bucket.
+        """
+        fmt = (fmt or "auto").lower()
+        if fmt not in FORMATS:
+            raise ValueError(f"Unsupported format '{fmt}'. Use one of {FORMATS}.")
+        source = self.resolve(path)
+        ext = os.path.splitext(source)[1].lower()
+        width = snap_width(width)
+
+        headers = {}
+        use_webp = ext in RASTER_EXTS and (fmt == "webp" or width is not None
+                                           or (fmt == "auto" and "image/webp" in (accept or "")))
+        if fmt == "auto" and ext in RASTER_EXTS: headers["Vary"] = "Accept"
+        if fmt == "original" and width is not None and ext in RASTER_EXTS:
+            raise ValueError("Resized variants are WebP; drop format=original or the width.")
+
+        served = self.variant(source, width) if use_webp else source
+        headers["ETag"] = self.etag(served)
+        headers["Cache-Control"] = IMMUTABLE_CACHE if is_content_addressed(source) else REVALIDATE_CACHE
+        return served, "image/webp" if use_webp else MEDIA_TYPES[ext], headers
+
+
+def etag_matches(if_none_match: Optional[str], etag: str) -> bool:
+    """If-None-Match check (weak comparison, as RFC 9110 requires for GET)."""
+    if not if_none_match: return False
+    if if_none_match.strip() == "*": return True
+    bare = etag.removeprefix("W/")
+    return any(tag.strip().removeprefix("W/") == bare for tag in if_none_match.split(","))
+
+
+_VARIANTS: Optional[ImageVariants] = None
+_VARIANTS_LOCK = threading.Lock()
+
+
+def get_image_variants() -> ImageVariants:
+    """Process-wide encoder shared by the API workers."""
+    global _VARIANTS
+    with _VARIANTS_LOCK:
+        if _VARIANTS is None:
+            _VARIANTS = ImageVariants()
+        return _VARIANTS
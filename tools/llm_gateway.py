@@ -0,0 +1,378 @@
+# tools/llm_gateway.py
+"""
+One gateway for every Gemini call (ReAct supervisor, chart code, summarizer).
+
+- Clients are built once per model and reused (LangChain chat models and
+  google.generativeai models; genai.configure runs once).
+- Limits: LLM_MAX_CONCURRENCY calls at once overall, LLM_MODEL_CONCURRENCY
+  per model, and a per-model token bucket of LLM_RPM requests per minute
+  (bursts up to LLM_BURST). Waiting longer than LLM_QUEUE_TIMEOUT raises LLMBusy.
+- Rate-limit / overload / timeout errors are retried up to LLM_MAX_RETRIES
+  times with full-jitter exponential backoff. The clients' own retries are
+  turned off, so retries don't multiply.
+- Small independent text prompts (complete(..., batchable=True)) that arrive
+  within LLM_BATCH_WINDOW_MS of each other are sent as one request that
+  answers all of them as a JSON array. If the reply can't be split, each
+  prompt is sent on its own. Gemini's generate_content has no multi-prompt
+  call, so this is done in the prompt.
+- Calls, retries, errors, tokens and latency are counted per call site
+  (GET /llm/stats).
+
+The client classes are looked up on their modules when a client is first
+built, so benchmarks/fake_llm.install_fakes() (which also resets the cached
+clients) keeps working.
+"""
+import json
+import os
+import random
+import re
+import threading
+import time
+from concurrent.futures import Future
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from dotenv import load_dotenv
+
+load_dotenv()
+
+DEFAULT_MODEL = os.getenv("GEMINI_MODEL") or "models/gemini-2.0-flash-exp"
+
+LLM_MAX_CONCURRENCY = int(os.getenv("LLM_MAX_CONCURRENCY", "8"))
+LLM_MODEL_CONCURRENCY = int(os.getenv("LLM_MODEL_CONCURRENCY", "4"))
+LLM_RPM = float(os.getenv("LLM_RPM", "60"))  # per model
+LLM_BURST = int(os.getenv("LLM_BURST", "10"))
+LLM_QUEUE_TIMEOUT = float(os.getenv("LLM_QUEUE_TIMEOUT", "120"))
+LLM_MAX_RETRIES = int(os.getenv("LLM_MAX_RETRIES", "3"))
+LLM_RETRY_BASE = 1.0  # seconds; attempt n sleeps uniform(0, min(cap, base * 2**n))
+LLM_RETRY_CAP = 20.0
+LLM_BATCH_WINDOW_MS = float(os.getenv("LLM_BATCH_WINDOW_MS", "40"))
+LLM_BATCH_MAX = int(os.getenv("LLM_BATCH_MAX", "4"))
+LLM_BATCH_MAX_CHARS = int(os.getenv("LLM_BATCH_MAX_CHARS", "6000"))  # larger prompts always go alone
+
+_RETRYABLE_NAMES = ("ResourceExhausted", "TooManyRequests", "ServiceUnavailable", "DeadlineExceeded",
+                    "InternalServerError", "Timeout", "ConnectionError")
+_RETRYABLE_TEXT = re.compile(r"\b(429|500|503|504)\b|rate limit|quota|overloaded|timed? ?out|unavailable", re.I)
+
+BATCH_HEADER = "INDEPENDENT TASKS"
+_TASK_RE = re.compile(r"<<<TASK (\d+)>>>\n(.*?)\n<<<END TASK \1>>>", re.DOTALL)
+
+
+class LLMBusy(Exception):
+    """No LLM slot (or rate-limit token) became free within LLM_QUEUE_TIMEOUT."""
+
+
+def is_retryable(error: Exception) -> bool:
+    name = type(error).__name__
+    return any(n in name for n in _RETRYABLE_NAMES) or bool(_RETRYABLE_TEXT.search(str(error)))
+
+
+def batch_prompt(prompts: List[str]) -> str:
+    """Several independent prompts -> one prompt asking for a JSON array of answers."""
+    tasks = "\n\n".join(f"<<<TASK {i}>>>\n{p}\n<<<END TASK {i}>>>" for i, p in enumerate(prompts, 1))
+    return (f"{BATCH_HEADER}: answer each of the {len(prompts)} tasks below on its own, exactly as if it were "
+            f"the only request (follow each task's own output format, including code fences).\n"
+            f"Return ONLY a JSON array of {len(prompts)} strings; element i is the complete answer to TASK i.\n\n"
+            f"{tasks}")
+
+
+def split_batch_prompt(prompt: str) -> List[str]:
+    """Inverse of batch_prompt (used by the fake model); [] if prompt isn't a batch."""
+    if not prompt.startswith(BATCH_HEADER): return []
+    return [body for _, body in _TASK_RE.findall(prompt)]
+
+
+def split_batch_answer(text: str, n: int) -> Optional[List[str]]:
+    """JSON array of n strings from a batched reply (tolerates a ```json fence), else None."""
+    start, end = text.find("["), text.rfind("]")
+    if start < 0 or end <= start: return None
+    try: answers = json.loads(text[start:end + 1])
+    except ValueError: return None
+    if not isinstance(answers, list) or len(answers) != n or not all(isinstance(a, str) for a in answers):
+        return None
+    return answers
+
+
+class TokenBucket:
+    def __init__(self, rate_per_minute: float, burst: int):
+        self.rate = max(rate_per_minute, 0.001) / 60.0
+        self.capacity = max(1, burst)
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self, timeout: float) -> bool:
+        deadline = time.monotonic() + timeout
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return True
+                wait = (1 - self.tokens) / self.rate
+            if time.monotonic() + wait > deadline: return False
+            time.sleep(wait)
+
+
+class _Batch:
+    def __init__(self):
+        self.items: List[Tuple[str, str, Future]] = []  # (call site, prompt, future)
+        self.full = threading.Event()
+
+
+_FALLBACK = object()  # batch reply couldn't be split: each caller sends its own prompt
+
+
+class LLMGateway:
+    def __init__(self):
+        self._global = threading.BoundedSemaphore(max(1, LLM_MAX_CONCURRENCY))
+        self._models: Dict[str, Tuple[threading.BoundedSemaphore, TokenBucket]] = {}
+        self._chat_clients: Dict[tuple, Any] = {}
+        self._genai_models: Dict[str, Any] = {}
+        self._configured = False
+        self._batches: Dict[str, _Batch] = {}
+        self._lock = threading.Lock()
+        self._stats: Dict[str, Dict[str, float]] = {}
+
+    # --- CLIENTS ---
+    def reset_clients(self):
+        """Drops cached clients (e.g. after benchmarks/fake_llm.install_fakes())."""
+        with self._lock:
+            self._chat_clients.clear()
+            self._genai_models.clear()
+            self._configured = False
+
+    def _chat_client(self, model: str, temperature: Optional[float]):
+        key = (model, temperature)
+        with self._lock:
+            client = self._chat_clients.get(key)
+            if client is None:
+                import langchain_google_genai
+                kwargs = {"temperature": temperature} if temperature is not None else {}
+                client = langchain_google_genai.ChatGoogleGenerativeAI(
+                    model=model, google_api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"),
+                    max_retries=1, **kwargs)  # the gateway retries
+                self._chat_clients[key] = client
+            return client
+
+    def _genai_model(self, model: str):
+        with self._lock:
+            client = self._genai_models.get(model)
+            if client is None:
+                import google.generativeai as genai
+                if not self._configured:
+                    genai.configure(api_key=os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY"))
+                    self._configured = True
+                client = self._genai_models[model] = genai.GenerativeModel(model)
+            return client
+
+    def chat_model(self, call_site: str, model: str = DEFAULT_MODEL, temperature: Optional[float] = None):
+        """LangChain chat model (for agents/chains) whose every call goes through the gateway."""
+        return _gateway_chat_class()(inner=self._chat_client(model, temperature), gateway=self,
+                                     call_site=call_site, model_name=model)
+
+    # --- LIMITS + RETRIES ---
+    def _limits(self, model: str):
+        # "models/gemini-x" and "gemini-x" are one model: one semaphore, one token bucket
+        key = model.removeprefix("models/")
+        with self._lock:
+            if key not in self._models:
+                self._models[key] = (threading.BoundedSemaphore(max(1, LLM_MODEL_CONCURRENCY)),
+                                     TokenBucket(LLM_RPM, LLM_BURST))
+            return self._models[key]
+
+    def _record(self, call_site: str, **deltas):
+        with self._lock:
+            stats = self._stats.setdefault(call_site, {
+                "calls": 0, "errors": 0, "retries": 0, "batched": 0, "input_tokens": 0, "output_tokens": 0,
+                "latency_ms_total": 0.0, "latency_ms_max": 0.0, "queue_ms_total": 0.0})
+            for key, value in deltas.items():
+                if key == "latency_ms_max": stats[key] = max(stats[key], value)
+                else: stats[key] += value
+
+    def run(self, call_site: str, model: str, call: Callable[[], Any],
+            usage: Callable[[Any], Tuple[int, int]] = lambda result: (0, 0)) -> Any:
+        """Runs call() under the global/model limits, retrying transient errors. usage(result) -> (in, out) tokens."""
+        model_slots, bucket = self._limits(model)
+        for attempt in range(LLM_MAX_RETRIES + 1):
+            queued = time.monotonic()
+            if not bucket.acquire(LLM_QUEUE_TIMEOUT):
+                self._record(call_site, errors=1)
+                raise LLMBusy(f"LLM rate limit for {model}: no request token within {LLM_QUEUE_TIMEOUT:.0f}s")
+            if not self._global.acquire(timeout=LLM_QUEUE_TIMEOUT):
+                self._record(call_site, errors=1)
+                raise LLMBusy(f"All {LLM_MAX_CONCURRENCY} LLM slots busy for {LLM_QUEUE_TIMEOUT:.0f}s")
+            delay = None
+            try:
+                if not model_slots.acquire(timeout=LLM_QUEUE_TIMEOUT):
+                    self._record(call_site, errors=1)
+                    raise LLMBusy(f"All {LLM_MODEL_CONCURRENCY} slots for {model} busy for {LLM_QUEUE_TIMEOUT:.0f}s")
+                try:
+                    started = time.monotonic()
+                    result = call()
+                finally:
+                    model_slots.release()
+            except LLMBusy:
+                raise
+            except Exception as e:
+                if attempt >= LLM_MAX_RETRIES or not is_retryable(e):
+                    self._record(call_site, calls=1, errors=1)
+                    raise
+                delay = random.uniform(0, min(LLM_RETRY_CAP, LLM_RETRY_BASE * 2 ** attempt))
+                print(f"⚠️ LLM call '{call_site}' failed ({type(e).__name__}: {str(e)[:120]}); retry in {delay:.1f}s")
+                self._record(call_site, retries=1)
+            finally:
+                self._global.release()
+            if delay is not None:
+                time.sleep(delay)  # back off holding no slot; the next attempt queues again
+                continue
+
+            latency = (time.monotonic() - started) * 1000
+            try: tokens_in, tokens_out = usage(result)
+            except Exception: tokens_in, tokens_out = 0, 0
+            self._record(call_site, calls=1, input_tokens=tokens_in, output_tokens=tokens_out,
+                         latency_ms_total=latency, latency_ms_max=latency,
+                         queue_ms_total=(started - queued) * 1000)
+            return result
+
+    # --- CALLS ---
+    def generate(self, call_site: str, contents, model: str = DEFAULT_MODEL, **kwargs):
+        """google.generativeai generate_content (text + images). Returns the SDK response."""
+        client = self._genai_model(model)
+        return self.run(call_site, model, lambda: client.generate_content(contents, **kwargs), _genai_usage)
+
+    def complete(self, call_site: str, prompt: str, model: str = DEFAULT_MODEL, batchable: bool = False) -> str:
+        """Text in, text out. batchable=True lets concurrent small prompts share one request."""
+        if not batchable or LLM_BATCH_MAX <= 1 or len(prompt) > LLM_BATCH_MAX_CHARS:
+            return self._complete_one(call_site, prompt, model)
+
+        future: Future = Future()
+        with self._lock:
+            batch = self._batches.get(model)
+            leader = batch is None
+            if leader: batch = self._batches[model] = _Batch()
+            batch.items.append((call_site, prompt, future))
+            if len(batch.items) >= LLM_BATCH_MAX:
+                self._batches.pop(model, None)  # full: later prompts start a new batch
+                batch.full.set()
+
+        if leader:
+            batch.full.wait(LLM_BATCH_WINDOW_MS / 1000.0)
+            with self._lock:
+                if self._batches.get(model) is batch: self._batches.pop(model)
+            self._run_batch(model, batch.items)
+
+        answer = future.result()
+        return self._complete_one(call_site, prompt, model) if answer is _FALLBACK else answer
+
+    def _complete_one(self, call_site: str, prompt: str, model: str) -> str:
+        client = self._chat_client(model, None)
+        return _text(self.run(call_site, model, lambda: client.invoke(prompt), _message_usage))
+
+    def _run_batch(self, model: str, items: List[Tuple[str, str, Future]]):
+        if len(items) == 1:
+            call_site, prompt, future = items[0]
+            try: future.set_result(self._complete_one(call_site, prompt, model))
+            except Exception as e: future.set_exception(e)
+            return
+
+        sites = sorted({site for site, _, _ in items})
+        try:
+            client = self._chat_client(model, None)
+            reply = self.run(f"batch:{'+'.join(sites)}", model,
+                             lambda: client.invoke(batch_prompt([p for _, p, _ in items])), _message_usage)
+            answers = split_batch_answer(_text(reply), len(items))
+        except Exception as e:
+            print(f"⚠️ Batched LLM call failed, sending {len(items)} prompts one by one: {e}")
+            answers = None
+        for i, (site, _, future) in enumerate(items):
+            if answers is None:
+                future.set_result(_FALLBACK)
+            else:
+                self._record(site, batched=1)
+                future.set_result(answers[i])
+
+    # --- STATS ---
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            sites = {}
+            for site, s in self._stats.items():
+                sites[site] = dict(s, latency_ms_avg=round(s["latency_ms_total"] / s["calls"], 1) if s["calls"] else None)
+            return {
+                "limits": {"max_concurrency": LLM_MAX_CONCURRENCY, "model_concurrency": LLM_MODEL_CONCURRENCY,
+                           "rpm": LLM_RPM, "burst": LLM_BURST, "max_retries": LLM_MAX_RETRIES,
+                           "batch_max": LLM_BATCH_MAX, "batch_window_ms": LLM_BATCH_WINDOW_MS},
+                "models": {m: round(b.tokens, 2) for m, (_, b) in self._models.items()},
+                "call_sites": sites,
+            }
+
+
+# --- USAGE / TEXT HELPERS ---
+def _text(message) -> str:
+    content = getattr(message, "content", message)
+    if isinstance(content, list):  # multi-part content
+        return "".join(p.get("text", "") if isinstance(p, dict) else str(p) for p in content)
+    return str(content)
+
+
+def _message_usage(message) -> Tuple[int, int]:
+    usage = getattr(message, "usage_metadata", None) or {}
+    return int(usage.get("input_tokens", 0)), int(usage.get("output_tokens", 0))
+
+
+def _chat_result_usage(result) -> Tuple[int, int]:
+    tokens_in = tokens_out = 0
+    for generation in getattr(result, "generations", []):
+        t_in, t_out = _message_usage(getattr(generation, "message", None))
+        tokens_in, tokens_out = tokens_in + t_in, tokens_out + t_out
+    return tokens_in, tokens_out
+
+
+def _genai_usage(response) -> Tuple[int, int]:
+    usage = getattr(response, "usage_metadata", None)
+    if usage is None: return 0, 0
+    return int(getattr(usage, "prompt_token_count", 0) or 0), int(getattr(usage, "candidates_token_count", 0) or 0)
+
+
+_CHAT_CLASS = None
+
+
+def _gateway_chat_class():
+    """LangChain wrapper class, defined on first use so importing the gateway stays cheap."""
+    global _CHAT_CLASS
+    if _CHAT_CLASS is None:
+        from langchain_core.language_models.chat_models import BaseChatModel
+
+        class GatewayChatModel(BaseChatModel):
+            """Delegates to a cached client; every generation passes the gateway's limits and retries."""
+            inner: Any
+            gateway: Any
+            call_site: str
+            model_name: str
+
+            @property
+            def _llm_type(self) -> str:
+                return f"gateway-{self.inner._llm_type}"
+
+            def _generate(self, messages, stop=None, run_manager=None, **kwargs):
+                return self.gateway.run(
+                    self.call_site, self.model_name,
+                    lambda: self.inner._generate(messages, stop=stop, run_manager=run_manager, **kwargs),
+                    _chat_result_usage)
+
+        _CHAT_CLASS = GatewayChatModel
+    return _CHAT_CLASS
+
+
+_GATEWAY: Optional[LLMGateway] = None
+_GATEWAY_LOCK = threading.Lock()
+
+
+def get_llm_gateway() -> LLMGateway:
+    """Process-wide gateway (one set of clients, limits and stats)."""
+    global _GATEWAY
+    with _GATEWAY_LOCK:
+        if _GATEWAY is None:
+            _GATEWAY = LLMGateway()
+        return _GATEWAY
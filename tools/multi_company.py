@@ -0,0 +1,105 @@
+# tools/multi_company.py
+"""
+Multi-company fan-out: the same report for several companies, side by side.
+
+Exports run concurrently, up to the combined request slots of the Tally
+hosts (each host still enforces its own cap). Each company's report goes
+through the normal table parsing, is grouped by its own label column (or the
+requested group_by column) and summed on its primary amount. The results are
+aligned on the label values into one frame: one row per label, one column per
+company. Parsers may name the label column differently per company (e.g.
+"Particulars" vs "Ledger"); only the values have to match. A company that
+fails is reported in `failures` instead of failing the whole comparison.
+"""
+import contextvars
+import json
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from tools.report_digest import ReportDigest
+    from tools.tally_hosts import get_host_registry
+except ImportError:
+    from report_digest import ReportDigest
+    from tally_hosts import get_host_registry
+
+TOTAL_COLUMN = "Total"
+
+
+def fetch_all(companies: List[str], fetch: Callable[[str], str]) -> Dict[str, dict]:
+    """
+    Runs fetch(company) -> fetch_report JSON for every company (or every report, for a dashboard),
+    concurrently. Returns {company: parsed result}; exceptions become {"status": "error"} entries.
+    """
+    def run(company):
+        try: return json.loads(fetch(company))
+        except Exception as e: return {"status": "error", "error": str(e)}
+
+    if not companies: return {}
+    workers = max(1, min(len(companies), get_host_registry().capacity))
+    with ThreadPoolExecutor(max_workers=workers) as pool:
+        # Each task gets a copy of this request's context (formats etc.)
+        futures = [pool.submit(contextvars.copy_context().run, run, company) for company in companies]
+        return {company: f.result() for company, f in zip(companies, futures)}
+
+
+def _company_series(json_path: str, report_name: Optional[str], group_by: Optional[str], digest: ReportDigest):
+    """One company's report -> (Series of amount per label, label column, amount column)."""
+    with open(json_path, "r", encoding="utf-8") as f:
+        data = json.load(f)
+    df = digest.table_gen.build_frame(data, report_name)
+    if df.empty: raise ValueError("report has no rows")
+
+    _, label_col, numeric, categorical = digest._classify(df)
+    amount_col = digest._primary_amount(numeric)
+    if amount_col is None: raise ValueError("no amount column to compare")
+    if group_by:
+        if group_by not in df.columns: raise ValueError(f"no '{group_by}' column")
+        label_col = group_by
+    if label_col is None: raise ValueError("no label column to group by")
+
+    series = numeric[amount_col].fillna(0.0).groupby(df[label_col].astype(str).str.strip()).sum()
+    return series, label_col, amount_col
+
+
+def comparison_frame(results: Dict[str, dict], report_name: Optional[str] = None,
+                     group_by: Optional[str] = None) -> Tuple[pd.DataFrame, Dict]:
+    """
+    Aligns fetched reports -> (frame, meta). frame: label column, one column per
+    company (0 where a label doesn't occur) and a Total column, largest first.
+    meta: {"label", "amount", "companies", "labels": {company: its label column}, "failures": {company: reason}}.
+    """
+    digest = ReportDigest()
+    columns, failures, labels = {}, {}, {}
+    label_col = amount_col = None
+
+    for company, res in results.items():
+        if res.get("status") == "error" or not res.get("json_file_path"):
+            failures[company] = res.get("error") or res.get("message") or "fetch failed"
+            continue
+        try:
+            series, label, amount = _company_series(res["json_file_path"], report_name or res.get("report_name"),
+                                                    group_by, digest)
+        except Exception as e:
+            failures[company] = str(e)
+            continue
+        # Each company groups on its own label column; the frame is named after the first one
+        label_col, amount_col = label_col or label, amount_col or amount
+        columns[company], labels[company] = series, label
+
+    meta = {"label": label_col, "amount": amount_col, "companies": list(columns), "labels": labels,
+            "failures": failures}
+    if not columns: return pd.DataFrame(), meta
+
+    frame = pd.concat(columns, axis=1).fillna(0.0)
+    frame[TOTAL_COLUMN] = frame.sum(axis=1)
+    frame = frame.reindex(frame[TOTAL_COLUMN].abs().sort_values(ascending=False).index)
+    frame.index.name = label_col
+    return frame.reset_index(), meta
+
+
+def company_totals(frame: pd.DataFrame, meta: Dict) -> Dict[str, float]:
+    """{company: sum of its column}, for the comparison chart."""
+    return {company: float(frame[company].sum()) for company in meta["companies"]}
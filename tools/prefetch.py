@@ -0,0 +1,339 @@
+# tools/prefetch.py
+"""
+Background prefetch of hot reports (runs inside the API process).
+
+PREFETCH_REPORTS lists the exports to keep warm, separated by ';':
+
+    company | report [| period [| schedule]]
+
+    "Modi Chemplast Materials Pvt Ltd|Day Book; Modi Chemplast Materials Pvt Ltd|Balance Sheet||0 7 * * *"
+
+period:   "" (the report's own default, which is what chat requests use),
+          today, yesterday, month (month to date) or fy (financial year to date)
+schedule: 5-field cron "minute hour day month weekday" (weekday 0 = Sunday),
+          default PREFETCH_SCHEDULE
+
+Every PREFETCH_TICK seconds the scheduler probes each configured company's
+AlterIDs (a one-row Company export, at most every PREFETCH_PROBE_INTERVAL)
+and re-exports the entries whose cron slot came up, whose company changed
+since their last export, or that were never fetched. Exports go into the
+report cache stamped with the AlterIDs, so they stay fresh until the data
+changes. While users are busy (PREFETCH_BUSY_REQUESTS chat/compare requests
+in flight, or no free slot on the company's Tally host) it skips the tick
+and backs off, up to PREFETCH_MAX_BACKOFF seconds.
+"""
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from contextlib import contextmanager
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Set
+
+from dotenv import load_dotenv
+
+try:
+    from tools.report_cache import cache_key, get_report_cache
+    from tools.tally_hosts import get_host_registry
+except ImportError:
+    from report_cache import cache_key, get_report_cache
+    from tally_hosts import get_host_registry
+
+load_dotenv()
+
+PREFETCH_REPORTS = os.getenv("PREFETCH_REPORTS", "")
+PREFETCH_SCHEDULE = os.getenv("PREFETCH_SCHEDULE", "*/30 * * * *")
+PREFETCH_TICK = float(os.getenv("PREFETCH_TICK", "30"))
+PREFETCH_PROBE_INTERVAL = float(os.getenv("PREFETCH_PROBE_INTERVAL", "60"))
+PREFETCH_BUSY_REQUESTS = int(os.getenv("PREFETCH_BUSY_REQUESTS", "2"))
+PREFETCH_MAX_BACKOFF = float(os.getenv("PREFETCH_MAX_BACKOFF", "600"))
+PREFETCH_PROBE_TIMEOUT = 10
+
+PERIODS = ("", "today", "yesterday", "month", "fy")
+BUSY_PATHS = ("/chat", "/compare")  # requests that export from Tally
+
+ALTER_ID_REQUEST = """<ENVELOPE>
+    <HEADER>
+        <VERSION>1</VERSION>
+        <TALLYREQUEST>Export</TALLYREQUEST>
+        <TYPE>Collection</TYPE>
+        <ID>Company AlterIDs</ID>
+    </HEADER>
+    <BODY>
+        <DESC>
+            <STATICVARIABLES>
+                <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+                <SVCurrentCompany>{company}</SVCurrentCompany>
+            </STATICVARIABLES>
+            <TDL>
+                <TDLMESSAGE>
+                    <COLLECTION NAME="Company AlterIDs" ISMODIFY="No">
+                        <TYPE>Company</TYPE>
+                        <FILTER>IsCurrentCompany</FILTER>
+                        <NATIVEMETHOD>AltVchID</NATIVEMETHOD>
+                        <NATIVEMETHOD>AltMstID</NATIVEMETHOD>
+                    </COLLECTION>
+                    <SYSTEM TYPE="Formulae" NAME="IsCurrentCompany">$Name = ##SVCurrentCompany</SYSTEM>
+                </TDLMESSAGE>
+            </TDL>
+        </DESC>
+    </BODY>
+</ENVELOPE>"""
+
+
+# --- USER TRAFFIC ---
+_ACTIVE_REQUESTS = 0
+_ACTIVE_LOCK = threading.Lock()
+
+
+@contextmanager
+def track_request():
+    """Counts a user request in flight (the API wraps /chat and /compare in this)."""
+    global _ACTIVE_REQUESTS
+    with _ACTIVE_LOCK: _ACTIVE_REQUESTS += 1
+    try:
+        yield
+    finally:
+        with _ACTIVE_LOCK: _ACTIVE_REQUESTS -= 1
+
+
+def active_requests() -> int:
+    return _ACTIVE_REQUESTS
+
+
+# --- SCHEDULE ---
+class CronSchedule:
+    """Minimal 5-field cron: '*', 'n', 'a-b', 'a,b', '*/n' and 'a-b/n' per field."""
+    RANGES = ((0, 59), (0, 23), (1, 31), (1, 12), (0, 6))
+
+    def __init__(self, expr: str):
+        fields = expr.split()
+        if len(fields) != 5:
+            raise ValueError(f"Cron schedule '{expr}' needs 5 fields (minute hour day month weekday)")
+        self.expr = expr
+        self.minutes, self.hours, self.days, self.months, self.weekdays = (
+            self._field(f, lo, hi) for f, (lo, hi) in zip(fields, self.RANGES))
+        self.any_day, self.any_weekday = fields[2] == "*", fields[4] == "*"
+
+    @staticmethod
+    def _field(text: str, lo: int, hi: int) -> Set[int]:
+        values = set()
+        for part in text.split(","):
+            rng, _, step = part.partition("/")
+            if rng == "*": start, end = lo, hi
+            elif "-" in rng: start, end = (int(x) for x in rng.split("-", 1))
+            else: start = end = int(rng)
+            if step and rng != "*" and "-" not in rng: end = hi  # "5/15" = from 5 every 15
+            if not (lo <= start <= end <= hi): raise ValueError(f"Cron field '{text}' is out of range {lo}-{hi}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def matches(self, moment: datetime) -> bool:
+        if moment.minute not in self.minutes or moment.hour not in self.hours or moment.month not in self.months:
+            return False
+        day_ok, weekday_ok = moment.day in self.days, moment.isoweekday() % 7 in self.weekdays
+        # Standard cron: when both day fields are restricted, either one may match
+        if not self.any_day and not self.any_weekday: return day_ok or weekday_ok
+        return day_ok and weekday_ok
+
+    def fired_between(self, after: datetime, until: datetime) -> bool:
+        """True if a scheduled minute falls in (after, until] (checks at most one day of minutes)."""
+        moment = after.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        for _ in range(24 * 60):
+            if moment > until: return False
+            if self.matches(moment): return True
+            moment += timedelta(minutes=1)
+        return True  # more than a day since the last check: due anyway
+
+
+def period_dates(period: str, today: Optional[date] = None):
+    """Period name -> (SVFROMDATE, SVTODATE) as YYYYMMDD, or ('', '') for the report default."""
+    today = today or date.today()
+    fmt = lambda d: d.strftime("%Y%m%d")
+    if not period: return "", ""
+    if period == "today": return fmt(today), fmt(today)
+    if period == "yesterday": return fmt(today - timedelta(days=1)), fmt(today - timedelta(days=1))
+    if period == "month": return fmt(today.replace(day=1)), fmt(today)
+    if period == "fy": return fmt(date(today.year if today.month >= 4 else today.year - 1, 4, 1)), fmt(today)
+    raise ValueError(f"Unknown prefetch period '{period}'. Use one of {PERIODS}.")
+
+
+class PrefetchEntry:
+    def __init__(self, company: str, report: str, period: str = "", schedule: str = PREFETCH_SCHEDULE):
+        if period not in PERIODS:
+            raise ValueError(f"Unknown prefetch period '{period}'. Use one of {PERIODS}.")
+        self.company = company
+        self.report = report
+        self.period = period
+        self.schedule = CronSchedule(schedule)
+        self.pending = True  # warm everything once at startup
+        self.alter_ids: Optional[str] = None  # company AlterIDs at the last export
+        self.last_run: Optional[float] = None
+        self.last_error: Optional[str] = None
+        self.runs = 0
+
+    def status(self) -> Dict:
+        return {
+            "company": self.company, "report": self.report, "period": self.period,
+            "schedule": self.schedule.expr, "pending": self.pending, "runs": self.runs,
+            "seconds_since_run": round(time.monotonic() - self.last_run, 1) if self.last_run else None,
+            "last_error": self.last_error,
+        }
+
+
+def parse_entries(spec: str) -> List[PrefetchEntry]:
+    entries = []
+    for part in spec.split(";"):
+        fields = [f.strip() for f in part.split("|")]
+        if len(fields) < 2 or not fields[0] or not fields[1]: continue
+        try:
+            entries.append(PrefetchEntry(fields[0], fields[1], fields[2] if len(fields) > 2 else "",
+                                         (fields[3] if len(fields) > 3 else "") or PREFETCH_SCHEDULE))
+        except ValueError as e:
+            print(f"⚠️ Ignoring prefetch entry '{part.strip()}': {e}")
+    return entries
+
+
+def probe_alter_ids(company: str) -> Optional[str]:
+    """'<last voucher AlterID>/<last master AlterID>' for the company, or None if Tally didn't say."""
+    try:
+        from tools.get_report_tool import clean_tally_xml, decode_tally_bytes, escape_xml
+    except ImportError:
+        from get_report_tool import clean_tally_xml, decode_tally_bytes, escape_xml
+    response = get_host_registry().post(company, ALTER_ID_REQUEST.format(company=escape_xml(company)),
+                                        timeout=PREFETCH_PROBE_TIMEOUT)
+    root = ET.fromstring(clean_tally_xml(decode_tally_bytes(response.content)) or "<ENVELOPE/>")
+    for node in root.iter("COMPANY"):
+        vch, mst = (node.findtext("ALTVCHID") or "").strip(), (node.findtext("ALTMSTID") or "").strip()
+        if vch or mst: return f"{vch}/{mst}"
+    return None
+
+
+# --- SCHEDULER ---
+class PrefetchScheduler:
+    def __init__(self, entries: List[PrefetchEntry], tick: float = PREFETCH_TICK,
+                 probe_interval: float = PREFETCH_PROBE_INTERVAL, busy_requests: int = PREFETCH_BUSY_REQUESTS,
+                 max_backoff: float = PREFETCH_MAX_BACKOFF):
+        self.entries = entries
+        self.tick = tick
+        self.probe_interval = probe_interval
+        self.busy_requests = max(1, busy_requests)
+        self.max_backoff = max(tick, max_backoff)
+        self.delay = tick
+        self._probed_at: Dict[str, float] = {}
+        self._alter_ids: Dict[str, Optional[str]] = {}
+        self._last_check = datetime.now()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self.stats = {"ticks": 0, "skipped_busy": 0, "refreshed": 0, "probes": 0, "errors": 0}
+
+    def busy(self) -> bool:
+        return active_requests() >= self.busy_requests
+
+    def _probe(self, company: str, now: float):
+        if now - self._probed_at.get(company, float("-inf")) < self.probe_interval: return
+        self._probed_at[company] = now
+        try:
+            ids = probe_alter_ids(company)
+        except Exception as e:
+            print(f"⚠️ AlterID probe failed for '{company}': {e}")
+            return
+        self.stats["probes"] += 1
+        self._alter_ids[company] = ids
+        if ids is None: return
+        get_report_cache().record_probe(company, ids)
+        for entry in self.entries:
+            if entry.company == company and entry.alter_ids is not None and entry.alter_ids != ids:
+                entry.pending = True  # data changed since the last export
+
+    def _refresh(self, entry: PrefetchEntry) -> bool:
+        """Exports one entry into the cache. False if it should wait for a later tick."""
+        try:
+            from tools.get_report_tool import export_report, is_report_payload
+        except ImportError:
+            from get_report_tool import export_report, is_report_payload
+        host = get_host_registry().host_for(entry.company)
+        if not host.healthy or host.in_flight >= host.max_concurrency:
+            return False  # leave the host's slots to user requests
+
+        from_date, to_date = period_dates(entry.period)
+        ids = self._alter_ids.get(entry.company)
+        payload = export_report(entry.company, entry.report, from_date, to_date)
+        entry.last_run, entry.runs = time.monotonic(), entry.runs + 1
+        if not is_report_payload(payload):
+            entry.last_error = payload[:300]
+            self.stats["errors"] += 1
+            return True  # retried at its next slot or AlterID change, not every tick
+        get_report_cache().put(cache_key(entry.company, entry.report, from_date, to_date), payload,
+                               alter_ids=ids, source="prefetch")
+        entry.alter_ids, entry.last_error = ids, None
+        self.stats["refreshed"] += 1
+        return True
+
+    def run_once(self) -> int:
+        """One tick: probe, mark due entries, refresh them while users stay quiet. Returns exports done."""
+        self.stats["ticks"] += 1
+        moment = datetime.now()
+        for entry in self.entries:
+            if entry.schedule.fired_between(self._last_check, moment): entry.pending = True
+        self._last_check = moment
+
+        if self.busy():
+            self.stats["skipped_busy"] += 1
+            self.delay = min(self.max_backoff, self.delay * 2)
+            return 0
+        self.delay = self.tick
+
+        now = time.monotonic()
+        for company in {e.company for e in self.entries}:
+            if self.busy(): break
+            self._probe(company, now)
+
+        done = 0
+        for entry in self.entries:
+            if not entry.pending: continue
+            if self.busy() or self._stop.is_set(): break
+            if self._refresh(entry):
+                entry.pending = False
+                done += 1
+        return done
+
+    def _loop(self):
+        while not self._stop.wait(self.delay):
+            try: self.run_once()
+            except Exception as e: print(f"⚠️ Prefetch tick failed: {e}")
+
+    def start(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            # The first tick warms every entry, shortly after startup
+            self.delay = min(self.tick, 5.0)
+            self._thread = threading.Thread(target=self._loop, name="report-prefetch", daemon=True)
+            self._thread.start()
+            print(f"🔥 Prefetching {len(self.entries)} report(s) in the background")
+
+    def stop(self):
+        self._stop.set()
+
+    def status(self) -> Dict:
+        return {
+            "running": bool(self._thread and self._thread.is_alive() and not self._stop.is_set()),
+            "active_requests": active_requests(),
+            "next_tick_seconds": self.delay,
+            "alter_ids": dict(self._alter_ids),
+            "entries": [e.status() for e in self.entries],
+            **self.stats,
+        }
+
+
+_SCHEDULER: Optional[PrefetchScheduler] = None
+_SCHEDULER_LOCK = threading.Lock()
+
+
+def get_prefetch_scheduler() -> PrefetchScheduler:
+    """Process-wide scheduler built from PREFETCH_REPORTS (it may have no entries)."""
+    global _SCHEDULER
+    with _SCHEDULER_LOCK:
+        if _SCHEDULER is None:
+            _SCHEDULER = PrefetchScheduler(parse_entries(PREFETCH_REPORTS))
+        return _SCHEDULER
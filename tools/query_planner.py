@@ -0,0 +1,426 @@
+# tools/query_planner.py
+"""
+Deterministic answers for numeric questions about one report.
+
+Questions like "total debit for today", "top 5 parties by amount" or
+"closing stock value of PVC Resin" are mapped by simple rules onto one
+structured operation over the parsed report frame:
+
+    filters (date range, category values, row label, Dr/Cr side)
+    -> sum | count | mean | top-N | bottom-N | lookup, optionally grouped
+
+The operation runs locally with pandas, so the totals are exact and cover
+every row. The summarizer only asks the LLM to phrase the result. Questions
+the rules don't recognise get no plan, and the summarizer falls back to the
+digest prompt. So do explanations and summaries ("why", "summarize the sales
+trend"), and questions naming a period the report has no dates for.
+
+A plan is only returned when every word of the question is accounted for:
+the operation, measure, grouping, row label, category value or date that
+the plan uses, or a filler word. Anything left over ("above 10000",
+"excluding X", a party the report doesn't list) is a condition the plan
+would silently drop, so those questions go to the LLM too.
+"""
+import calendar
+import re
+from datetime import date, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+
+import pandas as pd
+
+try:
+    from tools.entity_index import NameIndex
+    from tools.report_digest import MAX_GROUP_CARDINALITY, ReportDigest
+    from tools.tally_values import parse_tally_date
+except ImportError:
+    from entity_index import NameIndex
+    from report_digest import MAX_GROUP_CARDINALITY, ReportDigest
+    from tally_values import parse_tally_date
+
+MAX_ITEMS = 25  # grouped results listed in the answer
+DEFAULT_TOP_N = 10
+MIN_MATCH_LEN = 3  # shorter category values / labels are too ambiguous to match in free text
+
+# First match wins; (op, pattern, default n for top/bottom)
+_OP_RULES = (
+    ("count", re.compile(r"\b(how many|count|number of|no\. of)\b"), None),
+    ("mean", re.compile(r"\b(average|avg|mean)\b"), None),
+    ("top", re.compile(r"\b(?:top|largest|biggest|highest|maximum|max)\b(?:\s+(\d+))?"), 1),
+    ("bottom", re.compile(r"\b(?:bottom|smallest|lowest|least|minimum|min)\b(?:\s+(\d+))?"), 1),
+    # Not "value", "amount" or "closing": they name the measure ("closing stock value of X" is a lookup)
+    ("sum", re.compile(r"\b(total|sum|how much|overall)\b"), None),
+)
+# Explanations and summaries need the LLM, whatever numbers they mention
+_NARRATIVE_RE = re.compile(r"\b(why|explain\w*|summar\w*|trends?|analy[sz]\w*)\b")
+_MONTHLY_RE = re.compile(r"\b(monthly|month[- ]wise|by month|per month|each month)\b")
+_DAILY_RE = re.compile(r"\b(daily|day[- ]wise|by day|per day|each day|by date|date[- ]wise)\b")
+_PLURAL_TOP_RE = re.compile(r"\btop\b(?!\s+\d)")  # "top parties" -> DEFAULT_TOP_N, "highest sale" -> 1
+_GROUP_RE = re.compile(r"\b(?:by|per|for each|each|across)\s+([a-z][a-z ]*)|\b([a-z]+)[- ]wise\b")
+
+# Words that name the row label column, whatever the report calls it
+LABEL_WORDS = ("party", "parties", "ledger", "ledgers", "item", "items", "particulars", "name",
+               "customer", "customers", "supplier", "suppliers", "account", "accounts", "stock item")
+MEASURE_SYNONYMS = {"qty": "quantity", "price": "rate", "worth": "value", "vch": "voucher"}
+# Words that change nothing about the plan. Not "not", "except", "above", "than", "only", "balance": those are conditions
+FILLER_WORDS = frozenset("""
+a an and the of for in on at to from with is are was were be been what whats s which do does did have has had
+show list give get tell find me my our us we i you all please there their its it so far as till until since
+during between by per each across wise
+""".split())
+# Words that name the report's rows, not a condition on them
+ROW_WORDS = frozenset("voucher vouchers entry entries transaction transactions row rows record records stock".split())
+_SIDE_WORDS = {"debit": {"debit", "dr"}, "credit": {"credit", "cr"}}
+_DATE_PHRASE_RE = re.compile(r"\b(?:today|yesterday|(?:this|last) month|(?:this|current|last|previous) (?:financial year|fy)"
+                             r"|(?:last|past) \d+ days)\b")
+
+_MONTHS = {name.lower(): i for i, name in enumerate(calendar.month_name) if name}
+_MONTHS.update({name.lower(): i for i, name in enumerate(calendar.month_abbr) if name})
+_MONTHS["sept"] = 9
+_MONTH_RE = re.compile(r"\b(" + "|".join(sorted(_MONTHS, key=len, reverse=True)) + r")\b\.?(?:\s*[-']?\s*(\d{4}|\d{2})\b)?")
+_DATE_TOKEN_RE = re.compile(r"\b(\d{4}-\d{2}-\d{2}|\d{1,2}[-/]\d{1,2}[-/]\d{4}|\d{1,2}-[a-z]{3}-\d{2,4}|\d{8})\b")
+_QUOTED_RE = re.compile(r"[\"“”]([^\"“”]+)[\"“”]")
+_TOKEN_RE = re.compile(r"[a-z]+|\d+(?:\.\d+)?")
+
+
+def _fmt(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+def _norm(text: str) -> str:
+    return " ".join(str(text).lower().split())
+
+
+def _words(text: str) -> List[str]:
+    return [MEASURE_SYNONYMS.get(w, w) for w in re.findall(r"[a-z]+", text.lower())]
+
+
+def _tokens(text: str) -> List[str]:
+    """Like _words, keeping numbers: "Sundry Debtors 3" -> ["sundry", "debtors", "3"]."""
+    return [MEASURE_SYNONYMS.get(w, w) for w in _TOKEN_RE.findall(text.lower())]
+
+
+def _contains_phrase(q: str, phrase: str) -> bool:
+    """Whole-word (optionally plural) occurrence of phrase in q."""
+    return re.search(r"(?<![a-z0-9])" + re.escape(phrase) + r"(?:s|es)?(?![a-z0-9])", q) is not None
+
+
+def _fy_start(day: date) -> date:
+    """Indian financial year (April-March) containing `day`."""
+    return date(day.year if day.month >= 4 else day.year - 1, 4, 1)
+
+
+def _month_range(year: int, month: int) -> Tuple[date, date]:
+    return date(year, month, 1), date(year, month, calendar.monthrange(year, month)[1])
+
+
+class QueryEngine:
+    """Plans and runs one question against one report."""
+
+    def __init__(self, today: Optional[date] = None):
+        self.today = today or date.today()
+        self.digest = ReportDigest()
+
+    # --- FRAME ---
+    def prepare(self, data, report_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Parsed frame plus detected columns, or None if the report has nothing numeric."""
+        df = self.digest.table_gen.build_frame(data, report_name)
+        if df.empty: return None
+        date_col, label_col, numeric, categorical = self.digest._classify(df)
+        if not numeric: return None
+        dates = df[date_col].map(parse_tally_date) if date_col else None
+        return {"df": df, "report": report_name, "date_col": date_col, "dates": dates, "label": label_col,
+                "numeric": numeric, "categorical": categorical,
+                "primary": self.digest._primary_amount(numeric)}
+
+    # --- PLANNING ---
+    def plan(self, query: str, report: Dict[str, Any]) -> Optional[Dict[str, Any]]:
+        """Maps the question to an operation, or None when the rules don't cover it."""
+        q = _norm(query)
+        if _NARRATIVE_RE.search(q): return None
+        date_range = self._date_range(q, report)
+        if not report["date_col"] and (date_range or _MONTHLY_RE.search(q) or _DAILY_RE.search(q)):
+            # A period the frame can't filter on: a total over every row would be a wrong answer
+            return None
+        op, n = self._operation(q)
+        measure, sign = self._measure(q, report)
+        group_by = self._group_by(q, report)
+        labels, label_phrase = self._match_labels(q, report)
+        filters = self._category_filters(q, report, exclude=group_by)
+        if self._unexplained(q, report, op, measure, sign, group_by, labels, label_phrase, filters, date_range):
+            # A comparison, exclusion or name the rules can't apply: answering without it would be wrong
+            return None
+
+        if op is None:
+            # "monthly sales" is a grouped total; a bare row name is a lookup
+            if group_by: op = "sum"
+            elif labels: op = "lookup"
+            else: return None
+        if measure is None or (sign and not self._has_drcr(report, measure)):
+            # Debit/credit asked of a column that carries no Dr/Cr: the sign convention is unknown
+            return None
+        if op == "sum" and labels and not group_by: op = "lookup"
+        if op in ("top", "bottom") and not group_by:
+            group_by = report["label"]
+            if group_by is None: return None
+        return {"op": op, "n": n, "measure": measure, "sign": sign, "group_by": group_by,
+                "label_column": report["label"], "labels": labels, "filters": filters, "date": date_range}
+
+    def _unexplained(self, q: str, report, op, measure, sign, group_by, labels, label_phrase, filters,
+                     date_range) -> List[str]:
+        """Words of the question that no part of the plan (nor FILLER_WORDS) accounts for."""
+        text = _QUOTED_RE.sub(" ", q) if labels else q
+        for name, pattern, _ in _OP_RULES:
+            if name == op: text = pattern.sub(" ", text)
+        if date_range:
+            for pattern in (_DATE_PHRASE_RE, _DATE_TOKEN_RE, _MONTH_RE): text = pattern.sub(" ", text)
+        if group_by == "month": text = _MONTHLY_RE.sub(" ", text)
+        elif group_by == "day": text = _DAILY_RE.sub(" ", text)
+
+        known = set(FILLER_WORDS) | ROW_WORDS | {w for phrase in LABEL_WORDS for w in phrase.split()}
+        known.update(_words(measure or ""))
+        # "amount"/"value"/"closing" mean the measure, unless they name another numeric column
+        others = {w for col in report["numeric"] if col != measure for w in _words(col)}
+        known.update({"amount", "value", "closing"} - others)
+        for side, words in _SIDE_WORDS.items():
+            if sign == side or side in (measure or "").lower(): known |= words
+        if group_by not in (None, "month", "day"): known.update(_words(group_by))
+        if report["label"]: known.update(_words(report["label"]))
+        if labels: known.update(_tokens(label_phrase) + [w for v in labels for w in _tokens(v)])
+        for col, values in filters: known.update(w for v in values for w in _tokens(v))
+
+        def accounted(word: str) -> bool:
+            return word in known or (word.endswith("s") and word[:-1] in known) or (word.endswith("es") and word[:-2] in known)
+
+        return [w for w in _tokens(text) if not accounted(w)]
+
+    def _operation(self, q: str) -> Tuple[Optional[str], Optional[int]]:
+        for op, pattern, default_n in _OP_RULES:
+            m = pattern.search(q)
+            if not m: continue
+            if op in ("top", "bottom"):
+                if m.group(1): return op, int(m.group(1))
+                return op, DEFAULT_TOP_N if _PLURAL_TOP_RE.search(q) else default_n
+            return op, None
+        return None, None
+
+    def _measure(self, q: str, report) -> Tuple[Optional[str], Optional[str]]:
+        """(numeric column, 'debit'/'credit'/None). Explicit Debit/Credit columns win over a sign filter."""
+        words = set(_words(q))
+        best, best_score = None, 0
+        for col in report["numeric"]:
+            col_words = _words(col)
+            score = sum(1 for w in col_words if w in words)
+            if score > best_score: best, best_score = col, score
+        side = "debit" if re.search(r"\b(debit|dr)\b", q) else "credit" if re.search(r"\b(credit|cr)\b", q) else None
+        if best is not None and side and side in best.lower(): side = None
+        return best or report["primary"], side
+
+    def _has_drcr(self, report, column: str) -> bool:
+        raw = report["df"][column].dropna().astype(str).str.strip().head(500)
+        return bool(raw.str.lower().str.endswith(("dr", "cr")).any())
+
+    def _group_by(self, q: str, report) -> Optional[str]:
+        if _MONTHLY_RE.search(q): return "month"
+        if _DAILY_RE.search(q): return "day"
+
+        candidates = [c for c in report["categorical"] if report["df"][c].nunique() > 1]
+        for m in _GROUP_RE.finditer(q):
+            phrase = (m.group(1) or m.group(2) or "").strip()
+            words = set(_words(phrase)[:3])
+            if not words: continue
+            if report["label"] and words & set(LABEL_WORDS): return report["label"]
+            scored = [(sum(1 for w in _words(c) if w in words), c) for c in candidates + [report["label"]] if c]
+            score, col = max(scored, default=(0, None))
+            if score: return col
+        return None
+
+    def _match_labels(self, q: str, report) -> Tuple[List[str], str]:
+        """(row labels, the words naming them): quoted text, else the longest label found verbatim, else a fuzzy match."""
+        label_col = report["label"]
+        if label_col is None: return [], ""
+        values = {_norm(v): str(v) for v in report["df"][label_col].dropna().unique()}
+
+        quoted = [_norm(m) for m in _QUOTED_RE.findall(q)]
+        found = [values[v] for v in quoted if v in values]
+        if found: return found, " ".join(quoted)
+
+        hits = [v for v in values if len(v) >= MIN_MATCH_LEN and v in q and _contains_phrase(q, v)]
+        if hits:
+            longest = max(hits, key=len)
+            return [values[longest]], longest
+
+        # Loosely written names: "hdfc current account" -> "HDFC Current A/c" (column names never count)
+        if "label_index" not in report: report["label_index"] = NameIndex(values.values())
+        index = report["label_index"]
+        columns = {w for col in report["df"].columns for w in _words(str(col))}
+        mentions = index.find_mentions(q, stopwords=columns | set(LABEL_WORDS))
+        return ([index.names[mentions[0][1]]], mentions[0][2]) if mentions else ([], "")
+
+    def _category_filters(self, q: str, report, exclude: Optional[str]) -> List[List]:
+        """[[column, [values]]] for low-cardinality columns whose values appear in the question ('sales', 'kg')."""
+        filters = []
+        for col in report["categorical"]:
+            if col == exclude: continue
+            uniques = report["df"][col].dropna().astype(str).unique()
+            if not 1 < len(uniques) <= MAX_GROUP_CARDINALITY: continue
+            hits = [v for v in uniques if len(v) >= MIN_MATCH_LEN and not v.isdigit() and _contains_phrase(q, _norm(v))]
+            if hits: filters.append([col, sorted(hits)])
+        return filters
+
+    def _date_range(self, q: str, report) -> Optional[List[str]]:
+        """[start, end] ISO dates from 'today', 'last month', 'April 2024', '01-04-2024 to 15-04-2024', ..."""
+        today = self.today
+        if re.search(r"\btoday\b", q): start = end = today
+        elif re.search(r"\byesterday\b", q): start = end = today - timedelta(days=1)
+        elif re.search(r"\bthis month\b", q): start, end = _month_range(today.year, today.month)
+        elif re.search(r"\blast month\b", q):
+            prev = today.replace(day=1) - timedelta(days=1)
+            start, end = _month_range(prev.year, prev.month)
+        elif re.search(r"\b(this|current) (financial year|fy)\b", q):
+            start = _fy_start(today)
+            end = date(start.year + 1, 3, 31)
+        elif re.search(r"\b(last|previous) (financial year|fy)\b", q):
+            start = date(_fy_start(today).year - 1, 4, 1)
+            end = date(start.year + 1, 3, 31)
+        else:
+            m = re.search(r"\b(?:last|past) (\d+) days\b", q)
+            explicit = [d for d in (parse_tally_date(t) for t in _DATE_TOKEN_RE.findall(q)) if d]
+            if m:
+                start, end = today - timedelta(days=int(m.group(1)) - 1), today
+            elif explicit:
+                start, end = min(explicit), max(explicit)
+            else:
+                month = self._named_month(q, report)
+                if month is None: return None
+                start, end = month
+        return [start.isoformat(), end.isoformat()]
+
+    def _named_month(self, q: str, report) -> Optional[Tuple[date, date]]:
+        for m in _MONTH_RE.finditer(q):
+            name, year = m.group(1), m.group(2)
+            if name == "may" and not year: continue  # "may" is usually the verb
+            month = _MONTHS[name]
+            if year:
+                y = int(year) + (2000 if len(year) == 2 else 0)
+            else:
+                # Latest occurrence of that month the report covers
+                latest = report["dates"].dropna().max() if report["dates"] is not None else None
+                latest = latest if isinstance(latest, date) else self.today
+                y = latest.year if month <= latest.month else latest.year - 1
+            return _month_range(y, month)
+        return None
+
+    # --- EXECUTION ---
+    def run(self, plan: Dict[str, Any], report: Dict[str, Any]) -> Dict[str, Any]:
+        df = report["df"]
+        mask = pd.Series(True, index=df.index)
+        if plan["date"]:
+            start, end = (date.fromisoformat(d) for d in plan["date"])
+            mask &= report["dates"].map(lambda d: d is not None and start <= d <= end).astype(bool)
+        for col, values in plan["filters"]:
+            wanted = {_norm(v) for v in values}
+            mask &= df[col].astype(str).map(_norm).isin(wanted)
+        if plan["labels"]:
+            wanted = {_norm(v) for v in plan["labels"]}
+            mask &= df[plan["label_column"]].astype(str).map(_norm).isin(wanted)
+
+        values = report["numeric"][plan["measure"]]
+        if plan["sign"] == "debit": mask &= values > 0
+        elif plan["sign"] == "credit": mask &= values < 0
+        values = values[mask].dropna()
+
+        result = {"plan": plan, "report": report["report"], "rows_total": int(len(df)), "rows_matched": int(mask.sum())}
+        if report["dates"] is not None:
+            known = report["dates"].dropna()
+            if not known.empty: result["report_dates"] = [min(known).isoformat(), max(known).isoformat()]
+
+        op, group_by = plan["op"], plan["group_by"]
+        if op == "lookup":
+            rows = df[mask]
+            result["columns"] = {c: float(report["numeric"][c][mask].dropna().sum()) for c in report["numeric"]}
+            if len(rows) == 1:
+                result["row"] = {c: (None if pd.isna(v) else str(v)) for c, v in rows.iloc[0].items()}
+            return result
+
+        if group_by:
+            keys = self._group_keys(group_by, report)[values.index]
+            grouped = values.groupby(keys)
+            agg = {"sum": grouped.sum, "count": grouped.count, "mean": grouped.mean,
+                   "top": grouped.sum, "bottom": grouped.sum}[op]()
+            result["groups"] = int(len(agg))
+            if op == "top": agg = agg.nlargest(plan["n"])
+            elif op == "bottom": agg = agg.nsmallest(plan["n"])
+            elif group_by in ("day", "month"): agg = agg.sort_index()
+            else: agg = agg.reindex(agg.abs().sort_values(ascending=False).index)
+            result["items"] = [[str(k), float(v)] for k, v in agg.head(MAX_ITEMS).items()]
+            return result
+
+        result["value"] = {"sum": lambda: float(values.sum()), "count": lambda: int(len(values)),
+                           "mean": lambda: float(values.mean()) if len(values) else None}[op]()
+        return result
+
+    def _group_keys(self, group_by: str, report) -> pd.Series:
+        if group_by == "day": return report["dates"].map(lambda d: d.isoformat() if d else "Unknown")
+        if group_by == "month": return report["dates"].map(lambda d: d.strftime("%Y-%m") if d else "Unknown")
+        return report["df"][group_by].astype(str)
+
+    # --- ENTRY POINT ---
+    def answer(self, query: str, data, report_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+        """Computed result with a `facts` text for the LLM, or None when the question needs the LLM itself."""
+        report = self.prepare(data, report_name)
+        if report is None: return None
+        plan = self.plan(query, report)
+        if plan is None: return None
+        result = self.run(plan, report)
+        result["facts"] = describe(result)
+        return result
+
+
+def describe(result: Dict[str, Any]) -> str:
+    """Plain-text statement of a computed result (also the answer when the LLM is unavailable)."""
+    plan = result["plan"]
+    conditions = []
+    if plan["date"]:
+        start, end = plan["date"]
+        conditions.append(f"date {start}" if start == end else f"dates {start} to {end}")
+    conditions.extend(f"{col} = {' / '.join(values)}" for col, values in plan["filters"])
+    if plan["labels"]: conditions.append(f"{plan['label_column']} = {' / '.join(plan['labels'])}")
+    if plan["sign"]: conditions.append(f"{plan['sign']} side only")
+    where = f" where {', '.join(conditions)}" if conditions else ""
+    measure = plan["measure"]
+
+    matched = result["rows_matched"]
+    lines = [f"Computed exactly over all {result['rows_total']:,} rows of {result.get('report') or 'the report'}; "
+             f"{matched:,} row{'' if matched == 1 else 's'} matched{where}."]
+    if "report_dates" in result:
+        lines.append(f"The report covers {result['report_dates'][0]} to {result['report_dates'][1]}.")
+
+    op = plan["op"]
+    if op == "lookup":
+        if result["rows_matched"] == 0:
+            lines.append("No matching rows.")
+        elif "row" in result:
+            lines.append("Row: " + ", ".join(f"{k}: {v}" for k, v in result["row"].items() if v not in (None, "")))
+        else:
+            lines.append("Totals: " + ", ".join(f"{c}: {_fmt(v)}" for c, v in result["columns"].items()))
+    elif "items" in result:
+        group = plan["group_by"]
+        if op in ("top", "bottom"):
+            lines.append(f"{op.title()} {plan['n']} {group} by total {measure} (of {result['groups']:,}):")
+        else:
+            what = {"sum": f"Total {measure}", "count": "Row count", "mean": f"Average {measure}"}[op]
+            lines.append(f"{what} by {group} ({result['groups']:,} groups):")
+        lines.extend(f"- {k}: {v:,.0f}" if op == "count" else f"- {k}: {_fmt(v)}" for k, v in result["items"])
+        if result["groups"] > len(result["items"]) and op not in ("top", "bottom"):
+            lines.append(f"(first {len(result['items'])} of {result['groups']} groups shown)")
+    else:
+        value = result["value"]
+        if op == "count": lines.append(f"Row count: {value:,}")
+        elif value is None: lines.append(f"Average {measure}: no matching rows")
+        else: lines.append(f"{'Total' if op == 'sum' else 'Average'} {measure}: {_fmt(value)}")
+    return "\n".join(lines)
+
+
+def compute_answer(query: str, data, report_name: Optional[str] = None) -> Optional[Dict[str, Any]]:
+    """One-call helper used by the summarizer."""
+    return QueryEngine().answer(query, data, report_name)
@@ -0,0 +1,144 @@
+# tools/report_cache.py
+"""
+In-process cache of Tally report exports.
+
+get_report keys exports by (company, report, from date, to date) and reuses
+one while it is fresh:
+- younger than REPORT_CACHE_TTL seconds, or
+- younger than REPORT_CACHE_MAX_AGE and the company's AlterIDs (probed at
+  most REPORT_CACHE_PROBE_TTL seconds ago) haven't moved since the export.
+
+Concurrent requests for the same export share one Tally round trip. The
+prefetch scheduler writes here too, so the first user request of the day
+finds warm data.
+"""
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Callable, Dict, Optional, Tuple
+
+REPORT_CACHE_TTL = float(os.getenv("REPORT_CACHE_TTL", "120"))
+REPORT_CACHE_MAX_AGE = float(os.getenv("REPORT_CACHE_MAX_AGE", "3600"))
+REPORT_CACHE_PROBE_TTL = float(os.getenv("REPORT_CACHE_PROBE_TTL", "60"))
+REPORT_CACHE_MAX_ENTRIES = int(os.getenv("REPORT_CACHE_MAX_ENTRIES", "64"))
+
+CacheKey = Tuple[str, str, Optional[str], Optional[str]]
+
+
+def cache_key(company: str, report: str, from_date: Optional[str] = None, to_date: Optional[str] = None) -> CacheKey:
+    return (company or "", report, from_date or None, to_date or None)
+
+
+class _Entry:
+    __slots__ = ("payload", "fetched_at", "alter_ids", "hits", "source")
+
+    def __init__(self, payload: str, alter_ids: Optional[str], source: str):
+        self.payload = payload
+        self.fetched_at = time.monotonic()
+        self.alter_ids = alter_ids
+        self.hits = 0
+        self.source = source
+
+
+class ReportCache:
+    def __init__(self, ttl: float = REPORT_CACHE_TTL, max_age: float = REPORT_CACHE_MAX_AGE,
+                 probe_ttl: float = REPORT_CACHE_PROBE_TTL, max_entries: int = REPORT_CACHE_MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_age = max_age
+        self.probe_ttl = probe_ttl
+        self.max_entries = max(1, max_entries)
+        self._entries: "OrderedDict[CacheKey, _Entry]" = OrderedDict()
+        self._probes: Dict[str, Tuple[str, float]] = {}  # company -> (alter ids, probed at)
+        self._inflight: Dict[CacheKey, threading.Event] = {}
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "misses": 0, "shared": 0}
+
+    # --- ALTERID PROBES ---
+    def record_probe(self, company: str, alter_ids: str):
+        with self._lock:
+            self._probes[company] = (alter_ids, time.monotonic())
+
+    def last_probe(self, company: str) -> Optional[str]:
+        """Company's AlterIDs if probed within probe_ttl, else None."""
+        with self._lock:
+            probe = self._probes.get(company)
+        if probe and time.monotonic() - probe[1] <= self.probe_ttl: return probe[0]
+        return None
+
+    # --- ENTRIES ---
+    def _fresh(self, key: CacheKey, entry: _Entry) -> bool:
+        age = time.monotonic() - entry.fetched_at
+        if age <= self.ttl: return True
+        if age > self.max_age or entry.alter_ids is None: return False
+        probe = self._probes.get(key[0])
+        return bool(probe and time.monotonic() - probe[1] <= self.probe_ttl and probe[0] == entry.alter_ids)
+
+    def get(self, key: CacheKey) -> Optional[str]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not self._fresh(key, entry): return None
+            entry.hits += 1
+            self._entries.move_to_end(key)
+            return entry.payload
+
+    def put(self, key: CacheKey, payload: str, alter_ids: Optional[str] = None, source: str = "request"):
+        with self._lock:
+            self._entries[key] = _Entry(payload, alter_ids, source)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, company: Optional[str] = None):
+        with self._lock:
+            for key in [k for k in self._entries if company is None or k[0] == company]:
+                del self._entries[key]
+
+    def get_or_fetch(self, key: CacheKey, fetch: Callable[[], str], cacheable: Callable[[str], bool]) -> str:
+        """Cached payload, or fetch() once for all concurrent callers of the same key."""
+        payload = self.get(key)
+        if payload is not None:
+            with self._lock: self.stats["hits"] += 1
+            return payload
+        with self._lock:
+            waiting = self._inflight.get(key)
+            if waiting is None:
+                done = self._inflight[key] = threading.Event()
+            self.stats["shared" if waiting else "misses"] += 1
+        if waiting is not None:
+            waiting.wait()
+            # The export may have failed (and not been cached): then fetch on our own
+            payload = self.get(key)
+            return payload if payload is not None else self._fetch_and_store(key, fetch, cacheable, None)
+
+        try:
+            return self._fetch_and_store(key, fetch, cacheable, self.last_probe(key[0]))
+        finally:
+            with self._lock: self._inflight.pop(key, None)
+            done.set()
+
+    def _fetch_and_store(self, key, fetch, cacheable, alter_ids) -> str:
+        payload = fetch()
+        if cacheable(payload): self.put(key, payload, alter_ids)
+        return payload
+
+    def status(self) -> Dict:
+        now = time.monotonic()
+        with self._lock:
+            entries = [{"company": k[0], "report": k[1], "from": k[2], "to": k[3],
+                        "age_seconds": round(now - e.fetched_at, 1), "hits": e.hits, "source": e.source,
+                        "fresh": self._fresh(k, e)} for k, e in self._entries.items()]
+            return {"entries": entries, **self.stats}
+
+
+_CACHE: Optional[ReportCache] = None
+_CACHE_LOCK = threading.Lock()
+
+
+def get_report_cache() -> ReportCache:
+    """Process-wide cache shared by get_report and the prefetch scheduler."""
+    global _CACHE
+    with _CACHE_LOCK:
+        if _CACHE is None:
+            _CACHE = ReportCache()
+        return _CACHE
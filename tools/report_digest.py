@@ -0,0 +1,183 @@
+# tools/report_digest.py
+"""
+Compact, whole-report digest for LLM prompts.
+
+Instead of sending the first few thousand characters of pretty-printed JSON,
+the summarizer sends totals, counts, top-N rows, group subtotals and date
+ranges computed over EVERY row of the report.
+"""
+import json
+from typing import Any, Dict, List, Optional
+
+try:
+    from tools.table_generator import TableGenerator
+    from tools.tally_values import parse_amount, parse_tally_date
+except ImportError:
+    import sys, os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from tools.table_generator import TableGenerator
+    from tools.tally_values import parse_amount, parse_tally_date
+
+# Columns that hold numbers but are identifiers, not amounts
+ID_HINTS = ("No", "Number", "ID", "Id", "GUID", "Key")
+LABEL_HINTS = ("Particulars", "Item Name", "Name", "Ledger", "Party")
+AMOUNT_PRIORITY = ("Amount", "Closing Balance", "Debit", "Credit", "Value", "Total")
+
+MIN_PARSE_RATIO = 0.8
+MAX_GROUP_CARDINALITY = 30
+
+
+def _fmt(value: float) -> str:
+    return f"{value:,.2f}"
+
+
+def _parse_ratio(series, parser, sample: int = 500) -> float:
+    """Share of non-empty values the parser accepts (on a sample, so detection stays cheap)."""
+    values = series.dropna()
+    values = values[values.astype(str).str.strip() != ""].head(sample)
+    if values.empty: return 0.0
+    parsed = values.map(parser)
+    return parsed.notna().sum() / len(values)
+
+
+class ReportDigest:
+    """Builds a digest dict from a fetched report and renders it as prompt text."""
+
+    def __init__(self, top_n: int = 10, max_groups: int = 15):
+        self.top_n = top_n
+        self.max_groups = max_groups
+        self.table_gen = TableGenerator()
+
+    # --- COLUMN DETECTION ---
+    def _classify(self, df):
+        date_col, label_col = None, None
+        numeric, categorical = {}, []
+
+        for col in df.columns:
+            series = df[col]
+            if series.map(lambda x: isinstance(x, (dict, list))).any(): continue
+
+            if date_col is None and _parse_ratio(series, parse_tally_date) >= MIN_PARSE_RATIO:
+                date_col = col
+                continue
+
+            if not any(h in col for h in ID_HINTS) and _parse_ratio(series, parse_amount) >= MIN_PARSE_RATIO:
+                numeric[col] = series.map(parse_amount)
+                continue
+
+            if label_col is None and any(h in col for h in LABEL_HINTS):
+                label_col = col
+            else:
+                categorical.append(col)
+
+        if label_col is None and categorical:
+            # Highest-cardinality text column is the best row label
+            label_col = max(categorical, key=lambda c: df[c].nunique())
+            categorical.remove(label_col)
+        return date_col, label_col, numeric, categorical
+
+    def _primary_amount(self, numeric: Dict[str, Any]) -> Optional[str]:
+        for hint in AMOUNT_PRIORITY:
+            for col in numeric:
+                if hint in col: return col
+        return next(iter(numeric), None)
+
+    # --- BUILD ---
+    def build(self, data, report_name: Optional[str] = None) -> Dict[str, Any]:
+        df = self.table_gen.build_frame(data, report_name)
+        digest: Dict[str, Any] = {"report": report_name, "rows": int(len(df)), "columns": [str(c) for c in df.columns]}
+        if df.empty: return digest
+
+        date_col, label_col, numeric, categorical = self._classify(df)
+        primary = self._primary_amount(numeric)
+
+        digest["totals"] = {}
+        for col, values in numeric.items():
+            vals = values.dropna()
+            if vals.empty: continue
+            digest["totals"][col] = {
+                "sum": float(vals.sum()),
+                "count": int(vals.count()),
+                "min": float(vals.min()),
+                "max": float(vals.max()),
+                "positive_sum": float(vals[vals > 0].sum()),
+                "negative_sum": float(vals[vals < 0].sum()),
+            }
+
+        if primary and label_col:
+            amounts = numeric[primary]
+            top = amounts.abs().nlargest(self.top_n).index
+            digest["top"] = {
+                "by": primary,
+                "label": label_col,
+                "items": [[str(df.at[i, label_col]), float(amounts[i])] for i in top],
+            }
+
+        if primary:
+            groups = {}
+            for col in categorical:
+                nunique = df[col].nunique()
+                if 1 < nunique <= MAX_GROUP_CARDINALITY:
+                    grouped = numeric[primary].groupby(df[col].astype(str)).agg(["sum", "count"])
+                    grouped = grouped.reindex(grouped["sum"].abs().sort_values(ascending=False).index)
+                    groups[col] = [[str(k), float(r["sum"]), int(r["count"])]
+                                   for k, r in grouped.head(self.max_groups).iterrows()]
+            if groups: digest["subtotals"] = {"by": primary, "groups": groups}
+
+        if date_col:
+            dates = df[date_col].map(parse_tally_date).dropna()
+            if not dates.empty:
+                digest["date_range"] = {
+                    "column": date_col,
+                    "from": min(dates).isoformat(),
+                    "to": max(dates).isoformat(),
+                    "distinct_days": int(dates.nunique()),
+                }
+                if primary:
+                    months = dates.map(lambda d: d.strftime("%Y-%m"))
+                    monthly = numeric[primary].loc[months.index].groupby(months).sum()
+                    digest["monthly"] = {"by": primary, "items": [[k, float(v)] for k, v in monthly.items()]}
+
+        digest["sample_rows"] = json.loads(df.head(3).to_json(orient="records", force_ascii=False))
+        return digest
+
+    # --- RENDER ---
+    def to_text(self, digest: Dict[str, Any]) -> str:
+        lines: List[str] = []
+        title = f" for {digest['report']}" if digest.get("report") else ""
+        lines.append(f"REPORT DIGEST{title} (computed over all {digest['rows']:,} rows)")
+        lines.append(f"Columns: {', '.join(digest['columns'])}")
+
+        dr = digest.get("date_range")
+        if dr:
+            lines.append(f"Date range ({dr['column']}): {dr['from']} to {dr['to']} ({dr['distinct_days']} distinct days)")
+
+        for col, t in digest.get("totals", {}).items():
+            lines.append(f"Total {col}: {_fmt(t['sum'])} (n={t['count']:,}, min={_fmt(t['min'])}, "
+                         f"max={_fmt(t['max'])}, +{_fmt(t['positive_sum'])} / {_fmt(t['negative_sum'])})")
+
+        top = digest.get("top")
+        if top and top["items"]:
+            lines.append(f"Top {len(top['items'])} {top['label']} by |{top['by']}|:")
+            lines.extend(f"- {name}: {_fmt(val)}" for name, val in top["items"])
+
+        sub = digest.get("subtotals")
+        if sub:
+            for col, items in sub["groups"].items():
+                lines.append(f"{sub['by']} by {col} (sum, count):")
+                lines.extend(f"- {k}: {_fmt(v)} ({n:,})" for k, v, n in items)
+
+        monthly = digest.get("monthly")
+        if monthly and len(monthly["items"]) > 1:
+            lines.append(f"Monthly {monthly['by']}:")
+            lines.extend(f"- {m}: {_fmt(v)}" for m, v in monthly["items"])
+
+        if digest.get("sample_rows"):
+            lines.append(f"Sample rows: {json.dumps(digest['sample_rows'], ensure_ascii=False)}")
+        return "\n".join(lines)
+
+
+def build_digest_text(data, report_name: Optional[str] = None, top_n: int = 10) -> str:
+    """One-call helper used by the summarizer."""
+    builder = ReportDigest(top_n=top_n)
+    return builder.to_text(builder.build(data, report_name))
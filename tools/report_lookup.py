@@ -1,5 +1,5 @@
 # tools/report_lookup.py
-from langchain.tools import tool
+from langchain_core.tools import tool  # same decorator as langchain.tools, without importing langgraph
 try:
     from vector_store import get_best_report
 except ImportError:
@@ -0,0 +1,287 @@
+# tools/report_parsers.py
+"""
+Dedicated parsers for the Tally reports we know the shape of.
+
+Each parser walks its report once and emits typed columns (Decimal amounts,
+dates, ints) instead of strings. TableGenerator asks this registry first and
+only falls back to its generic list-guessing heuristics for unknown reports.
+
+Sign convention: amounts are signed Dr positive / Cr negative, the same way
+parse_amount reads "1,234.00 Dr". Tally's XML writes debits as bare negative
+numbers, so those are flipped (see _xml_amount).
+"""
+from decimal import Decimal
+from typing import Callable, Dict, List, Optional
+
+try:
+    from tools.tally_values import parse_amount, parse_decimal, parse_tally_date
+    from tools.voucher_batch import voucher_amounts
+except ImportError:
+    from tally_values import parse_amount, parse_decimal, parse_tally_date
+    from voucher_batch import voucher_amounts
+
+try:
+    from report_config import TALLY_XML_MAP
+except ImportError:
+    import sys, os
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from report_config import TALLY_XML_MAP
+
+# Column types (what to_table_json reports to the frontend)
+STRING, NUMBER, INTEGER, DATE = "string", "number", "integer", "date"
+
+
+class ParsedTable:
+    """Columnar parser output: {column: [values]} plus a type per column."""
+
+    def __init__(self, report_name: str, types: Dict[str, str]):
+        self.report_name = report_name
+        self.types = dict(types)
+        self.columns: Dict[str, list] = {name: [] for name in self.types}
+        self._lists = list(self.columns.values())
+
+    def add_row(self, *values):
+        for column, value in zip(self._lists, values):
+            column.append(value)
+
+    def __len__(self):
+        return len(self._lists[0]) if self._lists else 0
+
+    def rows(self) -> List[dict]:
+        names = list(self.columns)
+        return [dict(zip(names, values)) for values in zip(*self._lists)]
+
+
+# --- REGISTRY ---
+_PARSERS: Dict[str, Callable] = {}
+_DETECTORS: List[tuple] = []  # (predicate(data), report name), checked in registration order
+
+
+def _norm(name: str) -> str:
+    return "".join(c for c in str(name).lower() if c.isalnum())
+
+
+def register_parser(*names: str, detect: Callable = None):
+    """Registers a parser under one or more report names (matched case/punctuation-insensitively)."""
+    def decorator(fn):
+        for name in names:
+            _PARSERS[_norm(name)] = fn
+        if detect:
+            _DETECTORS.append((detect, names[0]))
+        fn.report_name = names[0]
+        return fn
+    return decorator
+
+
+def get_parser(report_name: Optional[str]) -> Optional[Callable]:
+    if not report_name: return None
+    return _PARSERS.get(_norm(TALLY_XML_MAP.get(report_name, report_name)))
+
+
+def detect_report(data) -> Optional[str]:
+    """Guesses the report from its top-level tags (for callers that don't know the name)."""
+    for predicate, name in _DETECTORS:
+        try:
+            if predicate(data): return name
+        except Exception:
+            continue
+    return None
+
+
+def parse_report(data, report_name: Optional[str] = None) -> Optional[ParsedTable]:
+    """
+    Runs the parser for report_name (or the detected report). Returns None when no
+    parser applies or it finds no rows, so the caller can use its generic fallback.
+    """
+    candidates = []
+    named = get_parser(report_name)
+    if named: candidates.append(named)
+    detected = get_parser(detect_report(data))
+    if detected and detected is not named: candidates.append(detected)
+
+    for parser in candidates:
+        try:
+            table = parser(data)
+        except Exception as e:
+            print(f"⚠️ {parser.report_name} parser failed, falling back: {e}")
+            continue
+        if table is not None and len(table): return table
+    return None
+
+
+# --- VALUE HELPERS ---
+def _as_list(node) -> list:
+    """xml_to_dict gives a dict for one child and a list for several; empty elements are {}."""
+    if isinstance(node, list): return node
+    if node in (None, {}, ""): return []
+    return [node]
+
+
+def _text(node) -> str:
+    if isinstance(node, dict): node = node.get("_value", "")
+    return str(node).strip() if node is not None else ""
+
+
+def _get(node, *path):
+    for key in path:
+        if not isinstance(node, dict): return None
+        node = node.get(key)
+    return node
+
+
+def _xml_amount(node) -> Optional[Decimal]:
+    """XML amount -> Decimal, Dr positive. Bare numbers use Tally's XML sign (debit negative)."""
+    text = _text(node)
+    if not text: return None
+    amount = parse_decimal(text)
+    if amount is None: return None
+    if text[-2:].lower() in ("dr", "cr"): return amount
+    return -amount
+
+
+def _quantity(node):
+    """'8748 nos' -> (Decimal('8748'), 'nos')."""
+    text = _text(node)
+    if not text: return None, ""
+    number, _, unit = text.partition(" ")
+    return parse_decimal(number), unit.strip()
+
+
+def _rate(node) -> Optional[Decimal]:
+    """'393.84/nos' -> Decimal('393.84')."""
+    text = _text(node)
+    return parse_decimal(text.split("/", 1)[0]) if text else None
+
+
+def _int(node) -> Optional[int]:
+    text = _text(node)
+    try: return int(text)
+    except ValueError: return None
+
+
+def _display_names(data, key="DSPACCNAME") -> list:
+    return [_text(_get(item, "DSPDISPNAME")) for item in _as_list(data.get(key))]
+
+
+# --- DISPLAY REPORTS ---
+@register_parser("Stock Summary", detect=lambda d: "DSPSTKINFO" in d)
+def parse_stock_summary(data) -> ParsedTable:
+    """Parallel DSPACCNAME / DSPSTKINFO lists."""
+    table = ParsedTable("Stock Summary", {"Item Name": STRING, "Quantity": NUMBER, "Unit": STRING,
+                                          "Rate": NUMBER, "Amount": NUMBER})
+    for name, info in zip(_display_names(data), _as_list(data.get("DSPSTKINFO"))):
+        closing = _get(info, "DSPSTKCL") or {}
+        qty, unit = _quantity(closing.get("DSPCLQTY"))
+        table.add_row(name, qty, unit, _rate(closing.get("DSPCLRATE")), _xml_amount(closing.get("DSPCLAMTA")))
+    return table
+
+
+@register_parser("Trial Balance", detect=lambda d: "DSPACCINFO" in d)
+def parse_trial_balance(data) -> ParsedTable:
+    """Parallel DSPACCNAME / DSPACCINFO lists; one of Dr / Cr is empty per ledger."""
+    table = ParsedTable("Trial Balance", {"Particulars": STRING, "Debit": NUMBER, "Credit": NUMBER,
+                                          "Closing Balance": NUMBER})
+    for name, info in zip(_display_names(data), _as_list(data.get("DSPACCINFO"))):
+        dr = _xml_amount(_get(info, "DSPCLDRAMT", "DSPCLDRAMTA"))
+        cr = _xml_amount(_get(info, "DSPCLCRAMT", "DSPCLCRAMTA"))
+        debit = abs(dr) if dr is not None else Decimal(0)
+        credit = abs(cr) if cr is not None else Decimal(0)
+        table.add_row(name, debit, credit, debit - credit)
+    return table
+
+
+@register_parser("Balance Sheet", detect=lambda d: "BSNAME" in d)
+def parse_balance_sheet(data) -> ParsedTable:
+    """Parallel BSNAME (-> DSPACCNAME) / BSAMT (BSSUBAMT, BSMAINAMT) lists."""
+    table = ParsedTable("Balance Sheet", {"Particulars": STRING, "Sub Amount": NUMBER, "Amount": NUMBER})
+    for name_node, amt in zip(_as_list(data.get("BSNAME")), _as_list(data.get("BSAMT"))):
+        name = _text(_get(name_node, "DSPACCNAME", "DSPDISPNAME"))
+        table.add_row(name, _xml_amount(_get(amt, "BSSUBAMT")), _xml_amount(_get(amt, "BSMAINAMT")))
+    return table
+
+
+@register_parser("Profit & Loss A/c", "Profit & Loss", detect=lambda d: "PLAMT" in d)
+def parse_profit_and_loss(data) -> ParsedTable:
+    """Parallel DSPACCNAME / PLAMT (PLSUBAMT, BSMAINAMT or PLMAINAMT) lists."""
+    table = ParsedTable("Profit & Loss A/c", {"Particulars": STRING, "Sub Amount": NUMBER, "Amount": NUMBER})
+    for name, amt in zip(_display_names(data), _as_list(data.get("PLAMT"))):
+        main = _get(amt, "BSMAINAMT")
+        if main in (None, {}): main = _get(amt, "PLMAINAMT")
+        table.add_row(name, _xml_amount(_get(amt, "PLSUBAMT")), _xml_amount(main))
+    return table
+
+
+# --- COLLECTION EXPORTS ---
+@register_parser("Ledger Balances", detect=lambda d: "LEDGER" in d)
+def parse_ledger_balances(data) -> ParsedTable:
+    """LEDGER list from a pushed-down collection export (tdl_requests): name, group, closing balance."""
+    table = ParsedTable("Ledger Balances", {"Ledger": STRING, "Group": STRING, "Closing Balance": NUMBER})
+    for ledger in _as_list(data.get("LEDGER")):
+        name = _text(ledger.get("NAME")) or _text(_get(ledger, "LANGUAGENAME.LIST", "NAME.LIST", "NAME"))
+        table.add_row(name, _text(ledger.get("PARENT")), _xml_amount(ledger.get("CLOSINGBALANCE")))
+    return table
+
+
+@register_parser("Stock Item Balances", detect=lambda d: "STOCKITEM" in d)
+def parse_stock_item_balances(data) -> ParsedTable:
+    """STOCKITEM list from a pushed-down collection export: the Stock Summary columns for the named items."""
+    table = ParsedTable("Stock Item Balances", {"Item Name": STRING, "Group": STRING, "Quantity": NUMBER,
+                                                "Unit": STRING, "Rate": NUMBER, "Amount": NUMBER})
+    for item in _as_list(data.get("STOCKITEM")):
+        name = _text(item.get("NAME")) or _text(_get(item, "LANGUAGENAME.LIST", "NAME.LIST", "NAME"))
+        qty, unit = _quantity(item.get("CLOSINGBALANCE"))
+        table.add_row(name, _text(item.get("PARENT")), qty, unit, _rate(item.get("CLOSINGRATE")),
+                      _xml_amount(item.get("CLOSINGVALUE")))
+    return table
+
+
+# --- VOUCHER REPORTS ---
+def _voucher_messages(data) -> list:
+    """TALLYMESSAGE list wherever the export put it (same places _parse_tally_vouchers looks)."""
+    if isinstance(data, list): return data
+    if not isinstance(data, dict): return []
+    for path in (("TALLYMESSAGE",), ("REQUESTDATA", "TALLYMESSAGE"),
+                 ("BODY", "IMPORTDATA", "REQUESTDATA", "TALLYMESSAGE")):
+        messages = _get(data, *path)
+        if messages: return _as_list(messages)
+    return []
+
+
+def _parse_vouchers(data, report_name: str) -> ParsedTable:
+    table = ParsedTable(report_name, {"Date": DATE, "Particulars": STRING, "Vch Type": STRING, "Vch No": STRING,
+                                      "Amount": NUMBER, "GUID": STRING, "Alter ID": INTEGER})
+    vouchers = [msg["VOUCHER"] for msg in _voucher_messages(data) if isinstance(msg, dict) and msg.get("VOUCHER")]
+
+    # Voucher value (TableGenerator's rule), parsed in one batch; rounded back to paise
+    amounts = [Decimal(f"{a:.2f}") for a in voucher_amounts(vouchers, fallback=parse_amount).tolist()]
+
+    for v, amount in zip(vouchers, amounts):
+        particulars = _text(v.get("PARTYNAME")) or _text(v.get("PARTYLEDGERNAME")) or "Unknown"
+        table.add_row(parse_tally_date(_text(v.get("DATE"))), particulars, _text(v.get("VOUCHERTYPENAME")),
+                      _text(v.get("VOUCHERNUMBER")), amount, _text(v.get("GUID")),
+                      _int(v.get("ALTERID")))
+    return table
+
+
+@register_parser("Day Book", detect=lambda d: bool(_voucher_messages(d)))
+def parse_day_book(data) -> ParsedTable:
+    return _parse_vouchers(data, "Day Book")
+
+
+@register_parser("Sales Register", detect=lambda d: "DSPVCHDATE" in d)
+def parse_sales_register(data) -> ParsedTable:
+    """Voucher export (same shape as Day Book) or the register display (parallel DSPVCH* lists)."""
+    if _voucher_messages(data):
+        return _parse_vouchers(data, "Sales Register")
+
+    table = ParsedTable("Sales Register", {"Date": DATE, "Particulars": STRING, "Vch Type": STRING,
+                                           "Vch No": STRING, "Debit": NUMBER, "Credit": NUMBER})
+    columns = [_as_list(data.get(tag)) for tag in
+               ("DSPVCHDATE", "DSPVCHLEDACCOUNT", "DSPVCHTYPE", "DSPVCHNUMBER", "DSPVCHDRAMT", "DSPVCHCRAMT")]
+    length = max(len(c) for c in columns)
+    for i in range(length):
+        date_, party, vch_type, vch_no, dr, cr = (c[i] if i < len(c) else None for c in columns)
+        debit, credit = _xml_amount(dr), _xml_amount(cr)
+        table.add_row(parse_tally_date(_text(date_)), _text(party), _text(vch_type), _text(vch_no),
+                      abs(debit) if debit is not None else None, abs(credit) if credit is not None else None)
+    return table
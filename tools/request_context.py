@@ -0,0 +1,37 @@
+# tools/request_context.py
+"""
+Per-request rendering options.
+
+The chart/table tools are called from LLM-written code and LangChain tools,
+so options like the output format can't be passed as arguments. The API sets
+them here for the duration of one request (context variables are isolated
+per thread / task, so concurrent requests don't see each other's options).
+"""
+import contextvars
+from contextlib import contextmanager
+
+CHART_FORMATS = ("png", "svg")
+TABLE_FORMATS = ("json", "html", "png")  # json: rows + column types; html: json + an HTML fragment
+
+CHART_FORMAT = contextvars.ContextVar("chart_format", default="png")
+TABLE_FORMAT = contextvars.ContextVar("table_format", default="json")
+
+
+def _set(var, value, allowed, name, tokens):
+    fmt = value.lower()
+    if fmt not in allowed:
+        raise ValueError(f"Unsupported {name} '{value}'. Use one of {allowed}.")
+    tokens.append((var, var.set(fmt)))
+
+
+@contextmanager
+def request_options(chart_format: str = None, table_format: str = None):
+    """Sets rendering options for the current request."""
+    tokens = []
+    try:
+        if chart_format: _set(CHART_FORMAT, chart_format, CHART_FORMATS, "chart_format", tokens)
+        if table_format: _set(TABLE_FORMAT, table_format, TABLE_FORMATS, "table_format", tokens)
+        yield
+    finally:
+        for var, token in reversed(tokens):
+            var.reset(token)
@@ -0,0 +1,307 @@
+# tools/rollup_store.py
+"""
+Per-company daily and monthly rollups of voucher data (SQLite).
+
+Every voucher export that passes through fetch_report (Day Book, Sales
+Register, ...) is folded in incrementally: each voucher's contribution is
+stored by GUID, so a voucher seen again with a higher ALTERID replaces its
+old contribution and unchanged vouchers are skipped. Trend questions then read
+the rollups instead of re-exporting and re-aggregating the whole report.
+
+Kinds:
+- sales_party: Sales voucher value by party
+- sales_item:  Sales inventory value by stock item
+- receipts:    Receipt amounts by the ledger credited (who paid)
+- payments:    Payment amounts by the ledger debited (who was paid)
+
+Amounts are stored in paise (integers), so adding and removing contributions
+never drifts. Vouchers deleted in Tally are only removed if an export
+reports them (ACTION="Delete" or ISCANCELLED="Yes").
+
+Chat exports are often partial (one day, or only Sales after a pushdown), so
+folding them in says nothing about which days are complete. Only full Day
+Book exports of a known period are recorded as coverage (mark_covered); the
+trend tool backfills the gaps (missing) month by month before reading.
+"""
+import os
+import sqlite3
+import threading
+import time
+from datetime import date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+try:
+    from tools.report_parsers import _voucher_messages
+    from tools.tally_values import parse_amount, parse_tally_date
+    from tools.voucher_batch import voucher_amounts
+except ImportError:
+    from report_parsers import _voucher_messages
+    from tally_values import parse_amount, parse_tally_date
+    from voucher_batch import voucher_amounts
+
+ROLLUP_DB = os.getenv("ROLLUP_DB", "tally_rollups.db")
+
+KINDS = ("sales_party", "sales_item", "receipts", "payments")
+GRAINS = {"day": "D", "month": "M"}
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vouchers (
+    company TEXT NOT NULL, guid TEXT NOT NULL, alterid INTEGER NOT NULL,
+    PRIMARY KEY (company, guid));
+CREATE TABLE IF NOT EXISTS contributions (
+    company TEXT NOT NULL, guid TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL,
+    day TEXT NOT NULL, paise INTEGER NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_contrib_voucher ON contributions (company, guid);
+CREATE TABLE IF NOT EXISTS rollups (
+    company TEXT NOT NULL, grain TEXT NOT NULL, kind TEXT NOT NULL, key TEXT NOT NULL,
+    period TEXT NOT NULL, paise INTEGER NOT NULL, count INTEGER NOT NULL,
+    PRIMARY KEY (company, grain, kind, period, key));
+CREATE TABLE IF NOT EXISTS state (
+    company TEXT PRIMARY KEY, max_alterid INTEGER NOT NULL, updated_at REAL NOT NULL);
+CREATE TABLE IF NOT EXISTS coverage (
+    company TEXT NOT NULL, start TEXT NOT NULL, end TEXT NOT NULL, fetched_at REAL NOT NULL);
+CREATE INDEX IF NOT EXISTS ix_coverage ON coverage (company, start);
+"""
+
+
+# --- VOUCHER -> CONTRIBUTIONS ---
+def _text(node) -> str:
+    if isinstance(node, dict): node = node.get("_value", "")
+    return str(node).strip() if node is not None else ""
+
+
+def _entries(node) -> list:
+    if isinstance(node, dict): return [node]
+    return [e for e in node if isinstance(e, dict)] if isinstance(node, list) else []
+
+
+def _paise(value: Optional[float]) -> int:
+    return int(round(abs(value) * 100)) if value is not None else 0
+
+
+def _is_debit(entry) -> bool:
+    """ISDEEMEDPOSITIVE when present, else the XML sign (debits are negative)."""
+    flag = _text(entry.get("ISDEEMEDPOSITIVE")).lower()
+    if flag in ("yes", "no"): return flag == "yes"
+    amount = parse_amount(_text(entry.get("AMOUNT")))
+    return amount is not None and amount < 0
+
+
+def _voucher_kind(v) -> Optional[str]:
+    name = (_text(v.get("VOUCHERTYPENAME")) or _text(v.get("VCHTYPE"))).lower()
+    if "order" in name: return None  # Sales/Purchase orders don't move money
+    if "sales" in name: return "sales"
+    if "receipt" in name: return "receipts"
+    if "payment" in name: return "payments"
+    return None
+
+
+def _voucher_key(v) -> str:
+    guid = _text(v.get("GUID"))
+    if guid: return guid
+    # No GUID (some custom exports): date + type + number is unique per company
+    return f"{_text(v.get('DATE'))}/{_text(v.get('VOUCHERTYPENAME'))}/{_text(v.get('VOUCHERNUMBER'))}"
+
+
+def _removed(v) -> bool:
+    return _text(v.get("ACTION")).lower() == "delete" or _text(v.get("ISCANCELLED")).lower() == "yes"
+
+
+def contributions(v, value: float) -> List[Tuple[str, str, str, int]]:
+    """(kind, key, ISO day, paise) rows one voucher adds. `value` is its voucher amount."""
+    kind = _voucher_kind(v)
+    day = parse_tally_date(_text(v.get("DATE")))
+    if kind is None or day is None or _removed(v): return []
+    day = day.isoformat()
+
+    out = []
+    if kind == "sales":
+        party = _text(v.get("PARTYNAME")) or _text(v.get("PARTYLEDGERNAME")) or "Unknown"
+        out.append(("sales_party", party, day, _paise(value)))
+        for item in _entries(v.get("ALLINVENTORYENTRIES.LIST")):
+            name = _text(item.get("STOCKITEMNAME"))
+            if name: out.append(("sales_item", name, day, _paise(parse_amount(_text(item.get("AMOUNT"))))))
+    else:
+        # Receipts: the credited side paid us; payments: the debited side was paid
+        want_debit = kind == "payments"
+        for entry in _entries(v.get("ALLLEDGERENTRIES.LIST")):
+            name = _text(entry.get("LEDGERNAME"))
+            if name and _is_debit(entry) == want_debit:
+                out.append((kind, name, day, _paise(parse_amount(_text(entry.get("AMOUNT"))))))
+    return [c for c in out if c[3]]
+
+
+# --- STORE ---
+class RollupStore:
+    def __init__(self, path: str = ROLLUP_DB):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.executescript(_SCHEMA)
+
+    def update(self, company: str, vouchers: List[dict]) -> Dict[str, int]:
+        """Folds vouchers in. Only new vouchers and ones with a higher ALTERID are (re)applied."""
+        stats = {"added": 0, "updated": 0, "skipped": 0}
+        if not vouchers: return stats
+
+        with self._lock:
+            known = dict(self._conn.execute("SELECT guid, alterid FROM vouchers WHERE company = ?", (company,)))
+
+            changed, seen = [], {}
+            for v in vouchers:
+                guid = _voucher_key(v)
+                try: alterid = int(_text(v.get("ALTERID")) or 0)
+                except ValueError: alterid = 0
+                old = known.get(guid)
+                # ALTERID 0 means the export doesn't carry it: always re-apply
+                if (old is not None and alterid and old >= alterid) or seen.get(guid, -1) >= alterid:
+                    stats["skipped"] += 1
+                    continue
+                seen[guid] = alterid
+                changed.append((guid, alterid, v, old is not None))
+            if not changed: return stats
+
+            # A voucher repeated within one export: keep its last version
+            latest = {guid: (alterid, v, existed) for guid, alterid, v, existed in changed}
+            values = voucher_amounts([v for _, v, _ in latest.values()], fallback=parse_amount).tolist()
+
+            deltas: Dict[tuple, list] = {}
+
+            def apply(kind, key, day, paise, sign):
+                for grain, period in (("D", day), ("M", day[:7])):
+                    acc = deltas.setdefault((grain, kind, period, key), [0, 0])
+                    acc[0] += sign * paise
+                    acc[1] += sign
+
+            cur = self._conn.cursor()
+            try:
+                new_rows = []
+                for (guid, (alterid, v, existed)), value in zip(latest.items(), values):
+                    if existed:
+                        for kind, key, day, paise in cur.execute(
+                                "SELECT kind, key, day, paise FROM contributions WHERE company = ? AND guid = ?",
+                                (company, guid)).fetchall():
+                            apply(kind, key, day, paise, -1)
+                        cur.execute("DELETE FROM contributions WHERE company = ? AND guid = ?", (company, guid))
+                        stats["updated"] += 1
+                    else:
+                        stats["added"] += 1
+                    for kind, key, day, paise in contributions(v, value):
+                        apply(kind, key, day, paise, 1)
+                        new_rows.append((company, guid, kind, key, day, paise))
+
+                cur.executemany("INSERT INTO contributions VALUES (?, ?, ?, ?, ?, ?)", new_rows)
+                cur.executemany(
+                    "INSERT OR REPLACE INTO vouchers VALUES (?, ?, ?)",
+                    [(company, guid, alterid) for guid, (alterid, _, _) in latest.items()])
+                cur.executemany(
+                    "INSERT INTO rollups VALUES (?, ?, ?, ?, ?, ?, ?) ON CONFLICT (company, grain, kind, period, key) "
+                    "DO UPDATE SET paise = paise + excluded.paise, count = count + excluded.count",
+                    [(company, grain, kind, key, period, p, n) for (grain, kind, period, key), (p, n) in deltas.items()])
+                cur.execute("DELETE FROM rollups WHERE company = ? AND count <= 0", (company,))
+                cur.execute(
+                    "INSERT INTO state VALUES (?, ?, ?) ON CONFLICT (company) DO UPDATE SET "
+                    "max_alterid = MAX(max_alterid, excluded.max_alterid), updated_at = excluded.updated_at",
+                    (company, max(alterid for alterid, _, _ in latest.values()), time.time()))
+                self._conn.commit()
+            except Exception:
+                self._conn.rollback()
+                raise
+        return stats
+
+    def update_from_report(self, company: str, data) -> Optional[Dict[str, int]]:
+        """Folds in a fetched report if it is a voucher export; returns None for other reports."""
+        vouchers = [m["VOUCHER"] for m in _voucher_messages(data) if isinstance(m, dict) and isinstance(m.get("VOUCHER"), dict)]
+        if not vouchers: return None
+        return self.update(company, vouchers)
+
+    # --- READS ---
+    def series(self, company: str, kind: str, grain: str = "month", start: Optional[str] = None,
+               end: Optional[str] = None, key: Optional[str] = None) -> List[Tuple[str, float, int]]:
+        """[(period, amount, count)] in period order. Periods are 'YYYY-MM-DD' / 'YYYY-MM'; start/end are ISO dates."""
+        sql, args = self._where(company, kind, grain, start, end, key)
+        rows = self._query(f"SELECT period, SUM(paise), SUM(count) FROM rollups {sql} GROUP BY period ORDER BY period", args)
+        return [(period, paise / 100, count) for period, paise, count in rows]
+
+    def breakdown(self, company: str, kind: str, grain: str = "month", start: Optional[str] = None,
+                  end: Optional[str] = None, top: int = 10) -> List[Tuple[str, float, int]]:
+        """[(key, amount, count)] for the largest keys in the range."""
+        sql, args = self._where(company, kind, grain, start, end, None)
+        rows = self._query(f"SELECT key, SUM(paise) AS total, SUM(count) FROM rollups {sql} "
+                           f"GROUP BY key ORDER BY total DESC LIMIT ?", args + [int(top)])
+        return [(key, paise / 100, count) for key, paise, count in rows]
+
+    def high_water(self, company: str) -> int:
+        """Highest ALTERID folded in for the company (0 if none)."""
+        rows = self._query("SELECT max_alterid FROM state WHERE company = ?", [company])
+        return rows[0][0] if rows else 0
+
+    def has_data(self, company: str) -> bool:
+        return bool(self._query("SELECT 1 FROM rollups WHERE company = ? LIMIT 1", [company]))
+
+    # --- COVERAGE ---
+    def mark_covered(self, company: str, start: date, end: date):
+        """Records that every voucher dated start..end (inclusive) has been folded in."""
+        if end < start: return
+        with self._lock:
+            self._conn.execute("INSERT INTO coverage VALUES (?, ?, ?, ?)",
+                               (company, start.isoformat(), end.isoformat(), time.time()))
+            self._conn.commit()
+
+    def covered(self, company: str) -> List[Tuple[date, date]]:
+        """Covered date ranges, merged and in order."""
+        merged: List[List[date]] = []
+        for start, end in self._query("SELECT start, end FROM coverage WHERE company = ? ORDER BY start", [company]):
+            start, end = date.fromisoformat(start), date.fromisoformat(end)
+            if merged and start <= merged[-1][1] + timedelta(days=1):
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [(start, end) for start, end in merged]
+
+    def missing(self, company: str, start: date, end: date) -> List[Tuple[date, date]]:
+        """Uncovered parts of start..end, split at month boundaries (one Day Book export each)."""
+        gaps, cursor = [], start
+        for lo, hi in self.covered(company):
+            if hi < cursor: continue
+            if lo > end: break
+            if lo > cursor: gaps.append((cursor, lo - timedelta(days=1)))
+            cursor = hi + timedelta(days=1)
+        if cursor <= end: gaps.append((cursor, end))
+
+        chunks = []
+        for lo, hi in gaps:
+            while lo <= hi:
+                month_end = (lo.replace(day=28) + timedelta(days=4)).replace(day=1) - timedelta(days=1)
+                chunks.append((lo, min(hi, month_end)))
+                lo = month_end + timedelta(days=1)
+        return chunks
+
+    def _where(self, company, kind, grain, start, end, key):
+        if kind not in KINDS: raise ValueError(f"Unknown rollup kind '{kind}'. Use one of {KINDS}.")
+        if grain not in GRAINS: raise ValueError(f"Unknown grain '{grain}'. Use one of {tuple(GRAINS)}.")
+        sql, args = "WHERE company = ? AND grain = ? AND kind = ?", [company, GRAINS[grain], kind]
+        # Month periods compare against the month part of the bounds
+        width = 10 if grain == "day" else 7
+        if start: sql += " AND period >= ?"; args.append(start[:width])
+        if end: sql += " AND period <= ?"; args.append(end[:width])
+        if key: sql += " AND key = ?"; args.append(key)
+        return sql, args
+
+    def _query(self, sql, args):
+        with self._lock:
+            return self._conn.execute(sql, args).fetchall()
+
+
+_STORE: Optional[RollupStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_rollup_store() -> RollupStore:
+    """Process-wide store shared by fetch_report and the trend tool."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = RollupStore()
+        return _STORE
@@ -1,15 +1,16 @@
 # tools/summarization_tool.py
 from langchain.tools import tool
 from dotenv import load_dotenv
-import google.generativeai as genai
 import os
 
+try:
+    from tools.llm_gateway import get_llm_gateway
+except ImportError:
+    from llm_gateway import get_llm_gateway
+
 load_dotenv()
 
-# Configure once at module level if possible
 API_KEY = os.getenv("GEMINI_API_KEY") or os.getenv("GOOGLE_API_KEY")
-if API_KEY:
-    genai.configure(api_key=API_KEY)
 
 @tool("summarize_text")
 def summarize_text(text: str, focus: str = "general financial insights") -> str:
@@ -24,10 +25,6 @@ def summarize_text(text: str, focus: str = "general financial insights") -> str:
         return "Error: Missing GEMINI_API_KEY in .env"
 
     try:
-        # Fallback to Flash for speed and large context window (1M tokens)
-        model_name = os.getenv("GEMINI_MODEL") or "gemini-2.0-flash-exp"
-        model = genai.GenerativeModel(model_name)
-        
         prompt = f"""
         ROLE: You are an expert Chartered Accountant (CA) and Financial Analyst.
         
@@ -43,7 +40,8 @@ def summarize_text(text: str, focus: str = "general financial insights") -> str:
         - Be concise and professional.
         """
         
-        response = model.generate_content(prompt)
+        # Flash (the gateway's default model) for speed and its large context window (1M tokens)
+        response = get_llm_gateway().generate("summarize_text", prompt)
         return response.text
 
     except Exception as e:
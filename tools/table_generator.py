@@ -1,16 +1,48 @@
 #tools/table_generator.py
 import pandas as pd
-import matplotlib
-matplotlib.use('Agg') # Force headless mode
-import matplotlib.pyplot as plt
 import os
 import json
 import uuid
+import hashlib
+from html import escape as html_escape
+
+try:
+    from tools.tally_values import parse_amount, parse_tally_date
+    from tools.request_context import TABLE_FORMAT
+    from tools.report_parsers import parse_report
+    from tools.table_sessions import get_table_sessions
+    from tools.artifact_store import get_artifact_store
+except ImportError:
+    from tally_values import parse_amount, parse_tally_date
+    from request_context import TABLE_FORMAT
+    from report_parsers import parse_report
+    from table_sessions import get_table_sessions
+    from artifact_store import get_artifact_store
 
 # --- CONFIGURATION ---
 PLOT_DIR = "generated_plots"
 os.makedirs(PLOT_DIR, exist_ok=True)
 
+TABLE_MAX_ROWS = int(os.getenv("TABLE_MAX_ROWS", "500"))  # rows per JSON/HTML table
+TYPE_SAMPLE_ROWS = 200
+MIN_TYPE_RATIO = 0.8
+ID_HINTS = ("No", "Number", "ID", "Id", "GUID")
+
+
+def _missing(value):
+    """None, NaN, NA or NaT: ragged rows leave these in the frame, and json can't hold them."""
+    return value is None or (pd.api.types.is_scalar(value) and pd.isna(value))
+
+
+def _int_or_none(value):
+    try: return int(value)
+    except (TypeError, ValueError): return None
+
+
+def _iso_date(value):
+    parsed = parse_tally_date(value)
+    return parsed.isoformat() if parsed else value
+
 class TableGenerator:
     """
     Generates professional tables. 
@@ -154,99 +186,249 @@ class TableGenerator:
         flatten(nested_dict)
         return out
 
-    def generate_table(self, json_path, query="Show data"):
+    def build_rows(self, data, report_name=None):
+        """Runs the parsing strategies and returns flat row dicts (all rows, not just the displayed ones)."""
+        # STRATEGY 0: Dedicated parser for a known report (typed values, single pass)
+        parsed = parse_report(data, report_name)
+        if parsed: return parsed.rows()
+
+        return self._build_rows_generic(data)
+
+    def _build_rows_generic(self, data):
+        # STRATEGY 1: Try Tally Voucher Parsing (Day Book)
+        main_list = self._parse_tally_vouchers(data)
+
+        # STRATEGY 2: Fallback to Generic Parsing (Stock Summary, P&L)
+        if not main_list:
+            main_list = self._merge_parallel_lists(data)
+
+        # STRATEGY 3: Deep Search
+        if not main_list or len(main_list) < 1:
+            main_list = self._find_longest_list(data)
+
+        if not main_list:
+            # Last Resort: Treat root as single row
+            if isinstance(data, dict): main_list = [data]
+            else: return []
+
+        # Flatten rows if they came from generic parser
+        if main_list and isinstance(main_list[0], dict) and "Date" not in main_list[0]:
+            return [self._flatten_row(item) for item in main_list]
+        return main_list
+
+    def build_frame(self, data, report_name=None):
+        """Full report as a DataFrame."""
+        parsed = parse_report(data, report_name)
+        if parsed: return pd.DataFrame(parsed.columns)
+        return pd.DataFrame(self._build_rows_generic(data))
+
+    # --- DISPLAY COLUMNS ---
+    def _display_columns(self, df):
+        """Picks the human-readable columns for generic reports (Name first)."""
+        if "Vch No" in df.columns: return df
+        desired_cols = []
+        for col in df.columns:
+            if col in self.TALLY_MAP.values(): desired_cols.append(col)
+            elif any(x in col for x in ["Name", "Amount", "Qty", "Rate", "Total", "Particulars"]):
+                desired_cols.append(col)
+        if not desired_cols: return df
+        # Sort so Name is first
+        final_cols = sorted(list(set(desired_cols)), key=lambda x: 0 if "Name" in x or "Particular" in x else 1)
+        return df[final_cols]
+
+    # --- STRUCTURED OUTPUT (JSON / HTML) ---
+    def _column_type(self, series):
+        """'number', 'date' or 'string', from a sample of non-empty values."""
+        if any(str(series.name).endswith(h) for h in ID_HINTS): return "string"  # "Vch No" is not an amount
+        values = [v for v in series.head(TYPE_SAMPLE_ROWS).tolist() if not _missing(v) and str(v).strip() != ""]
+        if not values: return "string"
+        if sum(parse_amount(v) is not None for v in values) >= MIN_TYPE_RATIO * len(values): return "number"
+        if sum(parse_tally_date(v) is not None for v in values) >= MIN_TYPE_RATIO * len(values): return "date"
+        return "string"
+
+    def to_table_json(self, df, title="", max_rows=None, types=None):
+        """
+        DataFrame -> {"title", "columns": [{"name", "type"}], "rows": [[...]], "total_rows", "truncated"}.
+        types: {column: type} from a report parser; other columns are inferred.
+        """
+        max_rows = max_rows or TABLE_MAX_ROWS
+        shown = df.head(max_rows)
+        columns = self._columns(shown, types)
+        converters = [self._converter(col["type"]) for col in columns]
+
+        rows = []
+        for record in shown.itertuples(index=False, name=None):
+            rows.append([conv(v) for conv, v in zip(converters, record)])
+
+        return {
+            "title": title,
+            "columns": columns,
+            "rows": rows,
+            "total_rows": int(len(df)),
+            "truncated": len(df) > len(shown),
+        }
+
+    def _columns(self, df, types=None):
+        types = types or {}
+        return [{"name": str(col), "type": types.get(col) or self._column_type(df[col])} for col in df.columns]
+
+    def _converter(self, col_type):
+        """Cell converter for a column type. Missing cells are None in every type."""
+        if col_type == "number": convert = parse_amount
+        elif col_type == "integer": convert = _int_or_none
+        elif col_type == "date": convert = _iso_date
+        else: convert = str
+        return lambda v: None if _missing(v) else convert(v)
+
+    def typed_frame(self, df, types=None):
+        """
+        Full frame with every column converted the way to_table_json converts cells
+        (floats, nullable ints, ISO dates), so it can be sorted and filtered. -> (frame, columns)
+        """
+        columns = self._columns(df, types)
+        typed = {}
+        for col, meta in zip(df.columns, columns):
+            values = [self._converter(meta["type"])(v) for v in df[col].tolist()]
+            if meta["type"] == "number": typed[meta["name"]] = pd.Series(values, dtype="float64")
+            elif meta["type"] == "integer": typed[meta["name"]] = pd.Series(values, dtype="Int64")
+            else: typed[meta["name"]] = pd.Series(values, dtype=object)
+        return pd.DataFrame(typed), columns
+
+    def open_session(self, df, title="", types=None):
+        """Registers the full table for server-side paging (GET /tables/{session_id})."""
+        frame, columns = self.typed_frame(df, types)
+        return get_table_sessions().open(frame, columns, title)
+
+    def to_html(self, table):
+        """Lightweight <table> fragment for a to_table_json() result (no styles, no scripts)."""
+        numeric = [c["type"] in ("number", "integer") for c in table["columns"]]
+        head = "".join(f"<th>{html_escape(c['name'])}</th>" for c in table["columns"])
+        body = []
+        for row in table["rows"]:
+            cells = []
+            for is_num, v in zip(numeric, row):
+                if is_num and isinstance(v, int): cells.append(f'<td class="num">{v}</td>')
+                elif is_num and v is not None: cells.append(f'<td class="num">{v:,.2f}</td>')
+                else: cells.append(f"<td>{html_escape('' if v is None else str(v))}</td>")
+            body.append(f"<tr>{''.join(cells)}</tr>")
+        caption = f"<caption>{html_escape(table['title'])}</caption>" if table.get("title") else ""
+        return f'<table class="tally-table">{caption}<thead><tr>{head}</tr></thead><tbody>{"".join(body)}</tbody></table>'
+
+    def _save_table(self, table):
+        """Writes the table JSON under a content-addressed name and returns the path."""
+        payload = json.dumps(table, ensure_ascii=False, default=str)
+        digest = hashlib.sha256(payload.encode("utf-8")).hexdigest()[:24]
+        store = get_artifact_store()
+        save_path = store.path_for("tables", f"table_{digest}.json")
+        if not store.exists(save_path):
+            tmp_name = f"{save_path}.{uuid.uuid4().hex[:8]}.tmp"
+            with open(tmp_name, "w", encoding="utf-8") as f: f.write(payload)
+            os.replace(tmp_name, save_path)
+            store.register(save_path)
+        return save_path
+
+    # --- PNG OUTPUT (opt-in fallback) ---
+    def _render_png(self, df_display, query):
+        # matplotlib is only needed for this opt-in format, so it loads here
+        import matplotlib
+        matplotlib.use('Agg') # Force headless mode
+        import matplotlib.pyplot as plt
+
+        # Plotting
+        row_height = 0.5
+        header_height = 0.8
+        fig_height = (len(df_display) * row_height) + header_height + 1
+        
+        fig, ax = plt.subplots(figsize=(12, max(fig_height, 3))) 
+        ax.axis('tight')
+        ax.axis('off')
+        
+        table = ax.table(
+            cellText=df_display.values,
+            colLabels=df_display.columns,
+            cellLoc='left',
+            loc='center',
+            colColours=['#f8f9fa']*len(df_display.columns)
+        )
+
+        table.auto_set_font_size(False)
+        table.set_fontsize(10)
+        table.scale(1.2, 1.5)
+
+        # Styling
+        for (row, col), cell in table.get_celld().items():
+            cell.set_edgecolor("#dddddd")
+            cell.set_linewidth(0.5)
+            if row == 0:
+                cell.get_text().set_color('#333333')
+                cell.get_text().set_weight('bold')
+                cell.set_facecolor('#e9ecef')
+            elif row > 0:
+                 if row % 2 == 0: cell.set_facecolor('#ffffff')
+                 else: cell.set_facecolor('#fdfdfd')
+
+        # Save
+        filename = f"table_{uuid.uuid4().hex[:8]}.png"
+        save_path = get_artifact_store().path_for("tables", filename)
+        abs_path = os.path.abspath(save_path).replace("\\", "/") 
+        
+        plt.title(f"{query}", fontsize=12, color="#444444", pad=20)
+        plt.savefig(abs_path, bbox_inches='tight', dpi=150, pad_inches=0.2)
+        plt.close()
+        get_artifact_store().register(save_path)
+        return save_path
+
+    def generate_table(self, json_path, query="Show data", fmt=None, report_name=None):
+        """
+        fmt: 'json' (default), 'html' (json + HTML fragment) or 'png' (matplotlib image).
+        report_name: the fetched Tally report, so its dedicated parser can be used.
+        """
+        fmt = fmt or TABLE_FORMAT.get()
         try:
             with open(json_path, 'r', encoding='utf-8') as f:
                 data = json.load(f)
 
-            # STRATEGY 1: Try Tally Voucher Parsing (Day Book)
-            main_list = self._parse_tally_vouchers(data)
-            
-            # STRATEGY 2: Fallback to Generic Parsing (Stock Summary, P&L)
-            if not main_list:
-                main_list = self._merge_parallel_lists(data)
-            
-            # STRATEGY 3: Deep Search
-            if not main_list or len(main_list) < 1:
-                main_list = self._find_longest_list(data)
-
-            if not main_list:
-                 # Last Resort: Treat root as single row
-                if isinstance(data, dict): main_list = [data]
-                else: return json.dumps({"status": "error", "message": "No tabular data found."})
-
-            # Flatten rows if they came from generic parser
-            if main_list and isinstance(main_list[0], dict) and "Date" not in main_list[0]:
-                rows = [self._flatten_row(item) for item in main_list]
+            parsed = parse_report(data, report_name)
+            if parsed:
+                # Known report: its parser already picked and typed the columns
+                df_display, types = pd.DataFrame(parsed.columns), parsed.types
             else:
-                rows = main_list
-
-            df = pd.DataFrame(rows)
-            if df.empty: return json.dumps({"status": "error", "message": "Dataframe is empty."})
-
-            # Filter Cols for Generic Data
-            if "Vch No" not in df.columns:
-                desired_cols = []
-                for col in df.columns:
-                    if col in self.TALLY_MAP.values(): desired_cols.append(col)
-                    elif any(x in col for x in ["Name", "Amount", "Qty", "Rate", "Total", "Particulars"]):
-                        desired_cols.append(col)
-                if desired_cols:
-                    # Sort so Name is first
-                    final_cols = sorted(list(set(desired_cols)), key=lambda x: 0 if "Name" in x or "Particular" in x else 1)
-                    df_display = df[final_cols].head(25)
-                else:
-                    df_display = df.head(25)
-            else:
-                df_display = df.head(25)
+                rows = self._build_rows_generic(data)
+                if not rows: return json.dumps({"status": "error", "message": "No tabular data found."})
+                df = pd.DataFrame(rows)
+                if df.empty: return json.dumps({"status": "error", "message": "Dataframe is empty."})
+                df_display, types = self._display_columns(df), None
 
-            # Plotting
-            row_height = 0.5
-            header_height = 0.8
-            fig_height = (len(df_display) * row_height) + header_height + 1
-            
-            fig, ax = plt.subplots(figsize=(12, max(fig_height, 3))) 
-            ax.axis('tight')
-            ax.axis('off')
-            
-            table = ax.table(
-                cellText=df_display.values,
-                colLabels=df_display.columns,
-                cellLoc='left',
-                loc='center',
-                colColours=['#f8f9fa']*len(df_display.columns)
-            )
-
-            table.auto_set_font_size(False)
-            table.set_fontsize(10)
-            table.scale(1.2, 1.5)
-
-            # Styling
-            for (row, col), cell in table.get_celld().items():
-                cell.set_edgecolor("#dddddd")
-                cell.set_linewidth(0.5)
-                if row == 0:
-                    cell.get_text().set_color('#333333')
-                    cell.get_text().set_weight('bold')
-                    cell.set_facecolor('#e9ecef')
-                elif row > 0:
-                     if row % 2 == 0: cell.set_facecolor('#ffffff')
-                     else: cell.set_facecolor('#fdfdfd')
-
-            # Save
-            filename = f"table_{uuid.uuid4().hex[:8]}.png"
-            save_path = os.path.join(PLOT_DIR, filename)
-            abs_path = os.path.abspath(save_path).replace("\\", "/") 
-            
-            plt.title(f"{query}", fontsize=12, color="#444444", pad=20)
-            plt.savefig(abs_path, bbox_inches='tight', dpi=150, pad_inches=0.2)
-            plt.close()
+            return self.generate_table_from_frame(df_display, query, fmt, types)
+
+        except Exception as e:
+            return json.dumps({"status": "error", "message": str(e)})
+
+    def generate_table_from_frame(self, df_display, query="Show data", fmt=None, types=None, extra=None):
+        """Renders an already-built frame (e.g. a multi-company comparison). extra: keys added to the table JSON."""
+        fmt = fmt or TABLE_FORMAT.get()
+        try:
+            if fmt == "png":
+                df_display = df_display.head(25)
+                save_path = self._render_png(df_display, query)
+                return json.dumps({
+                    "status": "success",
+                    "images": [save_path], 
+                    "rationale": f"Generated table with {len(df_display)} rows."
+                })
 
+            table = self.to_table_json(df_display, title=query, types=types)
+            if extra: table.update(extra)
+            # Full report stays server-side; the frontend pages/sorts/filters it without re-asking the agent
+            table["session_id"] = self.open_session(df_display, title=query, types=types)
+            if fmt == "html": table["html"] = self.to_html(table)
+            save_path = self._save_table(table)
             return json.dumps({
                 "status": "success",
-                "images": [save_path], 
-                "rationale": f"Generated table with {len(df_display)} rows."
+                "images": [],
+                "tables": [save_path],
+                "rationale": f"Generated table with {len(table['rows'])} of {table['total_rows']} rows."
             })
 
         except Exception as e:
-            return json.dumps({"status": "error", "message": str(e)})
\ No newline at end of file
+            return json.dumps({"status": "error", "message": str(e)})
@@ -0,0 +1,173 @@
+# tools/table_sessions.py
+"""
+Server-side table sessions.
+
+generate_table only sends the first rows of a report with the answer. It also
+opens a session here holding the full, typed report frame, so the frontend can
+page, sort, filter and search it (GET /tables/{session_id}) without another
+Tally fetch or LLM call. Sessions expire after an idle TTL; the oldest are
+dropped first when there are too many.
+"""
+import math
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from typing import TYPE_CHECKING, Dict, List, Optional
+
+if TYPE_CHECKING:
+    import pandas as pd  # frames come from TableGenerator; the API imports this module at startup
+
+TABLE_SESSION_TTL = float(os.getenv("TABLE_SESSION_TTL", "1800"))  # idle seconds
+TABLE_SESSION_MAX = int(os.getenv("TABLE_SESSION_MAX", "50"))
+TABLE_PAGE_SIZE = 50
+TABLE_MAX_PAGE_SIZE = 1000
+
+FILTER_OPS = ("eq", "ne", "gt", "gte", "lt", "lte", "contains")
+
+
+class TableSession:
+    def __init__(self, frame: "pd.DataFrame", columns: List[dict], title: str = ""):
+        self.frame = frame.reset_index(drop=True)
+        self.columns = columns
+        self.types = {c["name"]: c["type"] for c in columns}
+        self.title = title
+        self.last_access = time.monotonic()
+        self._haystack = None
+        self._last_view = (None, None)  # (sort, filters, search) key -> row positions
+
+    def _column(self, name: str) -> "pd.Series":
+        if name not in self.types:
+            raise ValueError(f"Unknown column '{name}'. Columns: {list(self.types)}")
+        return self.frame[name]
+
+    def _search_text(self) -> "pd.Series":
+        """All columns joined and lower-cased once, for text search."""
+        if self._haystack is None:
+            parts = [self.frame[c].astype("string").fillna("") for c in self.frame.columns]
+            joined = parts[0].str.cat(parts[1:], sep="\x1f") if len(parts) > 1 else parts[0]
+            self._haystack = joined.str.lower()
+        return self._haystack
+
+    def _mask(self, name: str, op: str, value: str) -> "pd.Series":
+        column = self._column(name)
+        if op not in FILTER_OPS:
+            raise ValueError(f"Unsupported filter op '{op}'. Use one of {FILTER_OPS}.")
+        if op == "contains":
+            return column.astype("string").str.contains(value, case=False, regex=False, na=False)
+
+        if self.types[name] in ("number", "integer"):
+            try: target = float(value.replace(",", ""))
+            except ValueError: raise ValueError(f"Filter value for '{name}' must be a number")
+        else:
+            target = value  # dates are ISO strings, so they compare correctly as text
+        if op in ("eq", "ne") and self.types[name] == "string":
+            same = column.astype("string").str.lower().eq(value.lower()).fillna(False).astype(bool)
+            return same if op == "eq" else ~same
+        compare = {"eq": column.eq, "ne": column.ne, "gt": column.gt,
+                   "gte": column.ge, "lt": column.lt, "lte": column.le}[op]
+        return compare(target).fillna(False).astype(bool)
+
+    def view(self, sort: Optional[str] = None, descending: bool = False,
+             filters: Optional[List[tuple]] = None, search: Optional[str] = None):
+        """Row positions after filter + search + sort. The last view is kept, so paging through it is O(page)."""
+        key = (sort, descending, tuple(filters or ()), (search or "").strip().lower())
+        last_key, last_positions = self._last_view
+        if key == last_key: return last_positions
+
+        masks = [self._mask(name, op, value) for name, op, value in filters or ()]
+        if key[3]:
+            masks.append(self._search_text().str.contains(key[3], regex=False))
+
+        positions = self.frame.index
+        if masks:
+            mask = masks[0]
+            for m in masks[1:]: mask = mask & m
+            positions = positions[mask.to_numpy()]
+        if sort:
+            ordered = self._column(sort).iloc[positions].sort_values(ascending=not descending,
+                                                                      kind="stable", na_position="last")
+            positions = ordered.index
+        positions = positions.to_numpy()
+        self._last_view = (key, positions)  # one assignment, so concurrent pages never see a torn pair
+        return positions
+
+    def page(self, page: int = 1, page_size: int = TABLE_PAGE_SIZE, **view_args) -> Dict:
+        page_size = max(1, min(int(page_size), TABLE_MAX_PAGE_SIZE))
+        positions = self.view(**view_args)
+        total = len(positions)
+        pages = max(1, math.ceil(total / page_size))
+        page = max(1, min(int(page), pages))
+
+        chunk = self.frame.iloc[positions[(page - 1) * page_size: page * page_size]]
+        rows = chunk.astype(object).where(chunk.notna(), None).values.tolist()
+        return {
+            "title": self.title,
+            "columns": self.columns,
+            "rows": rows,
+            "page": page,
+            "page_size": page_size,
+            "total_pages": pages,
+            "total_rows": total,
+            "source_rows": int(len(self.frame)),
+        }
+
+
+class TableSessionStore:
+    def __init__(self, ttl: float = TABLE_SESSION_TTL, max_sessions: int = TABLE_SESSION_MAX):
+        self.ttl = ttl
+        self.max_sessions = max(1, max_sessions)
+        self._sessions: "OrderedDict[str, TableSession]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _expire(self, now: float):
+        for sid in [sid for sid, s in self._sessions.items() if now - s.last_access > self.ttl]:
+            del self._sessions[sid]
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+
+    def open(self, frame: "pd.DataFrame", columns: List[dict], title: str = "") -> str:
+        session_id = uuid.uuid4().hex
+        with self._lock:
+            self._sessions[session_id] = TableSession(frame, columns, title)
+            self._expire(time.monotonic())
+        return session_id
+
+    def get(self, session_id: str) -> TableSession:
+        """Raises KeyError for unknown or expired sessions."""
+        with self._lock:
+            now = time.monotonic()
+            self._expire(now)
+            session = self._sessions[session_id]
+            session.last_access = now
+            self._sessions.move_to_end(session_id)
+            return session
+
+    def close(self, session_id: str) -> bool:
+        with self._lock:
+            return self._sessions.pop(session_id, None) is not None
+
+
+_STORE: Optional[TableSessionStore] = None
+_STORE_LOCK = threading.Lock()
+
+
+def get_table_sessions() -> TableSessionStore:
+    """Process-wide store shared by the table tool and the API."""
+    global _STORE
+    with _STORE_LOCK:
+        if _STORE is None:
+            _STORE = TableSessionStore()
+        return _STORE
+
+
+def parse_filters(specs: Optional[List[str]]) -> List[tuple]:
+    """['Amount:gt:1000', 'Particulars:contains:steel'] -> [(column, op, value)]. Values may contain ':'."""
+    out = []
+    for spec in specs or ():
+        column, op, value = spec.split(":", 2) if spec.count(":") >= 2 else (None, None, None)
+        if column is None or op not in FILTER_OPS:
+            raise ValueError(f"Bad filter '{spec}'. Use column:op:value with op in {FILTER_OPS}.")
+        out.append((column, op, value))
+    return out
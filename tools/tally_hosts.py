@@ -0,0 +1,301 @@
+# tools/tally_hosts.py
+"""
+Registry of Tally servers (one per branch) and company -> host routing.
+
+Hosts come from TALLY_HOSTS ("branch1=http://10.0.0.5:9000,branch2=http://10.0.1.5:9000";
+names are optional) and default to TALLY_HTTP_HOST. Each host gets its own
+HTTP connection pool, concurrency cap and health status, so a slow or dead
+branch server only delays requests for its own companies.
+
+Companies are mapped to hosts by asking every host for its company list
+(refreshed every TALLY_DISCOVERY_TTL seconds, or when an unknown company is
+requested). One thread refreshes at a time, without holding the registry lock
+over the network; the others wait for its result at most as long as a
+discovery can take, and its requests give up on a busy host after
+TALLY_DISCOVERY_TIMEOUT instead of queueing behind exports.
+TALLY_COMPANY_HOSTS ("Company A=branch1,Company B=branch2") pins companies
+explicitly.
+
+Health: after TALLY_HOST_MAX_FAILURES consecutive connection errors/timeouts
+a host is marked down (circuit open) for TALLY_HOST_COOLDOWN seconds; requests
+for its companies fail fast meanwhile. After the cooldown the circuit is
+half-open: a single request probes the host while the others keep failing
+fast. A successful probe closes the circuit; a failed one re-opens it for
+another cooldown.
+"""
+import os
+import threading
+import time
+import xml.etree.ElementTree as ET
+from concurrent.futures import ThreadPoolExecutor
+from typing import Dict, List, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+from dotenv import load_dotenv
+
+load_dotenv()
+
+TALLY_URL = os.getenv("TALLY_HTTP_HOST", "http://localhost:9000")
+TALLY_HOSTS = os.getenv("TALLY_HOSTS", "")
+TALLY_COMPANY_HOSTS = os.getenv("TALLY_COMPANY_HOSTS", "")
+
+# Tally serves XML requests one at a time per instance; more parallel exports just queue up
+# inside Tally (and can time out), so every export waits for a slot on its host first
+TALLY_MAX_CONCURRENCY = int(os.getenv("TALLY_MAX_CONCURRENCY", "2"))  # per host
+TALLY_QUEUE_TIMEOUT = float(os.getenv("TALLY_QUEUE_TIMEOUT", "120"))  # max wait for a slot
+TALLY_DISCOVERY_TTL = float(os.getenv("TALLY_DISCOVERY_TTL", "300"))
+TALLY_DISCOVERY_TIMEOUT = float(os.getenv("TALLY_DISCOVERY_TIMEOUT", "10"))
+TALLY_REDISCOVER_INTERVAL = 30.0  # min seconds between refreshes triggered by unknown companies
+TALLY_HOST_MAX_FAILURES = int(os.getenv("TALLY_HOST_MAX_FAILURES", "3"))
+TALLY_HOST_COOLDOWN = float(os.getenv("TALLY_HOST_COOLDOWN", "30"))
+
+COMPANY_LIST_REQUEST = """<ENVELOPE>
+    <HEADER>
+        <VERSION>1</VERSION>
+        <TALLYREQUEST>Export</TALLYREQUEST>
+        <TYPE>Collection</TYPE>
+        <ID>List of Companies</ID>
+    </HEADER>
+    <BODY>
+        <DESC>
+            <STATICVARIABLES>
+                <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+            </STATICVARIABLES>
+            <TDL>
+                <TDLMESSAGE>
+                    <COLLECTION NAME="List of Companies" ISMODIFY="No">
+                        <TYPE>Company</TYPE>
+                        <FETCH>NAME</FETCH>
+                    </COLLECTION>
+                </TDLMESSAGE>
+            </TDL>
+        </DESC>
+    </BODY>
+</ENVELOPE>"""
+
+
+class TallyHostUnavailable(Exception):
+    """The company's host is marked down, or no request slot freed up in time."""
+
+
+def _parse_pairs(spec: str) -> List[tuple]:
+    """'a=x, b=y' -> [('a', 'x'), ('b', 'y')]; a bare 'x' becomes (None, 'x')."""
+    pairs = []
+    for part in spec.split(","):
+        part = part.strip()
+        if not part: continue
+        name, sep, value = part.partition("=")
+        pairs.append((name.strip(), value.strip()) if sep else (None, part))
+    return pairs
+
+
+def parse_company_names(xml_text: str) -> List[str]:
+    """Company names from a 'List of Companies' export (NAME attribute or <NAME> child)."""
+    try:
+        from tools.get_report_tool import clean_tally_xml
+    except ImportError:
+        from get_report_tool import clean_tally_xml
+    root = ET.fromstring(clean_tally_xml(xml_text) or "<ENVELOPE/>")
+    names = []
+    for company in root.iter("COMPANY"):
+        name = company.get("NAME") or (company.findtext("NAME") or "").strip()
+        if name and name not in names: names.append(name)
+    return names
+
+
+class TallyHost:
+    def __init__(self, name: str, url: str, max_concurrency: int = TALLY_MAX_CONCURRENCY):
+        self.name = name
+        self.url = url
+        self.max_concurrency = max(1, max_concurrency)
+        self.slots = threading.BoundedSemaphore(self.max_concurrency)
+        self.session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=self.max_concurrency)
+        self.session.mount("http://", adapter)
+        self.session.mount("https://", adapter)
+
+        self.companies: List[str] = []
+        self.failures = 0  # consecutive
+        self.down_until = 0.0  # circuit open until then; 0.0 = closed
+        self.probing = False  # half-open: one request is checking the host
+        self.last_error: Optional[str] = None
+        self.last_latency: Optional[float] = None
+        self.in_flight = 0
+        self._lock = threading.Lock()
+
+    @property
+    def healthy(self) -> bool:
+        """Closed, or half-open with no probe running yet."""
+        return time.monotonic() >= self.down_until and not self.probing
+
+    @property
+    def state(self) -> str:
+        if not self.down_until: return "closed"
+        return "open" if time.monotonic() < self.down_until else "half-open"
+
+    def _admit(self) -> bool:
+        """Raises while the circuit is open or another request is probing. -> True if this request is the probe."""
+        with self._lock:
+            if not self.down_until: return False
+            if time.monotonic() < self.down_until or self.probing:
+                raise TallyHostUnavailable(f"Tally host '{self.name}' is down ({self.last_error}); retrying after cooldown")
+            self.probing = True
+            return True
+
+    def post(self, body: str, timeout: float, queue_timeout: float = TALLY_QUEUE_TIMEOUT) -> requests.Response:
+        probe = self._admit()
+        try:
+            if not self.slots.acquire(timeout=queue_timeout):
+                raise TallyHostUnavailable(f"Tally host '{self.name}' is busy; no request slot within {queue_timeout:.0f}s")
+            with self._lock: self.in_flight += 1
+            t0 = time.monotonic()
+            try:
+                response = self.session.post(self.url, data=body, timeout=timeout)
+            except requests.RequestException as e:
+                self._record_failure(e, probe)
+                raise
+            finally:
+                with self._lock: self.in_flight -= 1
+                self.slots.release()
+            self._record_success(time.monotonic() - t0)
+            return response
+        finally:
+            if probe:
+                with self._lock: self.probing = False  # probe ended without an answer: the next request probes
+
+    def _record_success(self, latency: float):
+        with self._lock:
+            if self.down_until: print(f"✅ Tally host '{self.name}' is back")
+            self.failures, self.down_until, self.last_latency, self.probing = 0, 0.0, latency, False
+
+    def _record_failure(self, error: Exception, probe: bool = False):
+        with self._lock:
+            self.failures += 1
+            self.last_error = f"{type(error).__name__}: {error}"
+            if probe or self.failures >= TALLY_HOST_MAX_FAILURES:
+                # Open (or re-open) the circuit; after the cooldown one request probes the host
+                self.down_until = time.monotonic() + TALLY_HOST_COOLDOWN
+                self.probing = False
+                print(f"❌ Tally host '{self.name}' marked down for {TALLY_HOST_COOLDOWN:.0f}s: {self.last_error}")
+
+    def status(self) -> Dict:
+        return {
+            "name": self.name,
+            "url": self.url,
+            "healthy": self.healthy,
+            "circuit": self.state,
+            "consecutive_failures": self.failures,
+            "down_for_seconds": max(0.0, round(self.down_until - time.monotonic(), 1)),
+            "last_error": self.last_error,
+            "last_latency_ms": round(self.last_latency * 1000, 1) if self.last_latency is not None else None,
+            "in_flight": self.in_flight,
+            "max_concurrency": self.max_concurrency,
+            "companies": list(self.companies),
+        }
+
+
+class TallyHostRegistry:
+    def __init__(self, hosts_spec: str = TALLY_HOSTS, pins_spec: str = TALLY_COMPANY_HOSTS,
+                 default_url: str = TALLY_URL):
+        self.hosts: Dict[str, TallyHost] = {}
+        for i, (name, url) in enumerate(_parse_pairs(hosts_spec) or [(None, default_url)]):
+            name = name or (f"host{i + 1}" if hosts_spec else "default")
+            self.hosts[name] = TallyHost(name, url)
+        self.default = next(iter(self.hosts.values()))
+
+        self.pinned = {company: host for company, host in _parse_pairs(pins_spec) if company and host in self.hosts}
+        self._routes: Dict[str, str] = {}
+        self._discovered_at = 0.0
+        self._discover_lock = threading.Lock()  # guards the fields below, never held over the network
+        self._discovery: Optional[threading.Event] = None  # set when the running refresh finishes
+
+    @property
+    def capacity(self) -> int:
+        """Total request slots across hosts (how many exports may run at once)."""
+        return sum(h.max_concurrency for h in self.hosts.values())
+
+    # --- DISCOVERY ---
+    def _host_companies(self, host: TallyHost) -> List[str]:
+        from tools.get_report_tool import decode_tally_bytes
+        # A host busy with exports answers later; don't wait TALLY_QUEUE_TIMEOUT for a slot
+        response = host.post(COMPANY_LIST_REQUEST, timeout=TALLY_DISCOVERY_TIMEOUT, queue_timeout=TALLY_DISCOVERY_TIMEOUT)
+        return parse_company_names(decode_tally_bytes(response.content))
+
+    def discover(self, force: bool = False) -> Dict[str, str]:
+        """Asks every healthy host for its companies (in parallel). Returns {company: host name}."""
+        with self._discover_lock:
+            if not force and time.monotonic() - self._discovered_at < TALLY_DISCOVERY_TTL and self._routes:
+                return dict(self._routes)
+            running = self._discovery
+            if running is None: self._discovery = done = threading.Event()
+        if running is not None:
+            # Another thread is refreshing: share its result (slot wait + request at most)
+            running.wait(2 * TALLY_DISCOVERY_TIMEOUT)
+            return dict(self._routes)
+
+        try:
+            hosts = [h for h in self.hosts.values() if h.healthy]
+            with ThreadPoolExecutor(max_workers=max(1, len(hosts))) as pool:
+                futures = {h.name: pool.submit(self._host_companies, h) for h in hosts}
+
+            routes, answered = {}, set()
+            for host in hosts:
+                try:
+                    host.companies = futures[host.name].result()
+                except Exception as e:
+                    print(f"⚠️ Company discovery failed on Tally host '{host.name}': {e}")
+                    continue
+                answered.add(host.name)
+                for company in host.companies:
+                    routes.setdefault(company, host.name)  # same name on two hosts: first host wins
+            with self._discover_lock:
+                # Keep the last known routes of hosts that didn't answer this time
+                for company, name in self._routes.items():
+                    if name not in answered: routes.setdefault(company, name)
+                self._routes = routes
+                self._discovered_at = time.monotonic()
+            return dict(routes)
+        finally:
+            with self._discover_lock: self._discovery = None
+            done.set()
+
+    def companies(self) -> List[str]:
+        """Every company open on any host."""
+        return sorted(set(self.discover()) | set(self.pinned))
+
+    # --- ROUTING ---
+    def host_for(self, company: Optional[str]) -> TallyHost:
+        if len(self.hosts) == 1 or not company: return self.default
+        if company in self.pinned: return self.hosts[self.pinned[company]]
+
+        name = self._routes.get(company)
+        if name is None:
+            # Unknown (or newly opened) company: refresh the mapping, at most every TALLY_REDISCOVER_INTERVAL
+            name = self.discover(force=time.monotonic() - self._discovered_at > TALLY_REDISCOVER_INTERVAL).get(company)
+        return self.hosts.get(name) or self.default
+
+    def post(self, company: Optional[str], body: str, timeout: float = 45) -> requests.Response:
+        """Sends one XML request to the company's host (its pool, its cap, its circuit breaker)."""
+        return self.host_for(company).post(body, timeout)
+
+    def status(self) -> Dict:
+        return {
+            "hosts": [h.status() for h in self.hosts.values()],
+            "routes": dict(self._routes),
+            "pinned": dict(self.pinned),
+            "discovered_seconds_ago": round(time.monotonic() - self._discovered_at, 1) if self._discovered_at else None,
+        }
+
+
+_REGISTRY: Optional[TallyHostRegistry] = None
+_REGISTRY_LOCK = threading.Lock()
+
+
+def get_host_registry() -> TallyHostRegistry:
+    """Process-wide registry (one connection pool per host)."""
+    global _REGISTRY
+    with _REGISTRY_LOCK:
+        if _REGISTRY is None:
+            _REGISTRY = TallyHostRegistry()
+        return _REGISTRY
@@ -0,0 +1,90 @@
+# tools/tally_values.py
+"""
+Parsers for the value formats Tally puts in its XML exports.
+
+Amounts arrive as "1,234.00", "-1234.00", "1,234.00 Dr", "(-)1,234.00" or
+"5,000.00 Cr". Dates arrive as "20240401" (vouchers), "1-Apr-24" (display
+reports) or "01-04-2024" (already formatted by TableGenerator).
+"""
+import re
+from datetime import date, datetime
+from decimal import Decimal, InvalidOperation
+from typing import Optional
+
+_PLAIN_NUMBER_RE = re.compile(r"-?[0-9]+(?:\.[0-9]+)?")  # what XML amount fields usually hold
+_AMOUNT_RE = re.compile(r"^(?:[0-9][0-9,]*(?:\.[0-9]+)?|\.[0-9]+)$")
+_DATE_FORMATS = ("%Y%m%d", "%d-%b-%y", "%d-%b-%Y", "%d-%m-%Y", "%Y-%m-%d", "%d/%m/%Y")
+
+
+def _split_amount(value):
+    """Returns (sign, digits) for a Tally amount, or None. digits still has its commas."""
+    if value is None or isinstance(value, bool): return None
+    if isinstance(value, dict): value = value.get("_value")
+    if not isinstance(value, str): return None
+
+    text = value.strip()
+    if not text: return None
+
+    sign = 1
+    suffix = text[-2:].lower()
+    if suffix in ("dr", "cr"):
+        if suffix == "cr": sign = -1
+        text = text[:-2].strip()
+
+    text = text.replace("(-)", "-").replace(" ", "")
+    if text.startswith("-"):
+        sign = -sign
+        text = text[1:]
+
+    if not _AMOUNT_RE.match(text): return None
+    return sign, text
+
+
+def parse_amount(value) -> Optional[float]:
+    """
+    Returns a signed float for a Tally amount, or None if it isn't one.
+    'Dr' is positive and 'Cr' is negative; an explicit '-' or '(-)' flips the sign.
+    Quantities with units ("10 kg") and rates ("5.00/kg") are not amounts.
+    """
+    if isinstance(value, (int, float, Decimal)) and not isinstance(value, bool): return float(value)
+    if isinstance(value, str) and _PLAIN_NUMBER_RE.fullmatch(value): return float(value)
+    split = _split_amount(value)
+    if split is None: return None
+    sign, text = split
+    try:
+        return sign * float(text.replace(",", ""))
+    except ValueError:
+        return None
+
+
+def parse_decimal(value) -> Optional[Decimal]:
+    """Same rules as parse_amount, but exact (no float rounding on large ledgers)."""
+    if isinstance(value, Decimal): return value
+    if isinstance(value, (int, float)) and not isinstance(value, bool): return Decimal(str(value))
+    if isinstance(value, str) and _PLAIN_NUMBER_RE.fullmatch(value): return Decimal(value)
+    split = _split_amount(value)
+    if split is None: return None
+    sign, text = split
+    try:
+        amount = Decimal(text.replace(",", ""))
+    except InvalidOperation:
+        return None
+    return -amount if sign < 0 else amount
+
+
+def parse_tally_date(value) -> Optional[date]:
+    """Returns a date for any of the Tally date formats, or None."""
+    if isinstance(value, datetime): return value.date()
+    if isinstance(value, date): return value
+    if isinstance(value, dict): value = value.get("_value")
+    if not isinstance(value, str): return None
+
+    text = value.strip()
+    if len(text) == 8 and text.isdigit():
+        # Voucher dates (YYYYMMDD): by far the most common, and strptime is slow on 1M rows
+        try: return date(int(text[:4]), int(text[4:6]), int(text[6:]))
+        except ValueError: return None
+    for fmt in _DATE_FORMATS:
+        try: return datetime.strptime(text, fmt).date()
+        except ValueError: continue
+    return None
@@ -0,0 +1,334 @@
+# tools/tdl_requests.py
+"""
+Field pushdown: ask Tally for only the objects and fields a question needs.
+
+A display-report export (`$$SysName:XML` of Trial Balance, Day Book, ...)
+carries every formatting column of every row. For questions that name a
+ledger group or a voucher type plus a period, we instead send an inline TDL
+collection with a FETCH list, CHILDOF and FILTER formulas:
+
+    "closing balance of sundry debtors"   -> Ledger:  Name, Parent, ClosingBalance
+                                             under Sundry Debtors
+    "total sales in April 2024"           -> Voucher: Date, type, number, party,
+                                             ledger/inventory lines, of Sales type
+                                             dated 1-30 Apr 2024
+
+Ledgers and stock items the question names (resolved by entity_index) narrow
+this further. "HDFC current account receipts in May" fetches only the
+vouchers with an HDFC Current A/c line. "PVC Resin 50kg" on Stock Summary
+fetches that one item, or its vouchers when a period is given.
+
+Tally evaluates the filters, so only matching objects are serialised.
+Voucher replies come back in the Day Book shape (TALLYMESSAGE/VOUCHER).
+Ledger and stock item replies come back as LEDGER / STOCKITEM lists, which
+have their own parsers ("Ledger Balances", "Stock Item Balances"). The table,
+chart, planner and rollup code read all of them without changes.
+
+Questions that don't fit fall back to the full export, and so do replies
+Tally refuses. TDL_PUSHDOWN=0 turns pushdown off.
+"""
+import hashlib
+import json
+import os
+import re
+from datetime import date
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+try:
+    from tools.entity_index import normalize_name
+    from tools.get_report_tool import escape_xml, is_report_payload, post_xml
+    from tools.report_cache import cache_key, get_report_cache
+except ImportError:
+    from entity_index import normalize_name
+    from get_report_tool import escape_xml, is_report_payload, post_xml
+    from report_cache import cache_key, get_report_cache
+
+try:
+    from report_config import TALLY_XML_MAP
+except ImportError:
+    import sys
+    sys.path.append(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    from report_config import TALLY_XML_MAP
+
+TDL_PUSHDOWN = os.getenv("TDL_PUSHDOWN", "1") != "0"
+COLLECTION_ID = "TallyAI Pushdown"
+
+LEDGER_FIELDS = ("Name", "Parent", "ClosingBalance")
+# What the Day Book parser, voucher_batch and the rollups read (see report_parsers, rollup_store)
+VOUCHER_FIELDS = ("Date", "GUID", "AlterID", "VoucherTypeName", "VoucherNumber", "PartyLedgerName", "IsCancelled",
+                  "AllLedgerEntries.LedgerName", "AllLedgerEntries.IsDeemedPositive", "AllLedgerEntries.Amount",
+                  "AllInventoryEntries.StockItemName", "AllInventoryEntries.Amount")
+
+STOCK_ITEM_FIELDS = ("Name", "Parent", "ClosingBalance", "ClosingRate", "ClosingValue")
+
+LEDGER_REPORT = "Ledger Balances"  # parsed by report_parsers.parse_ledger_balances
+STOCK_ITEM_REPORT = "Stock Item Balances"  # report_parsers.parse_stock_item_balances
+LEDGER_SOURCE_REPORTS = ("Trial Balance", "Balance Sheet", "Cash/Bank Book", "Group Summary")
+STOCK_SOURCE_REPORTS = ("Stock Summary",)
+VOUCHER_SOURCE_REPORTS = ("Day Book", "Sales Register")
+
+# Phrase in the question -> Tally's predefined group (longer phrases are matched first)
+GROUP_PHRASES = (
+    ("sundry debtors", "Sundry Debtors"), ("debtors", "Sundry Debtors"), ("customers", "Sundry Debtors"),
+    ("sundry creditors", "Sundry Creditors"), ("creditors", "Sundry Creditors"), ("suppliers", "Sundry Creditors"),
+    ("bank accounts", "Bank Accounts"), ("bank balance", "Bank Accounts"), ("banks", "Bank Accounts"),
+    ("bank od", "Bank OD A/c"), ("overdraft", "Bank OD A/c"),
+    ("cash-in-hand", "Cash-in-Hand"), ("cash in hand", "Cash-in-Hand"),
+    ("duties & taxes", "Duties & Taxes"), ("duties and taxes", "Duties & Taxes"), ("gst", "Duties & Taxes"),
+    ("tds", "Duties & Taxes"), ("taxes", "Duties & Taxes"),
+    ("capital account", "Capital Account"), ("fixed assets", "Fixed Assets"), ("investments", "Investments"),
+    ("secured loans", "Secured Loans"), ("unsecured loans", "Unsecured Loans"), ("loans", "Loans (Liability)"),
+    ("provisions", "Provisions"), ("deposits", "Deposits (Asset)"),
+    ("loans & advances", "Loans & Advances (Asset)"), ("loans and advances", "Loans & Advances (Asset)"),
+    ("current liabilities", "Current Liabilities"),  # not Current Assets: its total includes closing stock
+    ("sales accounts", "Sales Accounts"), ("purchase accounts", "Purchase Accounts"),
+    ("direct expenses", "Direct Expenses"), ("indirect expenses", "Indirect Expenses"),
+    ("direct incomes", "Direct Incomes"), ("indirect incomes", "Indirect Incomes"),
+)
+CASH_BANK_GROUPS = ("Cash-in-Hand", "Bank Accounts")
+# Sections with no group above, and whole-statement questions: the answer needs every ledger
+_UNMAPPED_SECTION_RE = re.compile(
+    r"\b(assets?|liabilit(?:y|ies)|net worth|equity|capital|reserves?|surplus|profit|loss|incomes?|expenses?"
+    r"|stock|inventory|p ?& ?l|financial position|statement"
+    r"|everything|all ledgers|all groups|whole|entire)\b")
+
+# Phrase -> TDL voucher-type test (also true for user-defined types derived from it, e.g. "Sales GST")
+VOUCHER_TYPE_PHRASES = (
+    ("credit note", "$$IsCreditNote:$VoucherTypeName"), ("debit note", "$$IsDebitNote:$VoucherTypeName"),
+    ("sales", "$$IsSales:$VoucherTypeName"), ("sale", "$$IsSales:$VoucherTypeName"),
+    ("purchases", "$$IsPurchase:$VoucherTypeName"), ("purchase", "$$IsPurchase:$VoucherTypeName"),
+    ("receipts", "$$IsReceipt:$VoucherTypeName"), ("receipt", "$$IsReceipt:$VoucherTypeName"),
+    ("payments", "$$IsPayment:$VoucherTypeName"), ("payment", "$$IsPayment:$VoucherTypeName"),
+    ("journals", "$$IsJournal:$VoucherTypeName"), ("journal", "$$IsJournal:$VoucherTypeName"),
+    ("contra", "$$IsContra:$VoucherTypeName"),
+)
+_ORDER_RE = re.compile(r"\b(sales|purchase) orders?\b")  # orders are their own voucher class
+
+
+def _tdl_string(value: str) -> str:
+    return '"' + str(value).replace('"', "'") + '"'
+
+
+def _yyyymmdd(iso_day: str) -> str:
+    return iso_day.replace("-", "")
+
+
+class CollectionRequest:
+    """One inline-TDL collection export: object type, FETCH list, CHILDOF and FILTER formulas."""
+
+    def __init__(self, object_type: str, fields: Sequence[str], report_name: str, child_of: Optional[str] = None,
+                 filters: Sequence[str] = (), from_date: str = "", to_date: str = "", description: str = "",
+                 helpers: Optional[Dict[str, str]] = None):
+        self.object_type = object_type
+        self.fields = tuple(fields)
+        self.report_name = report_name  # what the reply parses as
+        self.child_of = child_of
+        self.filters = tuple(filters)
+        self.from_date = from_date  # YYYYMMDD, as SVFROMDATE / SVTODATE
+        self.to_date = to_date
+        self.description = description
+        self.helpers = dict(helpers or {})  # named formulas the filters refer to ($$FilterCount:...:<name>)
+
+    def signature(self) -> str:
+        """Stable id of everything but the period (cache key, file name)."""
+        text = "|".join([self.object_type, ",".join(self.fields), self.child_of or "", *self.filters,
+                         *(f"{k}={v}" for k, v in sorted(self.helpers.items()))])
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()[:12]
+
+    def to_xml(self, company_name: str) -> str:
+        period = ""
+        if self.from_date: period += f"\n                        <SVFROMDATE>{escape_xml(self.from_date)}</SVFROMDATE>"
+        if self.to_date: period += f"\n                        <SVTODATE>{escape_xml(self.to_date)}</SVTODATE>"
+
+        child_of = ""
+        if self.child_of:
+            child_of = f"\n                                <CHILDOF>{escape_xml(self.child_of)}</CHILDOF><BELONGSTO>Yes</BELONGSTO>"
+        names = [f"TallyAIFilter{i}" for i in range(1, len(self.filters) + 1)]
+        filter_tag = f"\n                                <FILTER>{','.join(names)}</FILTER>" if names else ""
+        formulas = "".join(f'\n                            <SYSTEM TYPE="Formulae" NAME="{name}">{escape_xml(formula)}</SYSTEM>'
+                           for name, formula in [*zip(names, self.filters), *self.helpers.items()])
+
+        return f"""<ENVELOPE>
+            <HEADER>
+                <VERSION>1</VERSION>
+                <TALLYREQUEST>Export</TALLYREQUEST>
+                <TYPE>Collection</TYPE>
+                <ID>{COLLECTION_ID}</ID>
+            </HEADER>
+            <BODY>
+                <DESC>
+                    <STATICVARIABLES>
+                        <SVEXPORTFORMAT>$$SysName:XML</SVEXPORTFORMAT>
+                        <SVCurrentCompany>{escape_xml(company_name)}</SVCurrentCompany>{period}
+                    </STATICVARIABLES>
+                    <TDL>
+                        <TDLMESSAGE>
+                            <COLLECTION NAME="{COLLECTION_ID}" ISMODIFY="No">
+                                <TYPE>{self.object_type}</TYPE>{child_of}
+                                <FETCH>{escape_xml(", ".join(self.fields))}</FETCH>{filter_tag}
+                            </COLLECTION>{formulas}
+                        </TDLMESSAGE>
+                    </TDL>
+                </DESC>
+            </BODY>
+        </ENVELOPE>"""
+
+    # --- REPLY ---
+    def to_report(self, reply: Dict) -> Dict:
+        """ENVELOPE/BODY/DATA/COLLECTION/<OBJECT> -> the shape the report parsers read."""
+        collection = reply
+        for key in ("BODY", "DATA", "COLLECTION"):
+            if isinstance(collection, dict) and key in collection: collection = collection[key]
+        objects = collection.get(self.object_type.upper(), []) if isinstance(collection, dict) else []
+        if isinstance(objects, dict): objects = [objects]
+        objects = [_plain(o) for o in objects if isinstance(o, dict)]
+
+        if self.object_type == "Voucher":
+            return {"REQUESTDATA": {"TALLYMESSAGE": [{"VOUCHER": v} for v in objects]}}
+        return {self.object_type.upper(): objects}
+
+
+def _plain(node):
+    """Drops collection-export noise: TYPE="Amount"-style attributes and empty sub-collection tags."""
+    if isinstance(node, list): return [_plain(n) for n in node if n not in ({}, "")]
+    if not isinstance(node, dict): return node
+    if set(node) <= {"TYPE", "_value"}: return node.get("_value", "")
+    return {k: _plain(v) for k, v in node.items() if k == "NAME" or v not in ({}, "", [])}
+
+
+# --- PLANNING ---
+def _match_phrases(q: str, phrases) -> List[str]:
+    """Values whose phrase occurs in q; a matched phrase is blanked out ('loans & advances' is not also 'loans')."""
+    return _split_phrases(q, phrases)[0]
+
+
+def _split_phrases(q: str, phrases) -> Tuple[List[str], str]:
+    """(_match_phrases values, q with the matched phrases blanked out)."""
+    found = []
+    for phrase, value in sorted(phrases, key=lambda p: len(p[0]), reverse=True):
+        pattern = r"(?<![a-z0-9])" + re.escape(phrase) + r"(?![a-z0-9])"
+        if re.search(pattern, q):
+            q = re.sub(pattern, " ", q)
+            if value not in found: found.append(value)
+    return found, q
+
+
+def _period(query: str, today: Optional[date]) -> Optional[List[str]]:
+    """[start, end] ISO dates the question names (same rules as the query planner), or None."""
+    # pandas; only needed once a question is planned
+    try: from tools.query_planner import QueryEngine
+    except ImportError: from query_planner import QueryEngine
+    q = " ".join(query.lower().split())
+    return QueryEngine(today)._date_range(q, {"dates": None})
+
+
+def _names_formula(method: str, names: Sequence[str]) -> str:
+    return " OR ".join(f"{method} = {_tdl_string(n)}" for n in names)
+
+
+def _voucher_request(q: str, report: str, period: List[str], ledgers: Sequence[str] = (),
+                     items: Sequence[str] = ()) -> CollectionRequest:
+    tests = _match_phrases(_ORDER_RE.sub(" ", q), VOUCHER_TYPE_PHRASES)
+    if not tests and report == "Sales Register": tests = ["$$IsSales:$VoucherTypeName"]
+    filters, helpers = ["$Date >= ##SVFromDate AND $Date <= ##SVToDate"], {}
+    if tests: filters.append(" OR ".join(tests))
+    # Vouchers with at least one ledger / inventory line for the named masters
+    if ledgers:
+        helpers["TallyAILedgerMatch"] = _names_formula("$LedgerName", ledgers)
+        filters.append("$$FilterCount:AllLedgerEntries:TallyAILedgerMatch > 0")
+    if items:
+        helpers["TallyAIItemMatch"] = _names_formula("$StockItemName", items)
+        filters.append("$$FilterCount:AllInventoryEntries:TallyAIItemMatch > 0")
+
+    types = ", ".join(re.findall(r"\$\$Is(\w+)", " ".join(tests))) or "all types"
+    involving = f" involving {', '.join([*ledgers, *items])}" if ledgers or items else ""
+    return CollectionRequest("Voucher", VOUCHER_FIELDS, report, filters=filters, helpers=helpers,
+                             from_date=_yyyymmdd(period[0]), to_date=_yyyymmdd(period[1]),
+                             description=f"Vouchers ({types}){involving} from {period[0]} to {period[1]}")
+
+
+def plan_pushdown(query: str, report_name: str, today: Optional[date] = None,
+                  resolve: Optional[Callable[[str], List[Dict]]] = None) -> Optional[CollectionRequest]:
+    """
+    A collection request for the question, or None when the full report export is needed.
+    resolve(query) -> masters the question names ([{"name", "kind"}], see entity_index); only called when
+    a plan could use them.
+    """
+    if not TDL_PUSHDOWN or not query: return None
+    report = TALLY_XML_MAP.get(report_name, report_name)
+    q = " ".join(query.lower().split())
+
+    entities = None
+
+    def named(*kinds) -> List[str]:
+        nonlocal entities
+        if entities is None:
+            # A group phrase names the group, not a ledger that happens to share its words ("Capital Account 0")
+            groups = {normalize_name(phrase) for phrase, _ in GROUP_PHRASES}
+            entities = [e for e in (resolve(query) if resolve else None) or []
+                        if normalize_name(e.get("phrase", "")) not in groups]
+        return [e["name"] for e in entities if e["kind"] in kinds]
+
+    if report in LEDGER_SOURCE_REPORTS:
+        period = _period(query, today)
+        from_date, to_date = (_yyyymmdd(d) for d in period) if period else ("", "")
+        groups, rest = _split_phrases(q, GROUP_PHRASES)
+        # "compare current assets with current liabilities": narrowing to the mapped half would drop the other
+        if _UNMAPPED_SECTION_RE.search(rest): return None
+
+        ledgers = named("ledger", "party")
+        if ledgers:
+            return CollectionRequest("Ledger", LEDGER_FIELDS, LEDGER_REPORT, filters=(_names_formula("$Name", ledgers),),
+                                     from_date=from_date, to_date=to_date,
+                                     description=f"Ledger {', '.join(ledgers)}: {', '.join(LEDGER_FIELDS)}")
+
+        if not groups and report in ("Cash/Bank Book", "Group Summary"): groups = list(CASH_BANK_GROUPS)
+        if not groups: return None
+        if len(groups) == 1:
+            child_of, filters = groups[0], ()
+        else:
+            child_of = None
+            filters = (" OR ".join(f"$$IsBelongsTo:{_tdl_string(g)}" for g in groups),)
+        return CollectionRequest("Ledger", LEDGER_FIELDS, LEDGER_REPORT, child_of=child_of, filters=filters,
+                                 from_date=from_date, to_date=to_date,
+                                 description=f"Ledgers under {', '.join(groups)}: {', '.join(LEDGER_FIELDS)}")
+
+    if report in STOCK_SOURCE_REPORTS:
+        items = named("item")
+        if not items: return None
+        period = _period(query, today)
+        if period:
+            # The item's movement: vouchers with an inventory line for it
+            return _voucher_request(q, "Day Book", period, items=items)
+        return CollectionRequest("StockItem", STOCK_ITEM_FIELDS, STOCK_ITEM_REPORT,
+                                 filters=(_names_formula("$Name", items),),
+                                 description=f"Stock item {', '.join(items)}: {', '.join(STOCK_ITEM_FIELDS)}")
+
+    if report in VOUCHER_SOURCE_REPORTS:
+        # Without a period the display report's own default period applies; keep that export
+        period = _period(query, today)
+        if not period: return None
+        return _voucher_request(q, report, period, named("ledger", "party"), named("item"))
+    return None
+
+
+# --- EXPORT ---
+def export_collection(company_name: str, request: CollectionRequest) -> str:
+    """One uncached collection export: the report-shaped JSON text, or an error string."""
+    try:
+        reply = post_xml(company_name, request.to_xml(company_name), f"collection '{request.description}'")
+        if isinstance(reply, str): return reply
+        return json.dumps(request.to_report(reply), ensure_ascii=False)
+    except Exception as e:
+        return f"Error connecting to Tally: {str(e)}"
+
+
+def get_collection(company_name: str, request: CollectionRequest) -> Optional[str]:
+    """Cached collection export (shares the report cache and its AlterID freshness); None if Tally refused it."""
+    key = cache_key(company_name, f"TDL {request.signature()}", request.from_date, request.to_date)
+    payload = get_report_cache().get_or_fetch(key, lambda: export_collection(company_name, request),
+                                              is_report_payload)
+    if not is_report_payload(payload):
+        print(f"⚠️ Pushdown failed ({payload[:120]}); exporting the full report")
+        return None
+    return payload
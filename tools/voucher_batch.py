@@ -0,0 +1,120 @@
+# tools/voucher_batch.py
+"""
+Batched voucher amount extraction for large Day Books.
+
+One pass collects every inventory / ledger AMOUNT into flat arrays (with the
+index of its voucher); amounts are then parsed in bulk with pandas and the
+per-voucher value is computed with NumPy group operations:
+
+- inventory lines: sum of |AMOUNT| per voucher
+- otherwise: |AMOUNT| of the first ledger line that is > 0
+
+This is the same rule (and the same float summation order) as the per-voucher
+loop in TableGenerator._parse_tally_vouchers, so results are identical. The
+Day Book / Sales Register parsers in report_parsers use it for their Amount column.
+"""
+from typing import Callable, List, Optional
+
+import numpy as np
+import pandas as pd
+
+
+def legacy_float(value) -> Optional[float]:
+    """What the per-voucher loop accepts: float(str(AMOUNT).replace(',', '')), or None if that raises."""
+    try: return float(str(value).replace(",", ""))
+    except (TypeError, ValueError): return None
+
+
+def _flatten(vouchers: List[dict]):
+    """-> (inv_idx, inv_raw, led_idx, led_raw). Raw values are the untouched AMOUNT fields."""
+    inv_idx, inv_raw, led_idx, led_raw = [], [], [], []
+    add_inv_idx, add_inv_raw = inv_idx.append, inv_raw.append
+    add_led_idx, add_led_raw = led_idx.append, led_raw.append
+
+    for i, v in enumerate(vouchers):
+        # A single entry is a dict (even an empty one counts as "has inventory", as in the loop)
+        entries = v.get("ALLINVENTORYENTRIES.LIST")
+        if isinstance(entries, dict):
+            add_inv_idx(i); add_inv_raw(entries.get("AMOUNT", 0))
+            continue
+        if entries:
+            for item in entries:
+                if isinstance(item, dict):
+                    add_inv_idx(i); add_inv_raw(item.get("AMOUNT", 0))
+            continue
+
+        entries = v.get("ALLLEDGERENTRIES.LIST")
+        if isinstance(entries, dict):
+            add_led_idx(i); add_led_raw(entries.get("AMOUNT", 0))
+        elif entries:
+            for item in entries:
+                if isinstance(item, dict):
+                    add_led_idx(i); add_led_raw(item.get("AMOUNT", 0))
+
+    return inv_idx, inv_raw, led_idx, led_raw
+
+
+def parse_amounts(raw: list, fallback: Callable = legacy_float):
+    """
+    Bulk-parses raw AMOUNT values. Returns (values, ok): a float64 array and a mask
+    of values that parsed. Clean exports convert in one NumPy call; otherwise
+    pd.to_numeric reads what it can and the rest (commas, units, 'Dr'/'Cr', dicts,
+    'nan') goes to `fallback` one by one.
+    """
+    if not raw: return np.empty(0), np.zeros(0, dtype=bool)
+    column = np.array(raw, dtype=object)
+
+    # NumPy/pandas read True/False as 1/0; the per-voucher loop rejects them.
+    # (A C-speed membership test: ints 0/1 also match and just take the slower, still exact path.)
+    has_bool = True in raw or False in raw
+
+    values = None
+    if not has_bool:
+        try:
+            # float() per element in C: same rules as the loop, except commas (which raise here)
+            values = column.astype(np.float64)
+        except (TypeError, ValueError):
+            pass
+    if values is None:
+        values = pd.to_numeric(column, errors="coerce").astype(np.float64)
+
+    # NaN / inf are left to the fallback, which decides whether it accepts them
+    ok = np.isfinite(values)
+    if has_bool:
+        for i, v in enumerate(raw):
+            if v is True or v is False: ok[i] = False
+
+    # Residue: strings NumPy/pandas couldn't read, 'nan' / 'inf', non-numeric objects
+    for i in np.flatnonzero(~ok).tolist():
+        parsed = fallback(raw[i])
+        if parsed is not None:
+            values[i] = parsed
+            ok[i] = True
+        else:
+            values[i] = np.nan
+    return values, ok
+
+
+def voucher_amounts(vouchers: List[dict], fallback: Callable = legacy_float) -> np.ndarray:
+    """Per-voucher amount (float64), one entry per voucher in `vouchers`."""
+    n = len(vouchers)
+    inv_idx, inv_raw, led_idx, led_raw = _flatten(vouchers)
+    amounts = np.zeros(n)
+
+    # Inventory: sum |AMOUNT| in document order (bincount adds sequentially, like +=)
+    inv_vals, inv_ok = parse_amounts(inv_raw, fallback)
+    if inv_ok.any():
+        idx = np.asarray(inv_idx)[inv_ok]
+        amounts += np.bincount(idx, weights=np.abs(inv_vals[inv_ok]), minlength=n)
+
+    # Ledger: first |AMOUNT| > 0 per voucher (NaN compares False, as in the loop)
+    led_vals, led_ok = parse_amounts(led_raw, fallback)
+    if led_ok.any():
+        led_abs = np.abs(led_vals)
+        positive = led_ok & (led_abs > 0)
+        idx = np.asarray(led_idx)[positive]
+        first_idx, first_pos = np.unique(idx, return_index=True)
+        amounts[first_idx] = led_abs[positive][first_pos]
+
+    return amounts
+
@@ -1,25 +1,37 @@
 # vector_store.py
-import chromadb
-from chromadb.utils import embedding_functions
+import threading
 
-# Initialize Local Vector DB
-CHROMA_CLIENT = chromadb.PersistentClient(path="./tally_chroma_db")
+COLLECTION_NAME = "tally_reports"
 
-# Use a free, lightweight embedding model (runs locally, no API cost)
-EMBED_FN = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+# Chroma + sentence-transformers take seconds to load, so the client is created on first lookup
+_CLIENT = None
+_EMBED_FN = None
+_LOCK = threading.Lock()
 
-COLLECTION_NAME = "tally_reports"
+def _client():
+    """Local Vector DB and its embedding model, created once."""
+    global _CLIENT, _EMBED_FN
+    with _LOCK:
+        if _CLIENT is None:
+            import chromadb
+            from chromadb.utils import embedding_functions
+            _CLIENT = chromadb.PersistentClient(path="./tally_chroma_db")
+            # Use a free, lightweight embedding model (runs locally, no API cost)
+            _EMBED_FN = embedding_functions.SentenceTransformerEmbeddingFunction(model_name="all-MiniLM-L6-v2")
+        return _CLIENT, _EMBED_FN
 
 def setup_vector_db():
     """
     Populates the database with Tally Report descriptions.
     Run this ONCE or whenever you add new reports.
     """
+    client, embed_fn = _client()
+
     # Delete old collection if exists to ensure fresh start
-    try: CHROMA_CLIENT.delete_collection(COLLECTION_NAME)
+    try: client.delete_collection(COLLECTION_NAME)
     except: pass
 
-    collection = CHROMA_CLIENT.create_collection(name=COLLECTION_NAME, embedding_function=EMBED_FN)
+    collection = client.create_collection(name=COLLECTION_NAME, embedding_function=embed_fn)
 
     # --- THE KNOWLEDGE BASE ---
     # We map semantic descriptions to the EXACT internal Tally name.
@@ -78,7 +90,8 @@ def get_best_report(query: str):
     Queries the vector DB to find the single best matching report.
     Returns the EXACT Tally XML name.
     """
-    collection = CHROMA_CLIENT.get_or_create_collection(name=COLLECTION_NAME, embedding_function=EMBED_FN)
+    client, embed_fn = _client()
+    collection = client.get_or_create_collection(name=COLLECTION_NAME, embedding_function=embed_fn)
     
     results = collection.query(
         query_texts=[query],